@@ -0,0 +1,73 @@
+"""Benchmark cash-flow classification and the bulk reclassify at scale.
+
+Compares the row-wise classify_cashflow with the vectorised classify_cashflows, then times
+reclassify_cashflow over a throwaway database (never db/moomoo_portfolio.db).
+Run from the project root:  python -m benchmarks.bench_cashflow [--rows 1000000]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import settings
+from source import db, nav
+from source.cleanup import classify_cashflow, classify_cashflows
+
+TYPES = ["Cash Dividend", "Dividend Tax", "Coupon", "Bank Transfer Deposits", "Money Transfers",
+         "Currency Exchange", "Others", "Others", "Others"]
+REMARKS = ["V 8 SHARES DIVIDENDS 0.67 USD PER SHARE", "WITHHOLDING TAX", "Cash Voucher", "",
+           "PAYNOW2409040852519986389420240904085252", "Fund Subscription#CSOP USD Money Market Fund",
+           "Coupon Deposit", "ADR FEE", None]
+
+
+def synthetic_cashflow(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2000-01-03", periods=max(rows // 50, 1)).strftime("%Y-%m-%d")
+    return pd.DataFrame({
+        "cashflow_id": [f"cf{i}" for i in range(rows)],
+        "Date": dates[rng.integers(0, len(dates), rows)],
+        "Currency": "SGD",
+        "Type": np.array(TYPES, dtype=object)[rng.integers(0, len(TYPES), rows)],
+        "Remark": np.array(REMARKS, dtype=object)[rng.integers(0, len(REMARKS), rows)],
+        "Amount": rng.uniform(-1_000, 1_000, rows).round(2),
+        # Stale flags everywhere, so the reclassify has real work to do
+        "is_external": 1,
+        "is_income": 0,
+    })
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def run(rows: int):
+    cashflow = synthetic_cashflow(rows)
+    row_ms = _timed(lambda: [classify_cashflow(t, r) for t, r in zip(cashflow["Type"], cashflow["Remark"])])
+    vec_ms = _timed(classify_cashflows, cashflow["Type"], cashflow["Remark"])
+    print(f"{rows:,} rows")
+    print(f"  classify_cashflow per row : {row_ms:>10.1f} ms")
+    print(f"  classify_cashflows        : {vec_ms:>10.1f} ms  ({row_ms / vec_ms:.1f}x)")
+    nav.recompute_nav = lambda *a, **k: 0  # the NAV rebuild has its own benchmark (bench_nav)
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.MOOMOO_PORTFOLIO_DB_PATH = Path(tmp) / "bench.db"
+        db.init_db()
+        db.insert_dataframe(cashflow, "cashflow")
+        first_ms = _timed(db.reclassify_cashflow)
+        again_ms = _timed(db.reclassify_cashflow)
+        db.close_connections()
+    print(f"  reclassify_cashflow       : {first_ms:>10.1f} ms (all stale), {again_ms:.1f} ms (up to date)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    run(parser.parse_args().rows)
+
+
+if __name__ == "__main__":
+    main()
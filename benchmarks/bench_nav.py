@@ -0,0 +1,60 @@
+"""Benchmark the NAV engine: the vectorised pass alone, and a full recompute_nav from the db.
+
+Uses a throwaway database with the real schema, never db/moomoo_portfolio.db.
+Run from the project root:  python -m benchmarks.bench_nav [--years 10 30]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import settings
+from source import db, fx, nav
+
+
+def synthetic_history(years: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2000-01-03", periods=years * 252)
+    flows = np.where(rng.random(len(dates)) < 0.02, rng.uniform(-5_000, 20_000, len(dates)), 0.0)
+    total_assets = 100_000 * np.cumprod(1 + rng.normal(0.0003, 0.01, len(dates))) + np.cumsum(flows)
+    snapshots = pd.DataFrame({"date": dates.strftime("%Y-%m-%d"), "total_assets": total_assets.round(2)})
+    cashflow = pd.DataFrame({"cashflow_id": [f"cf{i}" for i in np.flatnonzero(flows)],
+                             "Date": dates[flows != 0].strftime("%Y-%m-%d"), "Currency": "SGD",
+                             "Amount": flows[flows != 0].round(2), "is_external": 1, "is_income": 0})
+    return snapshots, cashflow
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def run(year_counts):
+    fx.backfill_fx_rates = lambda *a, **k: 0  # SGD-only flows; never touch the network
+    print(f"{'years':>5} | {'snapshots':>9} | {'nav_units (ms)':>14} | {'recompute_nav (ms)':>18}")
+    for years in year_counts:
+        snapshots, cashflow = synthetic_history(years)
+        flows = np.zeros(len(snapshots))
+        pure_ms = _timed(nav.nav_units, snapshots["total_assets"].to_numpy(), flows)
+        with tempfile.TemporaryDirectory() as tmp:
+            settings.MOOMOO_PORTFOLIO_DB_PATH = Path(tmp) / "bench.db"
+            db.init_db()
+            db.insert_dataframe(snapshots, "portfolio_snapshots")
+            db.insert_dataframe(cashflow, "cashflow")
+            full_ms = _timed(nav.recompute_nav)
+            db.close_connections()
+        print(f"{years:>5} | {len(snapshots):>9} | {pure_ms:>14.2f} | {full_ms:>18.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[10, 30])
+    run(parser.parse_args().years)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Offline benchmark of every pipeline stage, against stored baselines.
+
+A SyntheticPortfolio is loaded into a throwaway database (never db/moomoo_portfolio.db) and
+each scenario is timed with OpenD and yfinance replaced by the fakes in benchmarks/fakes.py,
+so the numbers are reproducible on any machine without a broker or network. Results are
+compared with benchmarks/baselines.json: a scenario slower than --tolerance times its
+baseline is reported as a regression (exit code 1). Baselines are machine-specific; refresh
+them with --save on the machine that runs the comparison.
+
+Run from the project root:
+    python -m benchmarks.bench_pipeline                  # run and compare
+    python -m benchmarks.bench_pipeline --save           # run and store as the new baseline
+    python -m benchmarks.bench_pipeline --scenario net_p_l display_pos --years 10
+"""
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.fakes import offline
+from benchmarks.synthetic import SyntheticPortfolio
+from config import settings
+from source import cleanup, dashboard, db, moomoo_api, nav, table_cache
+
+BASELINES_PATH = Path(__file__).with_name("baselines.json")
+
+
+def load_history(portfolio: SyntheticPortfolio):
+    """Store the portfolio's history as if the pipeline had been running all along."""
+    db.init_db()
+    latest = portfolio.dates[-1].strftime("%Y-%m-%d")
+    acc_info = cleanup.cleanup_acc_info(portfolio.acc_info)
+    positions = cleanup.cleanup_positions(portfolio.positions)
+    cleanup.update_portfolio_percentage(positions, cleanup.get_total_assets(acc_info))
+    with db.transaction():
+        db.insert_dataframe(portfolio.snapshots, "portfolio_snapshots")
+        db.insert_dataframe(cleanup.positions_table(positions, latest), "positions")
+        db.insert_dataframe(cleanup.cleanup_historical_orders(portfolio.orders), "historical_orders")
+        db.insert_dataframe(cleanup.cleanup_cashflow(portfolio.cashflow), "cashflow")
+    db.sync_transactions()
+    db.update_benchmarks(today_date=portfolio.end)
+    nav.recompute_nav()
+
+
+def _today(portfolio) -> datetime:
+    return portfolio.end.to_pydatetime()
+
+
+def _upload(portfolio, ctx):
+    import main  # imported late: main pulls in the plotting stack
+    main.upload_to_db(_today(portfolio), portfolio.start.to_pydatetime(), keep_opend_alive=False)
+
+
+def _cleanup(portfolio, ctx):
+    cleanup.cleanup_cashflow(portfolio.cashflow)
+    cleanup.cleanup_historical_orders(portfolio.orders)
+    acc_info = cleanup.cleanup_acc_info(portfolio.acc_info)
+    positions = cleanup.cleanup_positions(portfolio.positions)
+    cleanup.update_portfolio_percentage(positions, cleanup.get_total_assets(acc_info))
+
+
+def _display_pos(portfolio, ctx):
+    positions = db.read_db("SELECT * FROM positions WHERE date = (SELECT MAX(date) FROM positions)")
+    dashboard.display_pos(positions)
+
+
+def _comparison(portfolio, ctx):
+    snapshots = table_cache.read_table("portfolio_snapshots")
+    dashboard.comparison_percent(dashboard.comparison_df(snapshots))
+
+
+# name -> fn(portfolio, fake trade context); every scenario runs against the loaded history
+SCENARIOS = {
+    "account_cashflow": lambda p, ctx: moomoo_api.account_cashflow(ctx, _today(p), p.start.to_pydatetime()),
+    "historical_orders": lambda p, ctx: moomoo_api.get_historical_orders(ctx, start=p.start.to_pydatetime()),
+    "cleanup": _cleanup,
+    "sync_transactions": lambda p, ctx: db.sync_transactions(full=True),
+    "net_p_l": lambda p, ctx: db.net_p_l(_today(p)),
+    "net_p_l_full": lambda p, ctx: db.net_p_l_full(_today(p)),
+    "recompute_nav": lambda p, ctx: nav.recompute_nav(),
+    "display_pos": _display_pos,
+    "comparison_df": _comparison,
+    "upload_to_db": _upload,
+}
+
+
+def time_scenario(fn, repeat: int) -> dict:
+    """One warm-up call, then `repeat` timed calls (seconds)."""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {"min_s": min(samples), "median_s": statistics.median(samples)}
+
+
+def run(params: dict, names, repeat: int, quiet: bool = True) -> dict:
+    portfolio = SyntheticPortfolio(**params)
+    results = {}
+    # The pipeline logs to stdout; keep the benchmark table readable
+    output = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+    real_db = settings.MOOMOO_PORTFOLIO_DB_PATH
+    with tempfile.TemporaryDirectory() as tmp, offline(portfolio) as (ctx, _), output:
+        settings.MOOMOO_PORTFOLIO_DB_PATH = Path(tmp) / "bench.db"
+        try:
+            load_history(portfolio)
+            for name in names:
+                try:
+                    results[name] = time_scenario(lambda: SCENARIOS[name](portfolio, ctx), repeat)
+                except ImportError as e:
+                    results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+        finally:
+            db.close_connections()
+            settings.MOOMOO_PORTFOLIO_DB_PATH = real_db
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Print one line per scenario; returns the names that regressed."""
+    regressions = []
+    print(f"{'scenario':<18} | {'median (ms)':>11} | {'min (ms)':>9} | {'baseline (ms)':>13} | {'ratio':>6}")
+    for name, result in results.items():
+        if "skipped" in result:
+            print(f"{name:<18} | skipped ({result['skipped']})")
+            continue
+        base = baseline.get(name, {}).get("median_s")
+        ratio = result["median_s"] / base if base else None
+        flag = ""
+        if ratio is not None and ratio > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<18} | {result['median_s'] * 1000:>11.1f} | {result['min_s'] * 1000:>9.1f} | "
+              f"{base * 1000 if base else float('nan'):>13.1f} | {ratio if ratio else float('nan'):>6.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--symbols", type=int, default=40)
+    parser.add_argument("--orders", type=int, default=5_000)
+    parser.add_argument("--cashflows", type=int, default=2_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Slowdown ratio that counts as a regression.")
+    parser.add_argument("--save", action="store_true", help="Store these results as the baseline.")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output.")
+    args = parser.parse_args(argv)
+
+    # Anchored to a fixed date so every run sees the same history
+    params = {"years": args.years, "symbols": args.symbols, "orders": args.orders,
+              "cashflows": args.cashflows, "end": "2026-06-01"}
+    results = run(params, args.scenario, args.repeat, quiet=not args.verbose)
+
+    stored = json.loads(BASELINES_PATH.read_text()) if BASELINES_PATH.exists() else {}
+    baseline = stored.get("scenarios", {}) if stored.get("params") == params else {}
+    if stored and not baseline:
+        print("Baseline was recorded with different parameters; not comparing.")
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save:
+        scenarios = {**baseline, **{k: v for k, v in results.items() if "skipped" not in v}}
+        BASELINES_PATH.write_text(json.dumps({"params": params, "scenarios": scenarios}, indent=2) + "\n")
+        print(f"Baseline saved to {BASELINES_PATH}")
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
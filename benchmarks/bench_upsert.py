@@ -0,0 +1,75 @@
+"""Benchmark db.insert_dataframe (executemany upsert) against the old temp_staging path.
+
+Uses a throwaway database with the real schema, never db/moomoo_portfolio.db.
+Run from the project root:  python -m benchmarks.bench_upsert [--rows 10000 100000 1000000]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import settings
+from source import db
+
+
+def legacy_insert_dataframe(df: pd.DataFrame, table_name: str):
+    """The previous implementation: to_sql into a staging table, INSERT OR REPLACE, DROP."""
+    with db.db_contextmanager() as conn:
+        df.to_sql('temp_staging', conn, if_exists='replace', index=False)
+        cols = ",".join(df.columns)
+        conn.execute(f"""
+            INSERT OR REPLACE INTO {table_name} ({cols})
+            SELECT {cols} FROM temp_staging
+        """)
+        conn.execute("DROP TABLE temp_staging")
+
+
+def synthetic_orders(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    symbols = np.array(["AAPL", "AMZN", "NVDA", "SOFI", "NVDA270115C230000", "AMZN260918C195000"])
+    times = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 6 * 365 * 86400, n), unit="s")
+    return pd.DataFrame({
+        "Symbol": symbols[rng.integers(0, len(symbols), n)],
+        "Name": "Synthetic",
+        "Market": "US",
+        "Buy_Sell": np.where(rng.random(n) < 0.5, "BUY", "SELL"),
+        "Quantity": rng.integers(1, 500, n).astype(float),
+        "Order_ID": np.char.add("ORD", np.arange(n).astype(str)),
+        "Current_Price": rng.uniform(1, 500, n).round(2),
+        "Currency": "USD",
+        "date_time": times.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def run(sizes):
+    print(f"{'rows':>9} | {'path':<10} | {'insert (s)':>10} | {'re-upsert (s)':>13}")
+    for n in sizes:
+        df = synthetic_orders(n)
+        for name, fn in (("legacy", legacy_insert_dataframe), ("upsert", db.insert_dataframe)):
+            with tempfile.TemporaryDirectory() as tmp:
+                settings.MOOMOO_PORTFOLIO_DB_PATH = Path(tmp) / "bench.db"
+                db.init_db()
+                insert_s, _ = _timed(fn, df, "historical_orders")
+                update_s, counts = _timed(fn, df, "historical_orders")
+                db.close_connections()
+            note = f"  (inserted, updated) = {counts}" if counts else ""
+            print(f"{n:>9} | {name:<10} | {insert_s:>10.3f} | {update_s:>13.3f}{note}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    run(parser.parse_args().rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Offline stand-ins for OpenD and yfinance, serving a SyntheticPortfolio.
+
+    portfolio = SyntheticPortfolio(years=5)
+    with offline(portfolio):
+        main.upload_to_db(...)      # no broker, no network
+
+FakeTradeContext answers the OpenSecTradeContext queries the pipeline makes; FakeYFinance
+replaces yf.download / yf.Ticker. offline() patches both in for the duration of a block,
+and swaps the OpenD quota scheduler for an unthrottled one (the quotas are server-side).
+"""
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+
+import moomoo
+import pandas as pd
+import yfinance
+
+from source import fx, moomoo_api
+from source.rate_limit import RateLimiter
+
+
+class FakeTradeContext:
+    """The OpenSecTradeContext queries used by source/moomoo_api.py, as (ret, data) tuples."""
+
+    def __init__(self, portfolio):
+        self.portfolio = portfolio
+        self.calls = {}
+        self._cashflow_by_date = {day: rows.reset_index(drop=True)
+                                  for day, rows in portfolio.cashflow.groupby('clearing_date')}
+        self._order_times = pd.to_datetime(portfolio.orders['updated_time'])
+
+    def _ok(self, endpoint, data):
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        return moomoo.RET_OK, data
+
+    def get_acc_list(self):
+        return self._ok('get_acc_list', pd.DataFrame({'acc_id': [1], 'trd_env': ['REAL']}))
+
+    def accinfo_query(self, **kwargs):
+        return self._ok('accinfo_query', self.portfolio.acc_info.copy())
+
+    def position_list_query(self, **kwargs):
+        return self._ok('position_list_query', self.portfolio.positions.copy())
+
+    def get_acc_cash_flow(self, clearing_date, **kwargs):
+        empty = self.portfolio.cashflow.iloc[:0]
+        return self._ok('get_acc_cash_flow', self._cashflow_by_date.get(clearing_date, empty).copy())
+
+    def history_order_list_query(self, start=None, end=None, **kwargs):
+        mask = pd.Series(True, index=self._order_times.index)
+        if start:
+            mask &= self._order_times >= pd.Timestamp(start)
+        if end:
+            mask &= self._order_times <= pd.Timestamp(end)
+        return self._ok('history_order_list_query', self.portfolio.orders[mask].reset_index(drop=True))
+
+    def close(self):
+        pass
+
+
+class FakeTicker:
+    def __init__(self, portfolio, ticker: str):
+        self.ticker = ticker
+        self.info = portfolio.info(ticker)
+        close = portfolio.bars([ticker])['Close'][ticker]
+        self.fast_info = {'last_price': float(close.iloc[-1])}
+
+
+class FakeYFinance:
+    """yf.download and yf.Ticker over the portfolio's synthetic bars."""
+
+    def __init__(self, portfolio):
+        self.portfolio = portfolio
+        self.downloads = 0
+
+    def download(self, tickers=None, start=None, end=None, period=None, multi_level_index=True, **kwargs):
+        self.downloads += 1
+        single = isinstance(tickers, str)
+        data = self.portfolio.bars([tickers] if single else list(tickers), start=start, end=end)
+        if period and period != 'max' and not start:
+            data = data.tail(int(period.rstrip('d')) if period.endswith('d') else len(data))
+        if single and not multi_level_index:
+            data.columns = data.columns.droplevel('Ticker')
+        return data
+
+    def Ticker(self, ticker: str):
+        return FakeTicker(self.portfolio, ticker)
+
+
+@contextmanager
+def offline(portfolio):
+    """Route every OpenD and yfinance call to fakes serving `portfolio`. Yields (ctx, yf)."""
+    ctx = FakeTradeContext(portfolio)
+    yf = FakeYFinance(portfolio)
+    with ExitStack() as stack:
+        for name, value in [('download', yf.download), ('Ticker', yf.Ticker)]:
+            stack.enter_context(mock.patch.object(yfinance, name, value))
+        for name, value in [('configure_moomoo_api', lambda: ctx), ('ensure_opend_is_ready', lambda: True),
+                            ('stop_opend', lambda: None), ('opend_limiter', RateLimiter({}))]:
+            stack.enter_context(mock.patch.object(moomoo_api, name, value))
+        stack.enter_context(mock.patch.object(moomoo_api.supervisor, '_connect', lambda: ctx))
+        stack.enter_context(mock.patch.object(moomoo_api.supervisor, '_ready', lambda: True))
+        fx.get_exchange_rate.cache_clear()
+        yield ctx, yf
+        moomoo_api.supervisor.invalidate()
+    fx.get_exchange_rate.cache_clear()
@@ -0,0 +1,173 @@
+"""Synthetic portfolio generator for the offline benchmarks.
+
+SyntheticPortfolio builds, from a seed, everything the pipeline reads from the outside world,
+in the raw shapes OpenD and yfinance return: account info, positions (stocks and OCC-style
+options such as NVDA270115C230000), cash flow per clearing date, historical orders, and daily
+bars for the benchmark indices and FX pairs. It also carries the derived history (daily
+snapshots) that would otherwise take years of live runs to accumulate.
+"""
+import numpy as np
+import pandas as pd
+
+from source.cleanup import EXTERNAL_CASHFLOW_TYPES, INCOME_CASHFLOW_TYPES
+
+CASHFLOW_TYPES = sorted(EXTERNAL_CASHFLOW_TYPES) + sorted(INCOME_CASHFLOW_TYPES) + ['Others', 'Currency Exchange']
+CASHFLOW_REMARKS = ['PAYNOW2409040852519986389420240904085252', 'Coupon Deposit', 'V 8 SHARES DIVIDENDS 0.67 USD',
+                    'Fund Subscription#CSOP USD Money Market Fund', 'WITHHOLDING TAX', '']
+ORDER_SIDES = ['BUY', 'SELL', 'SELL_SHORT', 'BUY_BACK']
+
+
+class SyntheticPortfolio:
+    """`years` of daily history, `symbols` instruments (about a third options), `orders`
+    filled orders and `cashflows` cash-flow rows, all reproducible from `seed`."""
+
+    def __init__(self, years: int = 5, symbols: int = 40, orders: int = 5_000, cashflows: int = 2_000,
+                 seed: int = 0, end: str = None):
+        self.rng = np.random.default_rng(seed)
+        self.end = pd.Timestamp(end or pd.Timestamp.today()).normalize()
+        self.dates = pd.bdate_range(end=self.end - pd.offsets.BDay(1), periods=years * 252)
+        self.start = self.dates[0]
+        self.symbols = self._symbols(symbols)
+        self.positions = self._positions()
+        self.acc_info = self._acc_info()
+        self.cashflow = self._cashflow(cashflows)
+        self.orders = self._orders(orders)
+        self.snapshots = self._snapshots()
+
+    # --- Instruments ---
+    def _symbols(self, n: int) -> pd.DataFrame:
+        n_options = n // 3
+        stocks = [_ticker(i) for i in range(n - n_options)]
+        underlyings = self.rng.choice(stocks, n_options)
+        expiries = (self.end + pd.to_timedelta(self.rng.integers(7, 720, n_options), unit='D')).strftime('%y%m%d')
+        strikes = self.rng.integers(5, 500, n_options) * 1000
+        sides = self.rng.choice(['C', 'P'], n_options)
+        options = [f"{u}{e}{s}{k}" for u, e, s, k in zip(underlyings, expiries, sides, strikes)]
+        codes = stocks + options
+        markets = self.rng.choice(['US', 'SG'], len(codes), p=[0.8, 0.2])
+        return pd.DataFrame({
+            'Symbol': codes,
+            'Market': markets,
+            'Currency': np.where(markets == 'US', 'USD', 'SGD'),
+            'Price': self.rng.uniform(1, 400, len(codes)).round(2),
+        })
+
+    # --- OpenD responses ---
+    def _positions(self) -> pd.DataFrame:
+        sym = self.symbols
+        qty = self.rng.integers(1, 300, len(sym)).astype(float)
+        cost = (sym['Price'] * self.rng.uniform(0.6, 1.4, len(sym))).round(2)
+        market_val = (qty * sym['Price']).round(2)
+        pl_val = (market_val - qty * cost).round(2)
+        return pd.DataFrame({
+            'code': sym['Market'] + '.' + sym['Symbol'],
+            'stock_name': 'Synthetic ' + sym['Symbol'],
+            'position_market': sym['Market'],
+            'qty': qty,
+            'diluted_cost': cost,
+            'market_val': market_val,
+            'nominal_price': sym['Price'],
+            'pl_ratio': (pl_val / (qty * cost) * 100).round(2),
+            'pl_val': pl_val,
+            'today_pl_val': (market_val * self.rng.normal(0, 0.01, len(sym))).round(2),
+            'currency': sym['Currency'],
+        })
+
+    def _acc_info(self) -> pd.DataFrame:
+        securities = float(self.positions['market_val'].sum())
+        cash = round(securities * 0.1, 2)
+        row = dict.fromkeys(['fund_assets', 'bond_assets', 'pending_asset', 'frozen_cash', 'risk_status',
+                             'us_avl_withdrawal_cash', 'usd_net_cash_power', 'usd_assets', 'sg_avl_withdrawal_cash',
+                             'sgd_net_cash_power', 'sgd_assets'], 0.0)
+        row.update(total_assets=securities + cash, securities_assets=securities + cash, cash=cash,
+                   avl_withdrawal_cash=cash, us_cash=cash, sg_cash=0.0)
+        return pd.DataFrame([row])
+
+    def _cashflow(self, n: int) -> pd.DataFrame:
+        days = self.dates[self.rng.integers(0, len(self.dates), n)]
+        amounts = self.rng.uniform(-2_000, 5_000, n).round(2)
+        return pd.DataFrame({
+            'cashflow_id': np.char.add('CF', np.arange(n).astype(str)),
+            'clearing_date': days.strftime('%Y-%m-%d'),
+            'currency': self.rng.choice(['USD', 'SGD'], n),
+            'cashflow_type': self.rng.choice(CASHFLOW_TYPES, n),
+            'cashflow_direction': np.where(amounts >= 0, 'IN', 'OUT'),
+            'cashflow_amount': amounts,
+            'cashflow_remark': self.rng.choice(CASHFLOW_REMARKS, n),
+        }).sort_values('clearing_date', ignore_index=True)
+
+    def _orders(self, n: int) -> pd.DataFrame:
+        pick = self.rng.integers(0, len(self.symbols), n)
+        sym = self.symbols.iloc[pick].reset_index(drop=True)
+        seconds = self.rng.integers(0, len(self.dates) * 86400, n)
+        times = (self.start + pd.to_timedelta(seconds, unit='s')).strftime('%Y-%m-%d %H:%M:%S')
+        return pd.DataFrame({
+            'code': sym['Market'] + '.' + sym['Symbol'],
+            'stock_name': 'Synthetic ' + sym['Symbol'],
+            'order_market': sym['Market'],
+            'trd_side': self.rng.choice(ORDER_SIDES, n),
+            'order_id': np.char.add('ORD', np.arange(n).astype(str)),
+            'qty': self.rng.integers(1, 100, n).astype(float),
+            'price': (sym['Price'] * self.rng.uniform(0.7, 1.3, n)).round(2),
+            'currency': sym['Currency'],
+            'updated_time': times,
+            'order_status': np.where(self.rng.random(n) < 0.9, 'FILLED_ALL', 'CANCELLED_ALL'),
+        }).sort_values('updated_time', ignore_index=True)
+
+    # --- Stored history ---
+    def _snapshots(self) -> pd.DataFrame:
+        total = 100_000 * np.cumprod(1 + self.rng.normal(0.0003, 0.01, len(self.dates)))
+        stocks = total * 0.7
+        options = total * 0.1
+        return pd.DataFrame({
+            'date': self.dates.strftime('%Y-%m-%d'),
+            'total_assets': total.round(2),
+            'stocks': stocks.round(2),
+            'options': options.round(2),
+            'cash': (total - stocks - options).round(2),
+        })
+
+    # --- yfinance responses ---
+    def bars(self, tickers, start=None, end=None) -> pd.DataFrame:
+        """Daily OHLCV bars for tickers, as yf.download returns them: (Price, Ticker) columns.
+
+        Every ticker has one fixed random walk from a year before the portfolio starts, so
+        any start/end window of it is consistent with the others.
+        """
+        full = pd.bdate_range(self.start - pd.DateOffset(years=1), self.end)
+        dates = full
+        if start:
+            dates = dates[dates >= pd.Timestamp(start)]
+        if end:
+            dates = dates[dates < pd.Timestamp(end)]
+        frames = {}
+        for ticker in tickers:
+            walk = 100 * np.cumprod(1 + np.random.default_rng(_seed(ticker)).normal(0.0002, 0.01, len(full)))
+            if ticker.endswith('=X'):
+                walk = 1.3 + (walk - 100) / 1000  # FX pairs hover around USDSGD
+            close = pd.Series(walk, index=full).reindex(dates)
+            frames.update({('Close', ticker): close, ('High', ticker): close * 1.01,
+                           ('Low', ticker): close * 0.99, ('Open', ticker): close,
+                           ('Volume', ticker): pd.Series(1e6, index=dates)})
+        data = pd.DataFrame(frames, index=pd.DatetimeIndex(dates, name='Date'))
+        data.columns = pd.MultiIndex.from_tuples(data.columns, names=['Price', 'Ticker'])
+        return data
+
+    def info(self, ticker: str) -> dict:
+        """Ticker.info fields that source/metadata.py reads."""
+        seed = _seed(ticker)
+        return {'sector': ['Technology', 'Financials', 'Energy'][seed % 3], 'industry': 'Synthetic',
+                'country': ['United States', 'Singapore'][seed % 2], 'marketCap': float(seed * 1e8)}
+
+
+def _ticker(i: int) -> str:
+    """0 -> 'AAA', 1 -> 'AAB', ...: unique, purely alphabetic stock tickers."""
+    letters = ''
+    for _ in range(3):
+        i, r = divmod(i, 26)
+        letters = chr(ord('A') + r) + letters
+    return letters
+
+
+def _seed(ticker: str) -> int:
+    return sum(ord(ch) * 31 ** k for k, ch in enumerate(ticker)) % 2 ** 32
@@ -20,6 +20,19 @@ if _SECRET_ENV.exists():
 
 START_DATE = datetime.strptime(os.getenv("START_DATE", "2024-01-01"), "%Y-%m-%d")
 
+# --- Cashflow sync ---
+# Clearing dates older than this many days are treated as settled (final) and never re-fetched
+CASHFLOW_FINAL_AFTER_DAYS = int(os.getenv("CASHFLOW_FINAL_AFTER_DAYS", "3"))
+# Number of clearing dates fetched and committed per batch, so an interrupted backfill resumes
+CASHFLOW_SYNC_BATCH = 20
+# --- Historical order sync ---
+# Incremental syncs re-query from the newest stored order minus this overlap (catches late fills
+# and amended orders), and split long ranges into windows of at most ORDER_SYNC_WINDOW_DAYS
+ORDER_SYNC_OVERLAP_DAYS = 7
+ORDER_SYNC_WINDOW_DAYS = 90
+# Extra non-settlement days (YYYY-MM-DD, comma separated) on top of weekends
+SETTLEMENT_HOLIDAYS = [d.strip() for d in os.getenv("SETTLEMENT_HOLIDAYS", "").split(",") if d.strip()]
+
 # root directory of the project
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -33,9 +46,66 @@ MOOMOO_PORTFOLIO_DB_NAME = "moomoo_portfolio.db"
 # Full path to your moomoo portfolio database file
 MOOMOO_PORTFOLIO_DB_PATH = DB_DIR / MOOMOO_PORTFOLIO_DB_NAME
 
+# --- Pipeline metrics (see source/metrics.py) ---
+# Spans older than this are pruned from pipeline_metrics
+METRICS_RETENTION_DAYS = 14
+# "cprofile" or "pyinstrument" to profile every pipeline run (main.py --profile does it for one run)
+PROFILE_MODE = os.getenv("PROFILE_MODE", "")
+PROFILE_DIR = BASE_DIR / 'profiles'
+
+# --- SQLite Configuration ---
+# Applied once per connection when it is opened (connections are long-lived, see db.get_connection)
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",     # safe with WAL, avoids an fsync on every commit
+    "cache_size": -64000,        # negative = KiB, i.e. ~64 MB page cache
+    "mmap_size": 268435456,      # 256 MB memory-mapped I/O
+    "temp_store": "MEMORY",
+}
+
+# --- Live refresh tiers (seconds) ---
+REFRESH_FAST_SECONDS = 10        # account value + positions
+REFRESH_MEDIUM_SECONDS = 300     # orders, cash flow, ledger, net P/L
+REFRESH_SLOW_SECONDS = 86400     # benchmark indices, security metadata
+
+# --- FX ---
+# Stored rates older than this (relative to the date being converted) are flagged as stale
+FX_STALE_AFTER_DAYS = 4
+
+# --- Security metadata (sector/industry/country/market cap from yfinance) ---
+METADATA_TTL_DAYS = 30
+# A ticker yfinance could not answer for is retried after this long, not on every refresh
+METADATA_RETRY_HOURS = 6
+METADATA_WORKERS = 8
+
 # --- OpenD Configuration ---
 # Read OPEND_DIR from env var (set in the secure .env), fallback to old path
 OPEND_DIR = Path(os.getenv("OPEND_DIR", str(BASE_DIR / "moomoo_OpenD_9.6.5618_Windows")))
 OPEND_PATH = OPEND_DIR / "OpenD.exe"
 OPEND_XML_PATH = OPEND_DIR / "OpenD.xml"
-OPEND_XML_TEMPLATE = OPEND_DIR / "OpenD.example.xml"
\ No newline at end of file
+OPEND_XML_TEMPLATE = OPEND_DIR / "OpenD.example.xml"
+
+# --- OpenD Quotas ---
+# Calls allowed per rolling window (calls, seconds), per trade-context endpoint
+OPEND_QUOTAS = {
+    "get_acc_cash_flow": (20, 30),
+    "history_order_list_query": (10, 30),
+    "accinfo_query": (10, 30),
+    "position_list_query": (10, 30),
+    "get_acc_list": (10, 30),
+}
+OPEND_MAX_RETRIES = 5
+OPEND_BACKOFF_BASE = 2.0   # seconds, doubled on every retry
+OPEND_BACKOFF_MAX = 60.0
+OPEND_WORKERS = 4          # worker threads used to pipeline batched queries (e.g. cash flow)
+OPEND_LATENCY_SAMPLES = 200  # recent call durations kept per endpoint (see RateLimiter.latency)
+OPEND_HEARTBEAT_SECONDS = 30  # health check of the shared trade context (see moomoo_api.OpenDSupervisor)
+
+# --- OpenD record/replay (see source/cassette.py) ---
+# "live" talks to OpenD; "record" also saves every response to OPEND_CASSETTE;
+# "replay" serves responses from OPEND_CASSETTE without starting OpenD
+OPEND_MODE = os.getenv("OPEND_MODE", "live")
+OPEND_CASSETTE = Path(os.getenv("OPEND_CASSETTE", str(BASE_DIR / "cassettes" / "opend.pkl.gz")))
+OPEND_REPLAY_SPEED = float(os.getenv("OPEND_REPLAY_SPEED", "1.0"))  # 2.0 = twice as fast, 0 = no delays
+OPEND_CASSETTE_FLUSH_CALLS = 50    # recorded responses held in memory before they are appended to the file
+OPEND_CASSETTE_MAX_REPEATS = 100   # latest responses kept per repeated query (positions poll, heartbeat)
@@ -1,8 +1,10 @@
-from source import moomoo_api, cleanup, db, dashboard
+from source import moomoo_api, cleanup, db, dashboard, metadata, metrics, scheduler, symbols
+from source.rate_limit import opend_limiter
 from config import settings
 from datetime import date, datetime,timedelta
 import matplotlib.pyplot as plt
 import os
+import argparse
 import subprocess
 import pandas as pd
 
@@ -31,40 +33,75 @@ current_date = [
                 ]
                 
 '''
-def get_api_data(current_date: datetime, end_date: datetime, keep_opend_alive: bool = False):
+def sync_cashflow(trade_ctx, current_date: datetime, end_date: datetime):
+    """Fetch only the clearing dates that are missing or not yet final (see db.cashflow_sync).
+
+    Dates are fetched in batches and each batch is stored together with its sync state, so an
+    interrupted backfill resumes where it stopped on the next run. Returns the cleaned cash
+    flow it stored, so callers never need to clean or store it again.
+    """
+    dates = db.cashflow_dates_to_fetch(end_date, current_date)
+    print(f"Cashflow: {len(dates)} clearing date(s) to fetch.")
+    batches = []
+    for i in range(0, len(dates), settings.CASHFLOW_SYNC_BATCH):
+        raw, fetched = moomoo_api.fetch_cashflow(trade_ctx, dates[i:i + settings.CASHFLOW_SYNC_BATCH])
+        cleaned = cleanup.cleanup_cashflow(raw)
+        with db.transaction():
+            if not cleaned.empty:
+                db.insert_dataframe(cleaned, 'cashflow')
+            db.mark_cashflow_synced(fetched, cleaned)
+        if not cleaned.empty:
+            batches.append(cleaned)
+    return pd.concat(batches, ignore_index=True) if batches else pd.DataFrame()
+
+def get_api_data(current_date: datetime, end_date: datetime, keep_opend_alive: bool = False,
+                 full_resync: bool = False, on_snapshot=None):
+    """Fetch account info, positions, cash flow and orders concurrently.
+
+    on_snapshot(acc_info, positions) runs as soon as both snapshot queries are back, while
+    the cash-flow walk and the order history are still being fetched.
+    """
     ## Handle API
-    # Initialize variables to None 
-    acc_info, positions, cashflow, historical_orders = None, None, None, None
+    # Orders: only the delta since the newest stored order, unless a full resync is requested
+    orders_since = None if full_resync else db.order_sync_start()
+    results = dict.fromkeys(['acc_info', 'positions', 'cashflow', 'historical_orders'])
+
+    def collect(name, value):
+        results[name] = value
+        if on_snapshot is not None and name in ('acc_info', 'positions') \
+                and results['acc_info'] is not None and results['positions'] is not None:
+            on_snapshot(results['acc_info'], results['positions'])
+
     try:
         with moomoo_api.opend_session(keep_alive=keep_opend_alive) as trade_ctx:
-            # Record down raw data from api
-            acc_info = moomoo_api.account_info(trade_ctx)
-            positions = moomoo_api.get_positions(trade_ctx)
-            cashflow = moomoo_api.account_cashflow(trade_ctx, current_date, end_date)
-            historical_orders = moomoo_api.get_historical_orders(trade_ctx)
+            moomoo_api.fetch_concurrently({
+                'acc_info': lambda: moomoo_api.account_info(trade_ctx),
+                'positions': lambda: moomoo_api.get_positions(trade_ctx),
+                'cashflow': lambda: sync_cashflow(trade_ctx, current_date, end_date),
+                'historical_orders': lambda: moomoo_api.get_historical_orders(trade_ctx, start=orders_since),
+            }, on_result=collect)
     except Exception as e:
         print(f"API Error: {e}")
-    
+    acc_info, positions, cashflow, historical_orders = (
+        results['acc_info'], results['positions'], results['cashflow'], results['historical_orders'])
+
     _summarize_frame("Acc_info", acc_info)
     _summarize_frame("Positions", positions)
     _summarize_frame("Cashflow", cashflow)
     _summarize_frame("Historical Orders", historical_orders)
+    for endpoint, stats in opend_limiter.latency().items():
+        print(f"  {endpoint}: {stats['calls']} call(s), median {stats['median']:.2f}s, max {stats['max']:.2f}s")
 
     return acc_info, positions, cashflow, historical_orders
 
-def cleanup_data(acc_info: pd.DataFrame, positions: pd.DataFrame, cashflow: pd.DataFrame, historical_orders: pd.DataFrame,current_date: datetime):
-    ## Cleanup to upload to db
-    print("Cleaning up data...")
+def build_snapshot(acc_info: pd.DataFrame, positions: pd.DataFrame, current_date: datetime):
+    """Clean raw account info and positions into (snapshot_df, positions_df) for current_date."""
     acc_info = cleanup.cleanup_acc_info(acc_info)
     positions = cleanup.cleanup_positions(positions)
     cleanup.update_portfolio_percentage(positions, cleanup.get_total_assets(acc_info))
-    historical_orders = cleanup.cleanup_historical_orders(historical_orders)
-    cashflow = cleanup.cleanup_cashflow(cashflow)
 
     _summarize_frame("Acc_info", acc_info)
     _summarize_frame("Positions", positions)
-    _summarize_frame("Cashflow", cashflow)
-    _summarize_frame("Historical Orders", historical_orders)
     '''
     print ("Total Assets: ",cleanup.get_total_assets(acc_info))
     print ("Securities assets: ",cleanup.get_securities_assets(acc_info))
@@ -100,59 +137,141 @@ def cleanup_data(acc_info: pd.DataFrame, positions: pd.DataFrame, cashflow: pd.D
     _summarize_frame("snapshot dataframe", snapshot_df)
     _summarize_frame("positions dataframe", positions_df)
 
-    return snapshot_df, positions_df, cashflow, historical_orders
+    return snapshot_df, positions_df
 
-def update_db(snapshot_df: pd.DataFrame, positions_df: pd.DataFrame, cashflow: pd.DataFrame, historical_orders: pd.DataFrame,
-              current_date: datetime):
-    ## Initialise and upload dataframes to db
-    db.init_db()
-    db.insert_dataframe(positions_df, 'positions')
+@metrics.timed()
+def cleanup_data(acc_info: pd.DataFrame, positions: pd.DataFrame, historical_orders: pd.DataFrame,current_date: datetime):
+    ## Cleanup to upload to db (cash flow is cleaned and stored batch by batch in sync_cashflow)
+    print("Cleaning up data...")
+    historical_orders = cleanup.cleanup_historical_orders(historical_orders)
+    _summarize_frame("Historical Orders", historical_orders)
+
+    snapshot_df, positions_df = build_snapshot(acc_info, positions, current_date)
+    return snapshot_df, positions_df, historical_orders
+
+@metrics.timed()
+def store_activity(historical_orders: pd.DataFrame):
+    """Orders and the transactions ledger (cash flow is already stored by sync_cashflow)."""
     db.insert_dataframe(historical_orders, 'historical_orders')
     db.sync_transactions()
-    # Check if cashflow dataframe is empty
-    if cashflow.empty:
-        print("Skipping cashflow database update due to empty results.")
-    else:
-        db.insert_dataframe(cashflow, 'cashflow')
+
+@metrics.timed()
+def store_snapshot(snapshot_df: pd.DataFrame, positions_df: pd.DataFrame, current_date: datetime):
+    """Positions and the portfolio snapshot."""
+    db.insert_dataframe(positions_df, 'positions')
     # Calculate and update nav for Time Weighted Returns(TWR)
     nav, units = db.calc_nav_units(current_date, snapshot_df)
     snapshot_df.loc[0, 'nav'] = nav
     snapshot_df.loc[0, 'units'] = units
-
     db.insert_dataframe(snapshot_df, 'portfolio_snapshots')
+
+@metrics.timed()
+def store_p_l(current_date: datetime):
     db.insert_dataframe(db.net_p_l(current_date),'net_p_l')
 
-    
-    indices_dict = db.indices_dict()
-    for index_name, ticker in indices_dict.items():
-        db.update_indices(ticker)
-    
+def update_db(snapshot_df: pd.DataFrame, positions_df: pd.DataFrame, historical_orders: pd.DataFrame,
+              current_date: datetime):
+    ## Upload dataframes to db
+    # One unit of work for the whole tick: a single commit instead of one per helper call
+    with db.transaction():
+        store_activity(historical_orders)
+        store_snapshot(snapshot_df, positions_df, current_date)
+        store_p_l(current_date)
+
+    # All indices in one batched request, only the bars missing since the last stored one
+    db.update_benchmarks()
     return 0
 
 
-def upload_to_db(current_date: datetime, end_date: datetime, keep_opend_alive: bool = False):
-    acc_info, positions, cashflow, historical_orders = get_api_data(current_date, end_date, keep_opend_alive)
-    if acc_info is None or positions is None:
-        print("API returned no data. Skipping database update for this tick.")
-        return 1
-    snapshot_df, positions_df, cashflow, historical_orders = cleanup_data(acc_info, positions, cashflow, historical_orders,current_date)
-    update_db(snapshot_df, positions_df, cashflow, historical_orders, current_date)
+def upload_to_db(current_date: datetime, end_date: datetime, keep_opend_alive: bool = False,
+                 full_resync: bool = False, profile: str = None):
+    """One full pipeline run; its stages are timed into pipeline_metrics (see source/metrics.py)."""
+    def store_early_snapshot(acc_info, positions):
+        # Live numbers land as soon as they arrive; update_db rewrites the row once today's
+        # cash flow is stored, so a same-day deposit is still reflected in nav/units
+        snapshot_df, positions_df = build_snapshot(acc_info, positions, current_date)
+        with db.transaction():
+            store_snapshot(snapshot_df, positions_df, current_date)
+
+    with metrics.run('upload', profile=profile):
+        acc_info, positions, _cashflow, historical_orders = get_api_data(current_date, end_date, keep_opend_alive,
+                                                                         full_resync, on_snapshot=store_early_snapshot)
+        if acc_info is None or positions is None:
+            print("API returned no data. Skipping database update for this tick.")
+            return 1
+        snapshot_df, positions_df, historical_orders = cleanup_data(acc_info, positions, historical_orders,current_date)
+        update_db(snapshot_df, positions_df, historical_orders, current_date)
     print("Database updated successfully.")
     return 0
 
 
+# --- Tiered live refresh ---
+# Live mode used to run the whole pipeline above every 10 seconds. Instead, each tier refreshes
+# only what changes at its pace, on its own background thread (see source/scheduler.py).
+def _today() -> datetime:
+    return datetime.combine(date.today(), datetime.min.time())
+
+@metrics.run('refresh_snapshot')
+def refresh_snapshot(keep_opend_alive: bool = True):
+    """Fast tier: account value and positions."""
+    today = _today()
+    with moomoo_api.opend_session(keep_alive=keep_opend_alive) as trade_ctx:
+        acc_info = moomoo_api.account_info(trade_ctx)
+        positions = moomoo_api.get_positions(trade_ctx)
+    snapshot_df, positions_df = build_snapshot(acc_info, positions, today)
+    with db.transaction():
+        store_snapshot(snapshot_df, positions_df, today)
+
+@metrics.run('refresh_activity')
+def refresh_activity(keep_opend_alive: bool = True):
+    """Medium tier: new orders, cash flow of the days not yet final, the ledger and net P/L."""
+    today = _today()
+    orders_since = db.order_sync_start()
+    with moomoo_api.opend_session(keep_alive=keep_opend_alive) as trade_ctx:
+        # Over the whole history: cashflow_dates_to_fetch keeps only the days that are missing
+        # (a date that failed earlier) or still within CASHFLOW_FINAL_AFTER_DAYS
+        sync_cashflow(trade_ctx, today, settings.START_DATE)
+        historical_orders = moomoo_api.get_historical_orders(trade_ctx, start=orders_since)
+    with db.transaction():
+        store_activity(cleanup.cleanup_historical_orders(historical_orders))
+        store_p_l(today)
+
+@metrics.run('refresh_reference')
+def refresh_reference():
+    """Slow tier: benchmark indices and security metadata for current holdings."""
+    db.update_benchmarks()
+    held = db.read_db("SELECT Symbol FROM positions WHERE date = (SELECT MAX(date) FROM positions)")['Symbol']
+    # Options are described by their underlying
+    metadata.security_metadata(symbols.symbol_info(held)['Ticker'].unique())
+
+def tiered_refresher() -> scheduler.TieredRefresher:
+    return scheduler.TieredRefresher([
+        scheduler.RefreshTier('snapshot', settings.REFRESH_FAST_SECONDS, refresh_snapshot),
+        scheduler.RefreshTier('activity', settings.REFRESH_MEDIUM_SECONDS, refresh_activity),
+        scheduler.RefreshTier('reference', settings.REFRESH_SLOW_SECONDS, refresh_reference),
+    ])
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Fetch moomoo data and update the portfolio database.")
+    parser.add_argument("--full-resync", action="store_true",
+                        help="Re-download the whole order history from START_DATE (repair mode).")
+    parser.add_argument("--profile", choices=metrics.PROFILE_MODES,
+                        help="Profile this run; the output is written to settings.PROFILE_DIR.")
+    args = parser.parse_args()
+
     today_date = datetime.combine(date.today(), datetime.min.time())
     beginning_date = settings.START_DATE
 
     # --- Database Update Logic ---
+    # Cashflow is synced incrementally (db.cashflow_sync), so every run can cover the full range
+    # from START_DATE: only clearing dates that are missing or not yet final are fetched.
     if not os.path.exists(settings.MOOMOO_PORTFOLIO_DB_PATH):
         print("Database not found. Initializing and fetching all historical data...")
-        upload_to_db(today_date, beginning_date,keep_opend_alive=False)
-        
-    else:
-        today_str = today_date.strftime("%Y-%m-%d")
-        upload_to_db(today_date, today_date - timedelta(days=30),keep_opend_alive=False)
+    # Schema creation/migration runs once per process, not per upload
+    db.init_db()
+    upload_to_db(today_date, beginning_date,keep_opend_alive=False, full_resync=args.full_resync,
+                 profile=args.profile)
     
     print("Database initialized successfully.")
     return 0
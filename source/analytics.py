@@ -0,0 +1,125 @@
+"""Performance analytics over the NAV series (see source/nav.py).
+
+NavAnalytics is built once per refresh from portfolio_snapshots: daily returns, the
+drawdown curve and the period anchors (MTD, QTD, YTD, 1Y, inception) are computed in one
+vectorised pass, after which every metric is a lookup. All values are plain floats (fractions,
+e.g. 0.089 for +8.9%); formatting is left to the UI. NaN means "not enough history".
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+PERIODS = ['MTD', 'QTD', 'YTD', '1Y', 'Inception']
+
+# signature of the snapshots frame -> NavAnalytics, so reruns within a refresh reuse it
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class NavAnalytics:
+    def __init__(self, nav: pd.Series):
+        """nav: NAV per unit indexed by snapshot date (any order; NaN/zero rows are dropped)."""
+        nav = nav.astype(float)
+        nav.index = pd.to_datetime(nav.index).normalize()
+        nav = nav[nav.notna() & (nav != 0)].sort_index()
+        self.nav = nav[~nav.index.duplicated(keep='last')]
+        self.returns = self.nav.pct_change().iloc[1:]
+        self.drawdown = self.nav / self.nav.cummax() - 1
+        self.periods = self._period_returns()
+
+    @classmethod
+    def from_snapshots(cls, snapshots: pd.DataFrame) -> 'NavAnalytics':
+        """Analytics for a portfolio_snapshots frame (date + nav), memoised on its content."""
+        if snapshots is None or snapshots.empty:
+            return cls(pd.Series(dtype=float))
+        key = (len(snapshots), str(snapshots['date'].iloc[0]), str(snapshots['date'].iloc[-1]),
+               float(pd.to_numeric(snapshots['nav'], errors='coerce').sum()))
+        with _cache_lock:
+            if key not in _cache:
+                _cache.clear()  # only the latest refresh is worth keeping
+                _cache[key] = cls(pd.Series(snapshots['nav'].to_numpy(), index=snapshots['date']))
+            return _cache[key]
+
+    # --- Lookups ---
+    def value_at(self, when) -> float:
+        """NAV on exactly that date (NaN when there is no snapshot that day)."""
+        pos = self.nav.index.get_indexer([pd.Timestamp(when).normalize()])[0]
+        return float(self.nav.iloc[pos]) if pos >= 0 else np.nan
+
+    def value_asof(self, when) -> float:
+        """NAV of the last snapshot on or before `when` (NaN before inception)."""
+        pos = self.nav.index.searchsorted(pd.Timestamp(when).normalize(), side='right') - 1
+        return float(self.nav.iloc[pos]) if pos >= 0 else np.nan
+
+    def twr(self, start=None, end=None) -> float:
+        """Time-weighted return between two snapshot dates (defaults: inception, latest)."""
+        if self.nav.empty:
+            return np.nan
+        start_nav = self.nav.iloc[0] if start is None else self.value_at(start)
+        end_nav = self.nav.iloc[-1] if end is None else self.value_at(end)
+        return float(end_nav / start_nav - 1)
+
+    def _period_returns(self) -> dict:
+        if self.nav.empty:
+            return dict.fromkeys(PERIODS, np.nan)
+        latest = self.nav.index[-1]
+        end_nav = self.nav.iloc[-1]
+        # Each period is measured from the last NAV before it began (or inception if later)
+        starts = {
+            'MTD': latest.to_period('M').start_time,
+            'QTD': latest.to_period('Q').start_time,
+            'YTD': latest.to_period('Y').start_time,
+        }
+        out = {}
+        for name, start in starts.items():
+            base = self.value_asof(start - pd.Timedelta(days=1))
+            out[name] = end_nav / (self.nav.iloc[0] if np.isnan(base) else base) - 1
+        one_year = self.value_asof(latest - pd.DateOffset(years=1))
+        out['1Y'] = end_nav / one_year - 1 if not np.isnan(one_year) else np.nan
+        out['Inception'] = end_nav / self.nav.iloc[0] - 1
+        return {name: float(out[name]) for name in PERIODS}
+
+    def period_return(self, period: str) -> float:
+        return self.periods[period]
+
+    # --- Series / risk metrics ---
+    def rolling_return(self, window: int) -> pd.Series:
+        """Return over the trailing `window` snapshots, for every snapshot."""
+        return self.nav.pct_change(periods=window)
+
+    def periods_per_year(self) -> float:
+        """Snapshot returns per year implied by the observed spacing: TRADING_DAYS for one
+        snapshot every business day, about 52 for weekly ones, fewer still for irregular gaps."""
+        if self.returns.empty:
+            return float(TRADING_DAYS)
+        spanned = np.busday_count(self.nav.index[0].date(), self.nav.index[-1].date())
+        return TRADING_DAYS * len(self.returns) / max(int(spanned), 1)
+
+    def volatility(self, periods_per_year: float = None) -> float:
+        """Annualised standard deviation of snapshot-to-snapshot returns.
+
+        Annualised by periods_per_year (default: derived from the snapshot spacing).
+        """
+        if len(self.returns) < 2:
+            return np.nan
+        periods_per_year = self.periods_per_year() if periods_per_year is None else periods_per_year
+        return float(self.returns.std(ddof=1) * np.sqrt(periods_per_year))
+
+    def max_drawdown(self) -> float:
+        """Deepest peak-to-trough fall of NAV (e.g. -0.12 for -12%)."""
+        return float(self.drawdown.min()) if len(self.drawdown) else np.nan
+
+    def sharpe(self, risk_free_rate: float = 0.0, periods_per_year: float = None) -> float:
+        """Annualised Sharpe ratio of snapshot returns against an annual risk-free rate."""
+        periods_per_year = self.periods_per_year() if periods_per_year is None else periods_per_year
+        vol = self.volatility(periods_per_year)
+        if np.isnan(vol) or vol == 0:
+            return np.nan
+        excess = self.returns.mean() * periods_per_year - risk_free_rate
+        return float(excess / vol)
+
+    def summary(self, risk_free_rate: float = 0.0) -> dict:
+        return {**self.periods, 'Volatility': self.volatility(), 'Max_Drawdown': self.max_drawdown(),
+                'Sharpe': self.sharpe(risk_free_rate)}
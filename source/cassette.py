@@ -0,0 +1,207 @@
+"""Record and replay of OpenD trade-context responses, to run the ETL without a broker.
+
+    OPEND_MODE=record python main.py     # live OpenD, every response saved to the cassette
+    OPEND_MODE=replay python main.py     # no OpenD at all: responses come from the cassette
+
+moomoo_api.configure_moomoo_api() returns a CassetteRecorder around the real context in
+record mode and a CassettePlayer in replay mode, so everything above it (the quota
+scheduler, the supervisor, main.upload_to_db) runs unchanged. A cassette is a gzipped
+pickle of every (ret, data) response with the time OpenD took to answer it.
+
+Recorders append to the cassette every OPEND_CASSETTE_FLUSH_CALLS responses and when they
+are closed, so a reconnect (a new recorder) or a crash never loses what came before. Only
+the latest OPEND_CASSETTE_MAX_REPEATS responses of a repeated query (the 10-second
+positions poll, heartbeats) are kept. Delete the file to start a fresh recording.
+
+Replay waits the recorded time divided by OPEND_REPLAY_SPEED (0 = no waiting). Responses
+are matched on the arguments in MATCH_ON; a query asked more often than it was recorded
+(positions polled every tick) gets the recorded responses in order, then the last one again.
+"""
+import gzip
+import pickle
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import moomoo
+
+from config import settings
+
+CASSETTE_VERSION = 1
+MODES = ('live', 'record', 'replay')
+
+# Arguments that identify a response. history_order_list_query's end is "now" on every
+# run, so only the window start is matched; get_historical_orders pins the sync to
+# START_DATE in record and replay modes, so the starts do not depend on the local database.
+MATCH_ON = {
+    'get_acc_list': (),
+    'accinfo_query': ('currency',),
+    'position_list_query': (),
+    'get_acc_cash_flow': ('clearing_date',),
+    'history_order_list_query': ('start',),
+}
+
+
+# Recorders of one process (old and new contexts around a reconnect) share the file
+_file_lock = threading.Lock()
+
+
+class CassetteMiss(LookupError):
+    """Replay was asked for a response that is not on the cassette."""
+
+
+def _key(endpoint: str, kwargs: dict) -> tuple:
+    return (endpoint,) + tuple(kwargs.get(arg) for arg in MATCH_ON[endpoint])
+
+
+def load(path) -> dict:
+    with gzip.open(path, 'rb') as f:
+        cassette = pickle.load(f)
+    if cassette.get('version') != CASSETTE_VERSION:
+        raise ValueError(f"{path}: cassette version {cassette.get('version')}, expected {CASSETTE_VERSION}")
+    return cassette
+
+
+def _latest_repeats(calls: list, max_repeats: int) -> list:
+    """calls without all but the last max_repeats responses of each key, order kept."""
+    seen = {}
+    kept = []
+    for call in reversed(calls):
+        seen[call['key']] = seen.get(call['key'], 0) + 1
+        if seen[call['key']] <= max_repeats:
+            kept.append(call)
+    return kept[::-1]
+
+
+def append(path, calls: list, max_repeats: int = None) -> int:
+    """Add calls to the cassette at path (created if missing). Returns its size in calls."""
+    path = Path(path)
+    max_repeats = settings.OPEND_CASSETTE_MAX_REPEATS if max_repeats is None else max_repeats
+    with _file_lock:
+        existing = load(path)['calls'] if path.exists() else []
+        merged = _latest_repeats(existing + calls, max_repeats)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written next to the target and renamed, so a crash never leaves half a cassette
+        tmp = path.with_name(path.name + '.tmp')
+        with gzip.open(tmp, 'wb') as f:
+            pickle.dump({'version': CASSETTE_VERSION, 'recorded_at': datetime.now(), 'calls': merged}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(path)
+    return len(merged)
+
+
+class CassetteRecorder:
+    """Wraps a live trade context; every response passes through and is appended to the
+    cassette every `flush_every` responses and on close()."""
+
+    def __init__(self, ctx, path=None, flush_every: int = None):
+        self._ctx = ctx
+        self.path = Path(path or settings.OPEND_CASSETTE)
+        self.flush_every = settings.OPEND_CASSETTE_FLUSH_CALLS if flush_every is None else flush_every
+        self.recorded = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        for endpoint in MATCH_ON:
+            if hasattr(ctx, endpoint):
+                setattr(self, endpoint, self._recording(endpoint))
+
+    def _recording(self, endpoint: str):
+        query = getattr(self._ctx, endpoint)
+
+        def record(**kwargs):
+            started = time.perf_counter()
+            ret, data = query(**kwargs)
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._pending.append({'key': _key(endpoint, kwargs), 'ret': ret, 'data': data, 'elapsed': elapsed})
+                self.recorded += 1
+                due = len(self._pending) >= self.flush_every
+            if due:
+                self.flush()
+            return ret, data
+        return record
+
+    def __getattr__(self, name):
+        return getattr(self._ctx, name)
+
+    def flush(self) -> int:
+        """Append the responses recorded since the last flush to the cassette."""
+        with self._lock:
+            calls, self._pending = self._pending, []
+        if calls:
+            append(self.path, calls)
+        return len(calls)
+
+    def close(self):
+        try:
+            self.flush()
+            print(f"Recorded {self.recorded} OpenD responses to {self.path}")
+        finally:
+            self._ctx.close()
+
+
+class CassettePlayer:
+    """Answers the trade-context queries from a cassette, at `speed` times the recorded pace."""
+
+    def __init__(self, path=None, speed: float = None, sleep=time.sleep):
+        self.path = Path(path or settings.OPEND_CASSETTE)
+        self.speed = settings.OPEND_REPLAY_SPEED if speed is None else speed
+        self._sleep = sleep
+        self._responses = {}
+        for call in load(self.path)['calls']:
+            self._responses.setdefault(call['key'], []).append(call)
+        self._played = {}
+        self._lock = threading.Lock()
+        for endpoint in MATCH_ON:
+            setattr(self, endpoint, self._replaying(endpoint))
+
+    def _replaying(self, endpoint: str):
+        def replay(**kwargs):
+            key = _key(endpoint, kwargs)
+            with self._lock:
+                responses = self._responses.get(key)
+                if not responses:
+                    raise CassetteMiss(f"{endpoint}{key[1:]} is not on {self.path.name}")
+                played = self._played.get(key, 0)
+                self._played[key] = played + 1
+            call = responses[min(played, len(responses) - 1)]
+            if self.speed > 0:
+                self._sleep(call['elapsed'] / self.speed)
+            data = call['data']
+            return call['ret'], data.copy() if hasattr(data, 'copy') else data
+        return replay
+
+    def close(self):
+        pass
+
+
+def summary(path=None) -> dict:
+    """Number of recorded responses per endpoint, and when they were recorded."""
+    cassette = load(path or settings.OPEND_CASSETTE)
+    counts = {}
+    for call in cassette['calls']:
+        counts[call['key'][0]] = counts.get(call['key'][0], 0) + 1
+    errors = sum(call['ret'] != moomoo.RET_OK for call in cassette['calls'])
+    return {'recorded_at': cassette['recorded_at'], 'responses': counts, 'errors': errors}
+
+
+def main(argv=None):
+    """Inspect a cassette:  python -m source.cassette [path]"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Show what an OpenD cassette contains.")
+    parser.add_argument("path", nargs="?", default=settings.OPEND_CASSETTE)
+    args = parser.parse_args(argv)
+
+    if not Path(args.path).exists():
+        print(f"No cassette at {args.path}.")
+        return 1
+    info = summary(args.path)
+    print(f"{args.path}: recorded {info['recorded_at']:%Y-%m-%d %H:%M:%S}, {info['errors']} error responses")
+    for endpoint, count in sorted(info['responses'].items()):
+        print(f"  {endpoint:<26} {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
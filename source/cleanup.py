@@ -1,9 +1,10 @@
 from datetime import datetime
 from typing import Optional, Dict, List
+import numpy as np
 import pandas as pd
 import re
-import yfinance as yf
-import functools
+from source.fx import get_exchange_rate, convert_currency, convert_column
+from source.symbols import is_option
 
 def cleanup_acc_info(acc_info:pd.DataFrame):
     filter_list = ['total_assets','securities_assets', 'fund_assets','bond_assets','cash','pending_asset','frozen_cash','avl_withdrawal_cash','risk_status',
@@ -73,52 +74,11 @@ def cleanup_positions(positions:pd.DataFrame):
     positions['Symbol'] = positions['Symbol'].apply(extract_ticker)
     return positions
 
-# Cache last 16, and every hour, according to datetime object
-@functools.lru_cache(maxsize=16)
-def get_exchange_rate(from_currency:str,to_currency:str,current_hour_tag):
-    if from_currency == to_currency:
-        return 1.0
-    ticker = f"{from_currency}{to_currency}=X" if to_currency != 'USD' else f"{from_currency}=X"
-    try:
-        price_data = yf.download(tickers=ticker, period='1d',
-                                auto_adjust=True,
-                                interval='1m',
-                                progress=False,
-                                prepost=True)
-        if not price_data.empty:
-            # Extract the most recent price for each ticker
-        # Forward-fill to propagate the last valid price, then select the last row.
-        # This handles cases where some tickers may not have traded in the last minute.
-            return price_data['Close'].ffill().iloc[-1].round(decimals=3).item()
-        # Set fallbacks and get approx value
-        fallbacks = {"USD": {"SGD": 1.28}, "SGD": {"USD": 0.78}}
-        return fallbacks.get(from_currency, {}).get(to_currency, 1.0)
-    
-    except Exception as e:
-        print(f"Error fetching exchange rate: {e}")
-        # Return a safe fallback so the dashboard doesn't break
-        return 1.28 if from_currency == "USD" and to_currency == "SGD" else 0.78 if from_currency == "SGD" and to_currency == "USD" else 1.0
-
-    
-            
-
-def convert_currency(value, from_currency:str, to_currency:str,current_hour_tag = None) -> Optional[float]:
-    """Converts a given amount from one currency to another."""
-    # Set the current hour tag for caching for get_exchange_rate
-    if current_hour_tag is None:
-        current_hour_tag = datetime.now().strftime("%Y-%m-%d-%H")
-    rate = get_exchange_rate(from_currency, to_currency,current_hour_tag)
-    if rate:
-        converted_amount = value * rate
-        return round(converted_amount, 2)
-    else:
-        return None
-
 def update_portfolio_percentage(pos: pd.DataFrame, total_assets: float) -> None:
     if total_assets == 0:
         pos['Portfolio_Percent'] = 0.0
     else:
-        pos['Portfolio_Percent'] = (convert_currency(pos['Market_Value'],"USD","SGD") / total_assets * 100).round(2)
+        pos['Portfolio_Percent'] = (convert_column(pos['Market_Value'], pos['Currency'], "SGD") / total_assets * 100).round(2)
         pos['Portfolio_Percent'] = pos['Portfolio_Percent'].apply(
             lambda x: f"{x:.2f}%"
         )
@@ -194,6 +154,36 @@ def classify_cashflow(cashflow_type, remark):
     return is_external, is_income
 
 
+# The remark hints as one alternation each, so a whole column is matched in a single pass
+INCOME_REMARK_PATTERN = '|'.join(map(re.escape, INCOME_REMARK_HINTS))
+INTERNAL_REMARK_PATTERN = '|'.join(map(re.escape, INTERNAL_REMARK_HINTS))
+
+
+def _text_column(values) -> pd.Series:
+    """Column as plain str, with missing values as '' (like classify_cashflow's None)."""
+    col = pd.Series(values, dtype=object)
+    return col.where(col.notna(), '').astype(str)
+
+
+def classify_cashflows(types, remarks):
+    """Vectorised classify_cashflow: (is_external, is_income) as 0/1 int arrays.
+
+    Same rules, row for row, as the scalar version; types/remarks are equal-length columns.
+    """
+    type_s = _text_column(types).str.strip()
+    rem_lower = _text_column(remarks).str.lower()
+    others = (type_s == 'Others').to_numpy(dtype=bool)
+    income_hint = rem_lower.str.contains(INCOME_REMARK_PATTERN, regex=True).to_numpy(dtype=bool)
+    internal_hint = rem_lower.str.contains(INTERNAL_REMARK_PATTERN, regex=True).to_numpy(dtype=bool)
+
+    is_external = type_s.isin(EXTERNAL_CASHFLOW_TYPES).to_numpy(dtype=bool)
+    is_income = type_s.isin(INCOME_CASHFLOW_TYPES).to_numpy(dtype=bool)
+    # 'Others' is ambiguous -- income hint, else internal hint, else external capital
+    is_income = np.where(others, income_hint, is_income)
+    is_external = np.where(others, ~income_hint & ~internal_hint, is_external)
+    return is_external.astype(int), is_income.astype(int)
+
+
 def cleanup_cashflow(cashflow:pd.DataFrame):
     if cashflow is None or cashflow.empty:
         return pd.DataFrame()
@@ -206,28 +196,28 @@ def cleanup_cashflow(cashflow:pd.DataFrame):
                             'cashflow_amount':'Amount',
                             'cashflow_remark':'Remark'}, inplace=True)
     cashflow['Amount'] = cashflow['Amount'].round(2)
-    classified = cashflow.apply(lambda r: classify_cashflow(r['Type'], r['Remark']), axis=1)
-    cashflow['is_external'] = classified.apply(lambda t: 1 if t[0] else 0)
-    cashflow['is_income'] = classified.apply(lambda t: 1 if t[1] else 0)
+    cashflow['is_external'], cashflow['is_income'] = classify_cashflows(cashflow['Type'], cashflow['Remark'])
     return cashflow
 
 
+def settlement_dates(start, end, holidays=()) -> List[str]:
+    """Clearing dates (weekdays, minus holidays) between start and end inclusive, newest first."""
+    if start > end:
+        return []
+    days = pd.bdate_range(start, end, freq='C', holidays=list(holidays))
+    return [d.strftime('%Y-%m-%d') for d in days[::-1]]
+
+
 def separate_assets(positions:pd.DataFrame):
-    # Regex for Option: Root + 6 digits (date) + C/P + 8 digits (strike)
-    option_pattern = r'[A-Z]+\d{6}[CP]\d+'
-    # Create a boolean mask
-    is_option = positions['Symbol'].str.contains(option_pattern, regex=True)
-    df_options = positions[is_option].copy()
-    df_stocks = positions[~is_option].copy()
+    # Boolean mask from the parsed option symbols (see source/symbols.py)
+    option_mask = is_option(positions['Symbol'])
+    df_options = positions[option_mask].copy()
+    df_stocks = positions[~option_mask].copy()
 
     return df_stocks, df_options
 
 def sum_of_mv(df:pd.DataFrame):
-    converted_df = df.loc[:, ['Market_Value', 'Currency']].copy()
-    converted_df['Market_Value'] = converted_df.apply(
-                                lambda row: convert_currency(row['Market_Value'], row['Currency'], 'SGD'), axis=1
-                                )
-    return converted_df['Market_Value'].sum().round(2)
+    return convert_column(df['Market_Value'], df['Currency'], 'SGD').sum().round(2)
 
 
 def portfolio_snapshot_table(date: str, shares_mv:float, options_mv:float, cash:float):
@@ -1,5 +1,8 @@
 from config import settings
 from source import db
+from source.metadata import security_metadata
+from source.symbols import with_symbol_info
+from source.analytics import NavAnalytics
 
 from datetime import date, datetime,timedelta
 import sqlite3
@@ -9,7 +12,6 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import yfinance as yf
-import functools
 import numpy as np
 
 # Style Pandas dataframe
@@ -79,12 +81,8 @@ def market_p_l_type(market: str):
     
     # Split by market 'US','SG','HK' etc.
     net_P_L = net_P_L[net_P_L['Market']==market].round(2)
-    # If option
-    option_pattern = r'[A-Z]+\d{6}[CP]\d+'
-    # Column with Is_Option. 
-    net_P_L['Is_Option'] = net_P_L['Symbol'].str.contains(option_pattern, regex=True)
-    # New Column 'Ticker' according to if Option or not
-    net_P_L['Ticker'] = net_P_L.apply(lambda x: get_base_ticker(x['Symbol'], x['Is_Option']), axis=1)
+    # Is_Option and Ticker (underlying for options) from the parsed symbols table
+    net_P_L = with_symbol_info(net_P_L)
     # New column 'Asset Type' if is option, option gain, else stock gain
     net_P_L['Asset_Type'] = net_P_L['Is_Option'].map({True: 'Option', False: 'Stock'})
 
@@ -101,50 +99,19 @@ def market_p_l_type(market: str):
 
     return pivot_df
 
-def get_base_ticker(symbol: str, is_opt):
-    if is_opt:
-        # For options, extract just the leading letters (e.g., 'AMZN' from 'AMZN260918C...')
-        return re.match(r'^[A-Z]+', symbol).group()
-    return symbol 
-
 def get_twr(df: pd.DataFrame, start_date: datetime = None, end_date: datetime = None):
-    """Time-Weighted Return between two snapshot dates.
+    """Time-Weighted Return between two snapshot dates, formatted for display.
 
     If start_date is None, it defaults to the earliest snapshot in `df` -- i.e. the
-    tracking inception (when data recording began). This removes the old hardcoded
-    reference date and keeps the measure anchored to real recorded data.
+    tracking inception (when data recording began). The number itself comes from
+    source/analytics.py; "N/A" when either date has no snapshot.
     """
     if df is None or df.empty:
         return "N/A"
-
-    # Resolve start date
-    if start_date is None:
-        start_str = str(pd.to_datetime(df['date']).min().date())
-    elif isinstance(start_date, (date, datetime)):
-        start_str = start_date.strftime('%Y-%m-%d')
-    else:
-        start_str = str(start_date)[:10]
-
-    # Resolve end date
-    if end_date is None:
-        end_str = str(pd.to_datetime(df['date']).max().date())
-    elif isinstance(end_date, (date, datetime)):
-        end_str = end_date.strftime('%Y-%m-%d')
-    else:
-        end_str = str(end_date)[:10]
-
-    try:
-        beginning_nav = df.loc[df['date'] == start_str, 'nav'].values[0]
-        end_nav = df.loc[df['date'] == end_str, 'nav'].values[0]
-    except IndexError:
-        return "N/A"
-
-    if beginning_nav == 0:
+    returns = NavAnalytics.from_snapshots(df).twr(start_date, end_date)
+    if not np.isfinite(returns):
         return "N/A"
-
-    returns = (end_nav - beginning_nav) / beginning_nav
-    twr = f"{returns:.2%}"
-    return twr
+    return f"{returns:.2%}"
 
 def config_plot_annotation(df: pd.DataFrame, label: str):
     x_anchor = "center"
@@ -281,49 +248,42 @@ def plot_asset_trend(df: pd.DataFrame):
                         )
     return fig
 
-def comparison_df(portfolio_snapshots_df: pd.DataFrame, benchmark_df: pd.DataFrame):
-    twr = portfolio_snapshots_df.copy()
-    benchmark = benchmark_df.copy()
-    # Convert to datetime object and standardise the format to date only
-    twr['date'] = pd.to_datetime(twr['date']).dt.date
-    benchmark['Date'] = pd.to_datetime(benchmark['Date']).dt.date
-
-    # Pivot the benchmark table so each Symbol is its own column
-    # This turns [Date, Symbol, Close] into [Date, ^HSI, ^N225, ^STI]
-    bench_pivoted = benchmark.pivot(index='Date', columns='Symbol', values='Close')
-    '''Rename the table names to indices name'''
-    indices_dict = db.indices_dict()
-    for key,value in  indices_dict.items():
-        if value in bench_pivoted.columns:
-            bench_pivoted.rename(columns={value: key}, inplace=True)
-
-    # Merge the 2 tables and using the dates in portfolio_snapshots only
-    master_df = pd.merge(twr[['date', 'nav']], bench_pivoted, left_on='date', right_index=True, how='left')
-    master_df = master_df.sort_values('date')
-
-    # Fill NaN values with last known value forward
+def comparison_df(portfolio_snapshots_df: pd.DataFrame):
+    """Portfolio nav and every benchmark index's close on each snapshot date, one column each.
+
+    The closes come pre-aligned to the snapshot dates from the benchmark_aligned table (kept
+    up to date by db.refresh_benchmark_aligned), so nothing is pivoted or merged per render.
+    """
+    twr = portfolio_snapshots_df[['date', 'nav']].copy()
+    twr['date'] = pd.to_datetime(twr['date']).dt.normalize()
+    twr = twr.sort_values('date', ignore_index=True)
+
+    dates, symbols, closes = db.benchmark_aligned_matrix()
+    '''Rename the symbols to indices name'''
+    names = {value: key for key, value in db.indices_dict().items()}
+    aligned = pd.DataFrame(closes, index=dates, columns=[names.get(s, s) for s in symbols])
+    aligned = aligned.reindex(twr['date'].dt.strftime('%Y-%m-%d')).reset_index(drop=True)
+    master_df = pd.concat([twr, aligned], axis=1)
+
+    # Snapshots not aligned yet take the last known value forward, then the first one backward
     master_df = master_df.ffill()
-    # Fill NaN values with known values after. Backward fill
     master_df = master_df.bfill()
-    
+
     return master_df
 
 def comparison_percent(df: pd.DataFrame):
-    percent_df = df.copy()
-    # Create the percentage change instead of values.
+    percent_df = df.rename(columns={'nav': 'Portfolio'})
     cols_to_normalize = percent_df.columns.drop('date')
-    # Define first row as intitial, then apply percentage change from initial to all following rows of columns for nav and indices
-    for col in cols_to_normalize:
-            if col in percent_df.columns:
-                first_val = percent_df[col].iloc[0]
-                # Check if first value is NaN, or if is 0
-                if pd.notna(first_val) and first_val != 0:
-                    percent_df[col] = round((percent_df[col] / first_val - 1) * 100 , 2)
-                    
-                else:
-                    # Fallback: if data is entirely missing for a column, set pct to 0
-                    percent_df[col] = 0.0
-    percent_df.rename(columns={'nav': 'Portfolio'},inplace=True)
+    if percent_df.empty or cols_to_normalize.empty:
+        return percent_df
+    # Percentage change from the first row, as one divide over the date x column matrix
+    values = percent_df[cols_to_normalize].to_numpy(dtype=float)
+    first = values[0]
+    # A column whose first value is missing or 0 is set to 0 throughout
+    valid = ~np.isnan(first) & (first != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent = np.round((values / np.where(valid, first, 1.0) - 1) * 100, 2)
+    percent_df[cols_to_normalize] = np.where(valid, percent, 0.0)
     return percent_df
 
 def plt_performance_comparison(percent_df: pd.DataFrame):
@@ -397,11 +357,8 @@ def plt_performance_comparison(percent_df: pd.DataFrame):
 def display_pos(df: pd.DataFrame):
     pos_df = df.copy()
     pos_df = pos_df[pos_df['Market_Value'] != 0]
-    # Add column is option or not
-    option_pattern = r'[A-Z]+\d{6}[CP]\d+'
-    pos_df['Is_Option'] = pos_df['Symbol'].str.contains(option_pattern, regex=True)
-    # Identify what Ticker, and if is option or stock
-    pos_df['Ticker'] = pos_df.apply(lambda x: get_base_ticker(x['Symbol'], x['Is_Option']), axis=1)
+    # Identify what Ticker, and if is option or stock (parsed symbols table)
+    pos_df = with_symbol_info(pos_df)
     pos_df['Asset_Type'] = pos_df['Is_Option'].map({True: 'Option', False: 'Stock'})
 
     # Grouping and Sorting: Calculate total portfolio % per ticker to sort groups by size
@@ -413,15 +370,9 @@ def display_pos(df: pd.DataFrame):
     pos_df = pos_df.merge(ticker_totals, on='Ticker')
     # Sort by each Ticker Total (desc), then by individual position value within each Ticker (desc)
     pos_df = pos_df.sort_values(by=['Ticker_Total_Val', 'Sort_Val'], ascending=[False, False])
-    pos_df['Market_Cap'] = pos_df['Ticker'].apply(lambda x: get_mktcap(x))
-    pos_df['Market_Cap_Cat'] = pos_df['Market_Cap'].apply(market_cap_class)
-    sector_map = {}
-    for ticker in pos_df['Ticker'].unique():
-        sector_map[ticker] = get_sector(ticker,datetime.now().strftime("%Y-%m"))
-
-    pos_df['Sector'] = pos_df['Ticker'].map(lambda x: sector_map[x][0])
-    pos_df['Industry'] = pos_df['Ticker'].map(lambda x: sector_map[x][1])
-    pos_df['Country'] = pos_df['Ticker'].apply(lambda x: get_country(x))
+    # Sector / Industry / Country / Market_Cap for every ticker in one join (see source/metadata.py)
+    pos_df = pos_df.merge(security_metadata(pos_df['Ticker'].unique()), on='Ticker', how='left')
+    pos_df['Market_Cap_Cat'] = market_cap_classes(pos_df['Market_Cap'])
     return pos_df
 
 def style_pos(pos_df: pd.DataFrame):
@@ -451,29 +402,6 @@ def style_pos(pos_df: pd.DataFrame):
         "Today's P/L": '{:+,.2f}'
     }).hide(axis="index")
 
-# Get sector of ticker symbol passed in via yfinance
-@functools.lru_cache(maxsize=30)
-def get_sector(ticker_symbol,month_tag: datetime):
-    try:
-        ticker = yf.Ticker(ticker_symbol)
-        info = ticker.info
-        
-        # Check if it's an ETF. Then use the industry as the sector
-        quote_type = info.get('quoteType', 'UNKNOWN')
-        
-        if quote_type == 'ETF':
-            sector = info.get('category', info.get('fundFamily', 'Index/Fund'))
-            # Attempt to get the category or fund family for the industry column
-            industry = info.get('category', info.get('fundFamily', 'Index/Fund'))
-        else:
-            sector = info.get('sector', 'Other')
-            industry = info.get('industry', 'Other')
-            
-        return sector, industry
-    except Exception:
-        return 'Unknown', 'Unknown'
-
-    
 def positions_overview(pos_df: pd.DataFrame):
     pos_copy_df = pos_df.copy()
 
@@ -525,9 +453,6 @@ def positions_overview(pos_df: pd.DataFrame):
     position_overview = position_overview.style.map(style_negative_red_positive_green, subset=['P_L', 'Today_s_P_L','P_L_Percent'])
     return position_overview
 
-@functools.lru_cache(maxsize=30)
-def get_mktcap(ticker: str,month_tag: datetime = datetime.now().strftime("%Y-%m")):
-    return yf.Ticker(ticker).info.get('marketCap')
 def market_cap_class(market_cap: float):
     if pd.isna(market_cap):
         return 'Unknown'
@@ -546,13 +471,16 @@ def market_cap_class(market_cap: float):
     else:
         return 'Unknown'
 
-@functools.lru_cache(maxsize=30)
-def get_country(ticker: str,month_tag: datetime = datetime.now().strftime("%Y-%m")):
-    tk = yf.Ticker(ticker).info
-    try: 
-        return tk['country']
-    except Exception as e:
-        return None
+def market_cap_classes(market_caps: pd.Series) -> pd.Series:
+    """Vectorised market_cap_class over a column."""
+    caps = pd.to_numeric(market_caps, errors='coerce')
+    categories = np.select(
+        [caps > 200000000000, caps > 10000000000, caps > 2000000000,
+         caps > 300000000, caps > 50000000, caps < 50000000],
+        ['Mega', 'Large', 'Mid', 'Small', 'Micro', 'Nano'],
+        default='Unknown',
+    )
+    return pd.Series(categories, index=market_caps.index)
 
 def plot_portfolio_characteristics(pos_df: pd.DataFrame):
     # Grouping data for each subplot
@@ -675,6 +603,30 @@ def plot_income_trend(income_df: pd.DataFrame):
     return fig
 
 
+def plot_stage_latency(latency: pd.DataFrame, stages=None):
+    """p50 (solid) and p95 (dotted) latency per pipeline stage over time (see metrics.stage_latency)."""
+    if latency.empty:
+        return empty_fig()
+    if stages:
+        latency = latency[latency['stage'].isin(stages)]
+    fig = go.Figure()
+    colors = px.colors.qualitative.Plotly
+    for i, (stage, rows) in enumerate(latency.groupby('stage')):
+        color = colors[i % len(colors)]
+        fig.add_trace(go.Scatter(x=rows['period'], y=rows['p50_ms'], name=f"{stage} p50",
+                                 mode='lines+markers', line=dict(color=color), legendgroup=stage))
+        fig.add_trace(go.Scatter(x=rows['period'], y=rows['p95_ms'], name=f"{stage} p95",
+                                 mode='lines', line=dict(color=color, dash='dot'), legendgroup=stage))
+    fig.update_layout(
+        template='plotly_dark',
+        height=450,
+        hovermode='x unified',
+        yaxis=dict(title="ms", automargin=True, type='log'),
+        xaxis=dict(title="", automargin=True, showgrid=False),
+    )
+    return fig
+
+
 def main():
         
     return 0
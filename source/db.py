@@ -1,28 +1,121 @@
-from source.cleanup import convert_currency,get_exchange_rate
+from source.cleanup import settlement_dates
+from source.fx import convert_column_asof
+from source.symbols import is_option, multipliers, with_symbol_info
+from source import metrics, nav, table_cache
 from config import settings 
 
 import sqlite3
 import pandas as pd
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import re
 import numpy as np
 from contextlib import contextmanager
 import yfinance as yf
 import functools
+import threading
+
+# --- Connection management ---
+# One long-lived connection per (thread, database path). PRAGMAs are applied once when the
+# connection is opened instead of on every helper call. Streamlit runs the script and its
+# fragments on different threads, so each thread keeps its own connection.
+_connections = {}
+_connections_lock = threading.Lock()
+_local = threading.local()
+
+
+def _open_connection(path: str):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    for pragma, value in settings.SQLITE_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma}={value};")
+    return conn
+
+
+def _prune_dead_threads():
+    """Close connections owned by threads that have exited (call with the lock held)."""
+    alive = {t.ident for t in threading.enumerate()}
+    for key in [k for k in _connections if k[0] not in alive]:
+        _connections.pop(key).close()
+
+
+def get_connection():
+    """Return this thread's persistent connection to the portfolio database."""
+    key = (threading.get_ident(), str(settings.MOOMOO_PORTFOLIO_DB_PATH))
+    conn = _connections.get(key)
+    if conn is None:
+        with _connections_lock:
+            _prune_dead_threads()
+            conn = _connections[key] = _open_connection(key[1])
+    return conn
+
+
+def close_connections():
+    """Close every pooled connection (e.g. at process exit or before deleting the db file)."""
+    with _connections_lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+
+
+def in_transaction() -> bool:
+    return getattr(_local, "tx_depth", 0) > 0
+
 
-# Manage the open and close of database
+@contextmanager
+def transaction():
+    """Unit of work: every write made in the block (through any db helper) is committed once
+    at the end, or rolled back together if an exception escapes. Blocks can be nested; only
+    the outermost one commits.
+    """
+    conn = get_connection()
+    depth = getattr(_local, "tx_depth", 0)
+    _local.tx_depth = depth + 1
+    if depth == 0:
+        _local.on_commit = []
+    try:
+        yield conn
+    except BaseException:
+        if depth == 0:
+            conn.rollback()
+            _local.on_commit = []
+        raise
+    else:
+        if depth == 0:
+            conn.commit()
+    finally:
+        _local.tx_depth = depth
+    if depth == 0:
+        callbacks, _local.on_commit = _local.on_commit, []
+        for callback in callbacks:
+            callback()
+
+
+def on_commit(callback):
+    """Run callback once the enclosing unit of work has committed (right away outside one).
+    Rolled-back transactions drop their callbacks."""
+    if in_transaction():
+        _local.on_commit.append(callback)
+    else:
+        callback()
+
+
+# Hand out the thread's pooled connection. Outside a transaction() block every call commits
+# on exit as before; inside one, committing is left to the enclosing unit of work.
 @contextmanager
 def db_contextmanager():
-    conn = sqlite3.connect(str(settings.MOOMOO_PORTFOLIO_DB_PATH),check_same_thread=False)
+    conn = get_connection()
     try:
-        conn.execute("PRAGMA journal_mode=WAL;")
         yield conn
     finally:
-        conn.commit()
-        conn.close()
+        if not in_transaction():
+            conn.commit()
 
 
 def init_db():
+    """Create and migrate the schema. Run once at startup (main(), dashboard start-up);
+    on a current database it costs a single PRAGMA user_version read."""
+    with db_contextmanager() as conn:
+        if schema_version(conn) >= SCHEMA_VERSION:
+            return
     # Create portfolio_snapshots table
     portfolio_snapshots_table ="""
     CREATE TABLE IF NOT EXISTS portfolio_snapshots (
@@ -111,6 +204,76 @@ def init_db():
     )
     """
 
+    # Which clearing dates have been fetched from OpenD, and whether they are settled (final)
+    cashflow_sync_table = """
+    CREATE TABLE IF NOT EXISTS cashflow_sync (
+        clearing_date TEXT PRIMARY KEY,
+        fetched_at TEXT,
+        rows NUMERIC,
+        is_final NUMERIC
+    )
+    """
+
+    # Daily closes and intraday spot rates per currency pair (e.g. USDSGD)
+    fx_rates_table = """
+    CREATE TABLE IF NOT EXISTS fx_rates (
+        Date TEXT,
+        Pair TEXT,
+        Rate NUMERIC,
+        Source TEXT,
+        PRIMARY KEY (Pair, Date)
+    )
+    """
+
+    # Per-ticker yfinance metadata, refreshed after settings.METADATA_TTL_DAYS
+    security_metadata_table = """
+    CREATE TABLE IF NOT EXISTS security_metadata (
+        Ticker TEXT PRIMARY KEY,
+        Sector TEXT,
+        Industry TEXT,
+        Country TEXT,
+        Market_Cap NUMERIC,
+        fetched_at TEXT
+    )
+    """
+
+    # Parsed symbols (see source/symbols.py); option-only columns are NULL for stocks/ETFs
+    symbols_table = """
+    CREATE TABLE IF NOT EXISTS symbols (
+        Symbol TEXT PRIMARY KEY,
+        Is_Option NUMERIC,
+        Ticker TEXT,
+        Underlying TEXT,
+        Expiry TEXT,
+        Put_Call TEXT,
+        Strike NUMERIC,
+        Multiplier NUMERIC
+    )
+    """
+
+    # Running realised P/L: each order's folded-in contribution, and the totals per instrument
+    realised_p_l_orders_table = """
+    CREATE TABLE IF NOT EXISTS realised_p_l_orders (
+        Order_ID TEXT PRIMARY KEY,
+        Symbol TEXT,
+        Market TEXT,
+        Currency TEXT,
+        Buy_Sell TEXT,
+        Quantity NUMERIC,
+        Price NUMERIC,
+        Change NUMERIC
+    )
+    """
+    realised_p_l_table = """
+    CREATE TABLE IF NOT EXISTS realised_p_l (
+        Symbol TEXT,
+        Market TEXT,
+        Currency TEXT,
+        Net_P_L NUMERIC,
+        PRIMARY KEY (Symbol, Market, Currency)
+    )
+    """
+
     # Create benchmark indices table
     benchmark_history_table = """
     CREATE TABLE IF NOT EXISTS benchmark_history (
@@ -125,6 +288,7 @@ def init_db():
     )
     """
 
+    _upsert_statements.clear()
     with db_contextmanager() as conn:
         cursor = conn.cursor()
         cursor.execute(portfolio_snapshots_table)
@@ -134,8 +298,13 @@ def init_db():
         cursor.execute(net_p_l_table)
         cursor.execute(transactions_table)
         cursor.execute(benchmark_history_table)
-        _ensure_cashflow_income_column(conn)
-        _migrate_net_p_l(conn)
+        cursor.execute(cashflow_sync_table)
+        cursor.execute(fx_rates_table)
+        cursor.execute(security_metadata_table)
+        cursor.execute(symbols_table)
+        cursor.execute(realised_p_l_orders_table)
+        cursor.execute(realised_p_l_table)
+        migrate(conn)
 
 def table_empty(table_name:str):
     with db_contextmanager() as conn:
@@ -146,55 +315,121 @@ def table_empty(table_name:str):
         count = cursor.fetchone()[0]
         return count == 0
 
+def _dataframe_rows(df: pd.DataFrame):
+    """Yield DataFrame rows as tuples of plain Python values (NaN -> NULL, datetimes -> TEXT)."""
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime('%Y-%m-%d %H:%M:%S')
+        values = series.to_numpy(dtype=object, copy=True)
+        values[series.isna().to_numpy()] = None
+        columns.append(values.tolist())
+    return zip(*columns)
+
+# Prepared upsert statements, keyed by (db path, table, columns). Cleared by init_db since
+# migrations can change a table's primary key.
+_upsert_statements = {}
+
+def _primary_key(conn, table_name: str):
+    info = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+    # Column 5 is the 1-based position of the column in the primary key (0 = not a key)
+    return [row[1] for row in sorted(info, key=lambda r: r[5]) if row[5] > 0]
+
+def _upsert_statement(conn, table_name: str, columns):
+    """Build (once) an INSERT ... ON CONFLICT DO UPDATE statement for the table's primary key."""
+    key = (str(settings.MOOMOO_PORTFOLIO_DB_PATH), table_name, tuple(columns))
+    sql = _upsert_statements.get(key)
+    if sql is None:
+        cols = ",".join(columns)
+        placeholders = ",".join("?" * len(columns))
+        sql = f"INSERT INTO {table_name} ({cols}) VALUES ({placeholders})"
+        pk = _primary_key(conn, table_name)
+        if pk and set(pk) <= set(columns):
+            updates = [c for c in columns if c not in pk]
+            if updates:
+                assignments = ",".join(f"{c}=excluded.{c}" for c in updates)
+                sql += f" ON CONFLICT ({','.join(pk)}) DO UPDATE SET {assignments}"
+            else:
+                sql += f" ON CONFLICT ({','.join(pk)}) DO NOTHING"
+        _upsert_statements[key] = sql
+    return sql
+
 def insert_dataframe(df:pd.DataFrame, table_name:str):
-    with db_contextmanager() as conn:
-        # Upload DataFrame to a staging table
-        df.to_sql('temp_staging', conn, if_exists='replace', index=False)
-        # Define columns in df to place in columns in sql db table
-        cols = ",".join(df.columns)
-        # Transfer data to the main table using INSERT OR REPLACE for an "upsert" operation
-        conn.execute(f"""
-            INSERT OR REPLACE INTO {table_name} ({cols})
-            SELECT {cols} FROM temp_staging
-        """)
-        conn.execute("DROP TABLE temp_staging")
+    """Upsert a DataFrame into table_name on the table's primary key.
+
+    Rows are streamed through one executemany call -- no staging table. Columns missing from
+    df keep their stored value on update. Returns (rows_inserted, rows_updated).
+    """
+    if df is None or df.empty:
+        return 0, 0
+    with metrics.span(f"insert.{table_name}", rows=len(df)), db_contextmanager() as conn:
+        sql = _upsert_statement(conn, table_name, list(df.columns))
+        # New rows always get a rowid above the current maximum, updated rows keep theirs
+        max_rowid = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table_name}").fetchone()[0]
+        changes_before = conn.total_changes
+        conn.executemany(sql, _dataframe_rows(df))
+        touched = conn.total_changes - changes_before
+        inserted = conn.execute(f"SELECT COUNT(*) FROM {table_name} WHERE rowid > ?", (max_rowid,)).fetchone()[0]
+    if table_name in table_cache.CACHED_TABLES:
+        # Keep the columnar read cache in step, once the rows are actually committed
+        on_commit(functools.partial(table_cache.sync, table_name, table_cache.years_of(table_name, df)))
+    if table_name in BENCHMARK_ALIGNED_SOURCES:
+        since = df[BENCHMARK_ALIGNED_SOURCES[table_name]].astype(str).str[:10].min()
+        # New bars can change every aligned close from their date on; snapshot writes only
+        # matter for dates that are not aligned yet (nav rewrites keep the dates)
+        on_commit(functools.partial(refresh_benchmark_aligned, since,
+                                    new_dates_only=table_name == 'portfolio_snapshots'))
+    return inserted, touched - inserted
 
 def read_db(query:str):
     with db_contextmanager() as conn:
         df = pd.read_sql_query(query, conn)
     return df
         
-def prev_nav_units():
-    query = "SELECT nav, units FROM portfolio_snapshots ORDER BY date DESC LIMIT 1"
-    prev_df = read_db(query)
-    if prev_df.empty:
-        return 0, 0
-    return prev_df.loc[0, 'nav'], prev_df.loc[0, 'units']
+def _is_final(date_str: str, today: date) -> bool:
+    return (today - datetime.strptime(date_str, '%Y-%m-%d').date()).days >= settings.CASHFLOW_FINAL_AFTER_DAYS
+
+def cashflow_dates_to_fetch(end_date: datetime, current_date: datetime):
+    """Settlement days between end_date and current_date (newest first) that still need an
+    OpenD query: never fetched, or fetched before they were final."""
+    dates = settlement_dates(end_date, current_date, settings.SETTLEMENT_HOLIDAYS)
+    final = set(read_db("SELECT clearing_date FROM cashflow_sync WHERE is_final = 1")['clearing_date'])
+    return [d for d in dates if d not in final]
 
+def mark_cashflow_synced(dates, cashflow: pd.DataFrame = None, now: datetime = None):
+    """Record fetched clearing dates in cashflow_sync (with their row counts).
 
-def net_cashflow(date_str: str):
-    query = f"SELECT cashflow_id, Date, Currency, Amount FROM cashflow where Date = '{date_str}' AND is_external = 1"
-    today_cf_df = read_db(query)
-    if not today_cf_df.empty:
-        today_cf_df['Amount'] = today_cf_df.apply(lambda x: convert_currency(x['Amount'], x['Currency'], 'SGD'), axis=1)
-    net_cash_flow = today_cf_df['Amount'].sum() if not today_cf_df.empty else 0.0
-    return net_cash_flow
+    A date is final once it is CASHFLOW_FINAL_AFTER_DAYS older than now (default: the clock).
+    """
+    if not dates:
+        return
+    counts = {}
+    if cashflow is not None and not cashflow.empty:
+        counts = cashflow.groupby('Date').size().to_dict()
+    now = now or datetime.now()
+    today = now.date()
+    sync_df = pd.DataFrame({
+        'clearing_date': list(dates),
+        'fetched_at': now.strftime('%Y-%m-%d %H:%M:%S'),
+        'rows': [counts.get(d, 0) for d in dates],
+        'is_final': [1 if _is_final(d, today) else 0 for d in dates],
+    })
+    insert_dataframe(sync_df, 'cashflow_sync')
 
 def calc_nav_units(current_date: datetime, snapshot_df: pd.DataFrame):
+    """NAV and units for today's snapshot (one step of the nav engine, see source/nav.py)."""
     total_assets = snapshot_df.loc[0, 'total_assets']
-    # Based on today's cash flow, DO the NAV calculation
     date_str = current_date.strftime('%Y-%m-%d')
-    net_cf = net_cashflow(date_str)
-    prev_nav, prev_units = prev_nav_units()
-    if prev_units == 0:
-        # First entry
-        new_units = 1000.0
-        new_nav = total_assets / new_units
-    else:
-        # New NAV = (Ending Value - Net Cash Flow) / Previous Units
-        # NAV only changed with market movement, not cash flow in/out
-        new_nav = (total_assets - net_cf) / prev_units
-        new_units = prev_units + (net_cf / new_nav)
+    # Previous snapshot strictly before today, so repeated ticks in a day don't compound
+    prev_df = read_db(f"SELECT date, nav, units FROM portfolio_snapshots WHERE date < '{date_str}' ORDER BY date DESC LIMIT 1")
+    prev_date = prev_df.loc[0, 'date'] if not prev_df.empty else None
+    # NaN / 0 units are re-seeded by nav_units
+    prev_units = prev_df.loc[0, 'units'] if not prev_df.empty else None
+    prev_nav = prev_df.loc[0, 'nav'] if not prev_df.empty else None
+    # Every external flow since the previous snapshot (weekend deposits included)
+    net_cf = nav.external_flows([date_str], after=prev_date)[0]
+    new_nav, new_units = (float(v[0]) for v in nav.nav_units([total_assets], [net_cf], prev_units, prev_nav))
     print(f"Update Complete. New NAV: {new_nav:.4f}, Net CF: {net_cf:.2f}, New Units: {new_units:.4f}")
     return new_nav, new_units
 
@@ -205,12 +440,18 @@ def historical_orders_data():
     df = read_db(query)
     return df
 
+def order_sync_start():
+    """Where an incremental historical order sync should start: the newest stored order time
+    minus ORDER_SYNC_OVERLAP_DAYS. None when nothing is stored yet (full sync needed)."""
+    latest = read_db("SELECT MAX(date_time) AS latest FROM historical_orders").iloc[0]['latest']
+    if latest is None or pd.isna(latest):
+        return None
+    return pd.to_datetime(latest).to_pydatetime() - timedelta(days=settings.ORDER_SYNC_OVERLAP_DAYS)
+
 # Calculate P/L for historical orders dataframe
 def calculate_change(row):
-        option_pattern = r'[A-Z]+\d{6}[CP]\d+'
         # Determine multiplier: 100 for options, 1 for stocks
-        is_option = re.search(option_pattern, str(row['Symbol']))
-        multiplier = 100 if is_option else 1
+        multiplier = option_multiplier(row['Symbol'])
         amount = row['Quantity'] * row['Current_Price'] * multiplier
         
         side = str(row['Buy_Sell']).upper()
@@ -227,9 +468,100 @@ def unrealised_p_l(today_date: datetime):
     return df
 
 
+def order_changes(orders: pd.DataFrame) -> np.ndarray:
+    """Vectorised calculate_change: signed, multiplier-aware amount of each order."""
+    multiplier = multipliers(orders['Symbol'].astype(str)).to_numpy()
+    side = orders['Buy_Sell'].astype(str).str.upper()
+    sign = np.select([side.str.contains('BUY', regex=False), side.str.contains('SELL', regex=False)],
+                     [-1, 1], default=0)
+    return (orders['Quantity'].to_numpy(dtype=float) * orders['Current_Price'].to_numpy(dtype=float)
+            * multiplier * sign)
+
+def sync_realised_p_l(full: bool = False):
+    """Fold new, changed or deleted historical orders into the running realised_p_l totals.
+
+    realised_p_l_orders remembers what each order contributed, so a re-synced order only
+    adds the difference, a moved one is taken off its old instrument and a deleted one is
+    taken off altogether. full=True rebuilds both tables from every stored order.
+    """
+    with transaction() as conn:
+        if full:
+            conn.execute("DELETE FROM realised_p_l_orders")
+            conn.execute("DELETE FROM realised_p_l")
+        orders = read_db("""
+            SELECT o.Order_ID, o.Symbol, o.Market, o.Currency, o.Buy_Sell, o.Quantity, o.Current_Price,
+                   r.Symbol AS old_Symbol, r.Market AS old_Market, r.Currency AS old_Currency,
+                   r.Change AS old_Change
+            FROM historical_orders o
+            LEFT JOIN realised_p_l_orders r ON r.Order_ID = o.Order_ID
+            WHERE r.Order_ID IS NULL
+               OR r.Symbol IS NOT o.Symbol OR r.Market IS NOT o.Market OR r.Currency IS NOT o.Currency
+               OR r.Buy_Sell IS NOT o.Buy_Sell OR r.Quantity IS NOT o.Quantity
+               OR r.Price IS NOT o.Current_Price
+        """)
+        gone = read_db("""
+            SELECT r.Order_ID, r.Symbol, r.Market, r.Currency, r.Change
+            FROM realised_p_l_orders r
+            LEFT JOIN historical_orders o ON o.Order_ID = r.Order_ID
+            WHERE o.Order_ID IS NULL
+        """)
+        if orders.empty and gone.empty:
+            return 0
+        orders['Change'] = order_changes(orders)
+
+        key = ['Symbol', 'Market', 'Currency']
+        added = orders[key + ['Change']]
+        moved = orders.loc[orders['old_Change'].notna(), ['old_' + k for k in key] + ['old_Change']]
+        moved.columns = key + ['Change']
+        removed = pd.concat([moved, gone[key + ['Change']]], ignore_index=True)
+        removed = removed.assign(Change=-removed['Change'])
+        delta = pd.concat([added, removed], ignore_index=True).groupby(key)['Change'].sum().reset_index()
+        conn.executemany(
+            "INSERT INTO realised_p_l (Symbol, Market, Currency, Net_P_L) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(Symbol, Market, Currency) DO UPDATE SET Net_P_L = Net_P_L + excluded.Net_P_L",
+            delta.itertuples(index=False, name=None))
+
+        if not orders.empty:
+            folded = orders.rename(columns={'Current_Price': 'Price'})
+            insert_dataframe(folded[['Order_ID'] + key + ['Buy_Sell', 'Quantity', 'Price', 'Change']],
+                             'realised_p_l_orders')
+        conn.executemany("DELETE FROM realised_p_l_orders WHERE Order_ID = ?",
+                         ((order_id,) for order_id in gone['Order_ID']))
+        # Instruments left without orders (all moved or deleted) drop out, as in net_p_l_full,
+        # instead of lingering as a 0 (or float-residue) total
+        conn.executemany("""
+            DELETE FROM realised_p_l
+            WHERE Symbol IS ? AND Market IS ? AND Currency IS ?
+              AND NOT EXISTS (SELECT 1 FROM realised_p_l_orders r
+                              WHERE r.Symbol IS realised_p_l.Symbol AND r.Market IS realised_p_l.Market
+                                AND r.Currency IS realised_p_l.Currency)
+        """, delta[key].itertuples(index=False, name=None))
+    print(f"Folded {len(orders)} order(s) into realised P/L, removed {len(gone)} deleted order(s).")
+    return len(orders) + len(gone)
+
+@metrics.timed()
 def net_p_l(today_date: datetime):
-    # Regex to identify options (Standard: Root + 6 digits + C/P + 8 digits)
-    option_pattern = r'[A-Z]+\d{6}[CP]\d+'
+    """Net P/L per instrument: running realised totals plus today's position values.
+
+    Same result as net_p_l_full, but only orders synced since the last call are processed.
+    """
+    sync_realised_p_l()
+    realised = read_db("SELECT Symbol, Market, Currency, Net_P_L FROM realised_p_l")
+    positions_mv = unrealised_p_l(today_date)
+    # Options count their unrealised P/L, stocks their market value (as net_p_l_full)
+    positions_mv = with_symbol_info(positions_mv, ['Is_Option'])
+    positions_mv['Net_P_L'] = np.where(positions_mv['Is_Option'].astype(bool), positions_mv['P_L'],
+                                       positions_mv['Market_Value'])
+    positions_mv = positions_mv[['Symbol', 'Market', 'Currency', 'Net_P_L']]
+
+    dfs = [df for df in [realised, positions_mv] if not df.empty]
+    net_P_L = pd.concat(dfs, ignore_index=True) if dfs else realised
+    net_P_L = net_P_L.groupby(['Symbol', 'Market', 'Currency'])[['Net_P_L']].sum().reset_index()
+    net_P_L['date'] = today_date.strftime('%Y-%m-%d')
+    return net_P_L
+
+def net_p_l_full(today_date: datetime):
+    """Reference implementation: recompute net P/L from every historical order."""
     historical_orders_p_l = historical_orders_data()
 
     # Calculate 'Change'
@@ -242,7 +574,7 @@ def net_p_l(today_date: datetime):
     # Get current positions market value and unrealised P/L to calculate net P/L
     positions_mv = unrealised_p_l(today_date)
     # Define condition if is option, if option use P_L, otherwise use Market_Vaue 
-    condition = positions_mv['Symbol'].astype(str).str.contains(option_pattern, regex=True)
+    condition = is_option(positions_mv['Symbol'].astype(str))
     positions_mv['Net_P_L'] = np.where(
         condition, 
         positions_mv['P_L'],          # Use value from 'P_L' column
@@ -274,12 +606,12 @@ def get_latest_db_date(today_date: datetime):
         
 
 def indices_exists(index_name: str):
-    query = "SELECT EXISTS (SELECT 1 FROM benchmark_history WHERE Symbol LIKE ?)"
-    search_term = f"%{index_name}%"
+    # Exact match so the (Symbol, Date) index is used; callers pass yfinance tickers
+    query = "SELECT EXISTS (SELECT 1 FROM benchmark_history WHERE Symbol = ?)"
     try:
         with db_contextmanager() as conn:
             cursor = conn.cursor()
-            cursor.execute(query, (search_term,))
+            cursor.execute(query, (index_name,))
             result = cursor.fetchone()
             
             return result[0] == 1 if result else False
@@ -293,13 +625,156 @@ def historical_close_prices(ticker: str,period: str, interval: str):
     data.reset_index(inplace=True)
     data['Symbol'] = ticker
     return data
-def update_indices(index_name: str,today_date = datetime.combine(date.today(), datetime.min.time())):
-    if indices_exists(index_name):
-        data = historical_close_prices(index_name, period='1mo',interval='1d')
-        insert_dataframe(data,'benchmark_history')
-    else: 
-        data = historical_close_prices(index_name, period='max',interval='1d')
-        insert_dataframe(data,'benchmark_history')
+BENCHMARK_COLUMNS = ['Date', 'Close', 'High', 'Low', 'Open', 'Volume', 'Symbol']
+
+def _download_benchmarks(symbols: list, **kwargs) -> pd.DataFrame:
+    """Daily bars for several symbols in one yfinance request, as benchmark_history rows."""
+    data = yf.download(tickers=symbols, interval='1d', progress=False, multi_level_index=True, **kwargs)
+    if data is None or data.empty:
+        return pd.DataFrame(columns=BENCHMARK_COLUMNS)
+    # (Price, Ticker) columns -> one row per (Date, Symbol); symbols without a bar that day are dropped
+    data = data.stack(level='Ticker').dropna(subset=['Close'])
+    data = data.rename_axis(index=['Date', 'Symbol']).reset_index()
+    return data.reindex(columns=BENCHMARK_COLUMNS)
+
+# (db path, symbol) -> (last close already requested through, last bar yfinance returned).
+# A symbol whose index had no session on that close (an exchange holiday) is not asked again
+# until a newer close is due
+_benchmarks_requested = {}
+
+def _already_requested(key, last_close, stored_last) -> bool:
+    requested = _benchmarks_requested.get(key)
+    if requested is None or requested[0] < last_close:
+        return False
+    returned_last = requested[1]
+    # Nothing newer was returned than what is stored (rows deleted since are fetched again)
+    return returned_last is None or (stored_last is not None and stored_last >= returned_last)
+
+@metrics.timed()
+def update_benchmarks(symbols=None, today_date=None) -> int:
+    """Bring benchmark_history up to date with at most two batched downloads.
+
+    Symbols with no stored history are fetched in full (period='max'). The rest resume from
+    their last stored bar, which is re-fetched since it may have been a partial (intraday) bar.
+    Nothing is requested when every symbol already has the previous business day's close, or
+    was already requested through it and yfinance had nothing newer (a holiday on that index).
+    Returns the number of rows stored.
+    """
+    symbols = list(symbols or indices_dict().values())
+    today = pd.Timestamp(today_date or date.today()).normalize()
+    stored = read_db("SELECT Symbol, MAX(Date) AS last_date FROM benchmark_history GROUP BY Symbol")
+    last_bar = dict(zip(stored['Symbol'], pd.to_datetime(stored['last_date'], format='mixed')))
+    last_close = today - pd.offsets.BDay(1)
+    db_key = str(settings.MOOMOO_PORTFOLIO_DB_PATH)
+    due = [s for s in symbols if not _already_requested((db_key, s), last_close, last_bar.get(s))]
+
+    new_symbols = [s for s in due if s not in last_bar]
+    behind = [s for s in due if s in last_bar and last_bar[s] < last_close]
+    frames = []
+    try:
+        if new_symbols:
+            frames.append(_download_benchmarks(new_symbols, period='max'))
+        if behind:
+            start = min(last_bar[s] for s in behind)
+            data = _download_benchmarks(behind, start=start.strftime('%Y-%m-%d'),
+                                        end=(today + timedelta(days=1)).strftime('%Y-%m-%d'))
+            # One start date serves every symbol; keep only bars from each symbol's own last one
+            frames.append(data[pd.to_datetime(data['Date']) >= data['Symbol'].map(last_bar)])
+        returned = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=BENCHMARK_COLUMNS)
+        returned_last = pd.to_datetime(returned['Date'], format='mixed').groupby(returned['Symbol']).max()
+        for s in new_symbols + behind:
+            _benchmarks_requested[(db_key, s)] = (last_close, returned_last.get(s, last_bar.get(s)))
+    except Exception as e:
+        print(f"Error fetching benchmark history: {e}")
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return 0
+    data = pd.concat(frames, ignore_index=True)
+    insert_dataframe(data, 'benchmark_history')
+    return len(data)
+
+# Tables whose writes change benchmark_aligned -> their date column
+BENCHMARK_ALIGNED_SOURCES = {'portfolio_snapshots': 'date', 'benchmark_history': 'Date'}
+
+def align_benchmarks(dates, bars: pd.DataFrame) -> pd.DataFrame:
+    """Each symbol's close as of each date (sorted YYYY-MM-DD strings), as benchmark_aligned rows.
+
+    The close is the symbol's last bar on or before the date; dates before its first bar take
+    the first bar. bars are benchmark_history rows (Date, Symbol, Close).
+    """
+    dates = np.asarray(dates, dtype=str)
+    if len(dates) == 0 or bars.empty:
+        return pd.DataFrame(columns=['date', 'Symbol', 'Close'])
+    bars = bars.assign(Date=bars['Date'].astype(str).str[:10]).sort_values(['Symbol', 'Date'])
+    frames = []
+    for symbol, rows in bars.groupby('Symbol', sort=True):
+        last = np.searchsorted(rows['Date'].to_numpy(dtype=str), dates, side='right') - 1
+        close = rows['Close'].to_numpy(dtype=float)[np.maximum(last, 0)]
+        frames.append(pd.DataFrame({'date': dates, 'Symbol': symbol, 'Close': close}))
+    return pd.concat(frames, ignore_index=True)
+
+def _bars_since(conn, since: str) -> pd.DataFrame:
+    # Bars from `since` on, plus each symbol's last bar before it (SQLite returns the Close
+    # of the MAX(Date) row)
+    return pd.read_sql_query(
+        "SELECT Date, Symbol, Close FROM benchmark_history WHERE Date >= ? "
+        "UNION ALL SELECT MAX(Date), Symbol, Close FROM benchmark_history WHERE Date < ? GROUP BY Symbol",
+        conn, params=(since, since))
+
+def _snapshot_dates(conn, query: str, params=()) -> list:
+    return [str(row[0])[:10] for row in conn.execute(query + " ORDER BY date", params)]
+
+def _align_into(conn, since: str = None, new_dates_only: bool = False) -> int:
+    if since is not None and new_dates_only:
+        dates = _snapshot_dates(conn, "SELECT date FROM portfolio_snapshots WHERE date >= ? "
+                                      "AND date NOT IN (SELECT date FROM benchmark_aligned WHERE date >= ?)",
+                                (since, since))
+        if not dates:
+            return 0
+        bars = _bars_since(conn, dates[0])
+    elif since is not None:
+        bars = _bars_since(conn, since)
+        aligned_symbols = {row[0] for row in conn.execute("SELECT DISTINCT Symbol FROM benchmark_aligned")}
+        # A symbol seen for the first time needs rows before `since` as well
+        if set(bars['Symbol']) <= aligned_symbols:
+            dates = _snapshot_dates(conn, "SELECT date FROM portfolio_snapshots WHERE date >= ?", (since,))
+        else:
+            since = None
+    if since is None:
+        bars = pd.read_sql_query("SELECT Date, Symbol, Close FROM benchmark_history", conn)
+        dates = _snapshot_dates(conn, "SELECT date FROM portfolio_snapshots")
+        conn.execute("DELETE FROM benchmark_aligned")
+    aligned = align_benchmarks(dates, bars)
+    conn.executemany(
+        "INSERT INTO benchmark_aligned (date, Symbol, Close) VALUES (?, ?, ?) "
+        "ON CONFLICT (date, Symbol) DO UPDATE SET Close = excluded.Close",
+        aligned.itertuples(index=False, name=None))
+    return len(aligned)
+
+def refresh_benchmark_aligned(since: str = None, new_dates_only: bool = False) -> int:
+    """Bring benchmark_aligned up to date for snapshot dates on or after since (all if None).
+
+    Run after every write to portfolio_snapshots or benchmark_history (see insert_dataframe);
+    new_dates_only skips dates that are already aligned. Returns the number of rows written.
+    """
+    with metrics.span("refresh_benchmark_aligned") as record, db_contextmanager() as conn:
+        record.rows = _align_into(conn, since, new_dates_only)
+    return record.rows
+
+def benchmark_aligned_matrix():
+    """benchmark_aligned as (dates, symbols, closes), closes a float matrix of date x symbol.
+
+    Built with one scatter into a NaN matrix rather than a pivot.
+    """
+    df = read_db("SELECT date, Symbol, Close FROM benchmark_aligned")
+    date_codes, dates = pd.factorize(df['date'], sort=True)
+    symbol_codes, symbols = pd.factorize(df['Symbol'], sort=True)
+    closes = np.full((len(dates), len(symbols)), np.nan)
+    closes[date_codes, symbol_codes] = df['Close'].to_numpy(dtype=float)
+    return np.asarray(dates, dtype=str), list(symbols), closes
+
+def update_indices(index_name: str,today_date = None):
+    update_benchmarks([index_name], today_date)
 
 def indices_dict():
     indices_dict = {
@@ -328,6 +803,27 @@ def _ensure_cashflow_income_column(conn):
         print("Migrated: added is_income column to cashflow table.")
 
 
+def _seed_cashflow_sync(conn):
+    """Backfill cashflow_sync for databases created before it existed.
+
+    Older versions fetched every day from START_DATE on first run, so all settlement days up
+    to the newest stored cash flow are known to be fetched already.
+    """
+    if conn.execute("SELECT EXISTS (SELECT 1 FROM cashflow_sync)").fetchone()[0]:
+        return
+    latest = conn.execute("SELECT MAX(Date) FROM cashflow").fetchone()[0]
+    if not latest:
+        return
+    today = date.today()
+    dates = settlement_dates(settings.START_DATE, datetime.strptime(latest, '%Y-%m-%d'),
+                             settings.SETTLEMENT_HOLIDAYS)
+    conn.executemany(
+        "INSERT OR IGNORE INTO cashflow_sync (clearing_date, fetched_at, rows, is_final) VALUES (?, NULL, NULL, ?)",
+        [(d, 1 if _is_final(d, today) else 0) for d in dates],
+    )
+    print(f"Migrated: seeded cashflow_sync with {len(dates)} already-fetched clearing dates.")
+
+
 def reclassify_cashflow():
     """Recompute is_external / is_income for ALL existing cashflow rows using the
     current classification rules in cleanup.classify_cashflow.
@@ -335,17 +831,24 @@ def reclassify_cashflow():
     Run once to backfill the corrected flags (e.g. old Coupon rows that were
     mislabelled as external capital flows). Idempotent -- safe to rerun.
     """
-    from source.cleanup import classify_cashflow
-    with db_contextmanager() as conn:
+    from source.cleanup import classify_cashflows
+    with transaction() as conn:
         _ensure_cashflow_income_column(conn)
-        rows = conn.execute("SELECT cashflow_id, Type, Remark FROM cashflow").fetchall()
-        for cid, ctype, remark in rows:
-            ext, inc = classify_cashflow(ctype, remark)
-            conn.execute(
-                "UPDATE cashflow SET is_external = ?, is_income = ? WHERE cashflow_id = ?",
-                (1 if ext else 0, 1 if inc else 0, cid),
-            )
-    print(f"Reclassified {len(rows)} cashflow rows.")
+        rows = pd.read_sql_query("SELECT cashflow_id, Type, Remark, Date, is_external, is_income FROM cashflow", conn)
+        ext, inc = classify_cashflows(rows['Type'], rows['Remark'])
+        # Only rows whose flags actually move are written, in one executemany
+        was_ext = pd.to_numeric(rows['is_external']).fillna(-1).to_numpy()
+        was_inc = pd.to_numeric(rows['is_income']).fillna(-1).to_numpy()
+        changed = (was_ext != ext) | (was_inc != inc)
+        conn.executemany(
+            "UPDATE cashflow SET is_external = ?, is_income = ? WHERE cashflow_id = ?",
+            zip(ext[changed].tolist(), inc[changed].tolist(), rows['cashflow_id'][changed].tolist()),
+        )
+        # External flows drive NAV/units: rebuild the series from the earliest affected day
+        moved_external = was_ext != ext
+        if moved_external.any():
+            nav.recompute_nav(rows['Date'][moved_external].min())
+    print(f"Reclassified {len(rows)} cashflow rows ({int(changed.sum())} changed).")
 
 
 def get_inception_date():
@@ -369,18 +872,14 @@ def income_by_date(to_currency: str = "SGD"):
     df = read_db("SELECT Date, Currency, Amount FROM cashflow WHERE is_income = 1")
     if df.empty:
         return pd.DataFrame(columns=["Date", "Amount", "Cumulative"])
-    df["Amount"] = df.apply(
-        lambda x: convert_currency(x["Amount"], x["Currency"], to_currency), axis=1
-    )
+    # Each income row is converted at the rate of its own date, not today's spot rate
+    df["Amount"] = convert_column_asof(df["Amount"], df["Currency"], df["Date"], to_currency)
     df = df.groupby("Date")["Amount"].sum().reset_index().sort_values("Date").reset_index(drop=True)
     df["Cumulative"] = df["Amount"].cumsum().round(2)
     return df
 
 
 
-OPTION_PATTERN = r'[A-Z]+\d{6}[CP]\d+'
-
-
 def _migrate_net_p_l(conn):
     """Migrate the net_p_l table to include a date column (preserve P/L history).
 
@@ -415,9 +914,113 @@ def _migrate_net_p_l(conn):
     print("Migrated: net_p_l is now date-stamped (realized P/L history preserved).")
 
 
+# Secondary indexes for the hot read paths (checked by tests/test_query_plans.py)
+HOT_QUERY_INDEXES = [
+    # positions WHERE date = ? (PRIMARY KEY is (Symbol, date), which cannot serve it)
+    "CREATE INDEX IF NOT EXISTS idx_positions_date ON positions (date)",
+    # nav.external_flows (each tick, via calc_nav_units): covers Date > ? AND is_external = 1
+    # without touching the table
+    "CREATE INDEX IF NOT EXISTS idx_cashflow_external "
+    "ON cashflow (Date, is_external, Currency, Amount, cashflow_id)",
+    # income_by_date: partial covering index over the income rows only
+    "CREATE INDEX IF NOT EXISTS idx_cashflow_income ON cashflow (Date, Currency, Amount) WHERE is_income = 1",
+    # trade ledger ORDER BY date_time DESC, and the order-sync MAX(date_time)
+    "CREATE INDEX IF NOT EXISTS idx_transactions_date_time ON transactions (date_time)",
+    "CREATE INDEX IF NOT EXISTS idx_historical_orders_date_time ON historical_orders (date_time)",
+    # benchmark lookups by symbol, and the per-symbol MAX(Date) of update_benchmarks
+    "CREATE INDEX IF NOT EXISTS idx_benchmark_history_symbol_date ON benchmark_history (Symbol, Date)",
+]
+
+
+def _add_hot_query_indexes(conn):
+    for statement in HOT_QUERY_INDEXES:
+        conn.execute(statement)
+    print("Migrated: added indexes for the hot queries.")
+
+
+def _create_pipeline_metrics(conn):
+    """Timed pipeline stages (see source/metrics.py), one row per span."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pipeline_metrics (
+            run_id TEXT,
+            stage TEXT,
+            started_at TEXT,
+            duration_ms REAL,
+            rows INTEGER,
+            cache_hits INTEGER,
+            error TEXT
+        )
+        """
+    )
+    # Dashboard time window and retention pruning both filter on started_at
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_metrics_started_at ON pipeline_metrics (started_at)")
+    print("Migrated: added the pipeline_metrics table.")
+
+
+def _create_benchmark_aligned(conn):
+    """Benchmark closes as of every snapshot date (see refresh_benchmark_aligned), for the
+    dashboard's performance comparison."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS benchmark_aligned (
+            date TEXT,
+            Symbol TEXT,
+            Close REAL,
+            PRIMARY KEY (date, Symbol)
+        )
+        """
+    )
+    _align_into(conn)
+    print("Migrated: added the benchmark_aligned table.")
+
+
+def _add_security_metadata_failed(conn):
+    """Flag failed metadata fetches, so they are retried after METADATA_RETRY_HOURS instead of
+    on every refresh (see source/metadata.py)."""
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(security_metadata)")]
+    if "failed" not in cols:
+        conn.execute("ALTER TABLE security_metadata ADD COLUMN failed NUMERIC DEFAULT 0")
+        print("Migrated: added failed column to security_metadata table.")
+
+
+def _drop_benchmark_history_cache(conn):
+    """benchmark_history is no longer read through the Parquet cache (comparison_df reads
+    benchmark_aligned), so its orphaned cache directory is removed."""
+    table_cache.drop('benchmark_history')
+
+
+# Versioned schema migrations, tracked in PRAGMA user_version. Each step runs once, in order,
+# on databases older than its version. Append new steps; never renumber or reorder them.
+MIGRATIONS = [
+    (1, _ensure_cashflow_income_column),
+    (2, _migrate_net_p_l),
+    (3, _seed_cashflow_sync),
+    (4, _add_hot_query_indexes),
+    (5, _create_pipeline_metrics),
+    (6, _create_benchmark_aligned),
+    (7, _add_security_metadata_failed),
+    (8, _drop_benchmark_history_cache),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Bring the schema up to SCHEMA_VERSION (tables must already exist)."""
+    version = schema_version(conn)
+    for target, step in MIGRATIONS:
+        if target > version:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+
+
 def option_multiplier(symbol: str) -> int:
-    """Return the contract multiplier: 100 for options, 1 for stocks/ETFs."""
-    return 100 if re.search(OPTION_PATTERN, str(symbol)) else 1
+    """Return the contract multiplier: 100 for options, 1 for stocks/ETFs (see symbols.parse_symbols)."""
+    return int(multipliers(pd.Series([str(symbol)])).iloc[0])
 
 
 def transaction_gross_amount(symbol, side, quantity, fill_price):
@@ -431,23 +1034,40 @@ def transaction_gross_amount(symbol, side, quantity, fill_price):
     return round(quantity * fill_price * mult * sign, 2)
 
 
-def sync_transactions():
-    """(Re)build the buy/sell audit `transactions` ledger from historical_orders.
+def transaction_amounts(orders: pd.DataFrame):
+    """Vectorised (Multiplier, Gross_Amount) for a batch of orders -- same rules as
+    option_multiplier / transaction_gross_amount, without a Python call per row."""
+    multiplier = multipliers(orders["Symbol"].astype(str)).to_numpy()
+    side = orders["Buy_Sell"].astype(str).str.strip().str.upper()
+    sign = np.where(side.isin(["BUY", "BUY_BACK"]), -1, 1)
+    gross = (orders["Quantity"].to_numpy(dtype=float) * orders["Current_Price"].to_numpy(dtype=float)
+             * multiplier * sign).round(2)
+    return multiplier, gross
+
+
+def sync_transactions(full: bool = False):
+    """Maintain the buy/sell audit `transactions` ledger from historical_orders.
 
     Each filled order becomes one row with a multiplier-aware, sign-conventioned
     Gross_Amount: SELL / SELL_SHORT = + (cash in), BUY / BUY_BACK = - (cash out).
-    Idempotent -- ordered by Order_ID, safe to re-run on every update.
+    Only orders missing from the ledger, or whose fill changed, are processed, so the cost
+    tracks the new batch rather than the whole history. full=True rebuilds every row.
     """
-    df = read_db("SELECT * FROM historical_orders")
+    query = "SELECT o.* FROM historical_orders o"
+    if not full:
+        query += """
+            LEFT JOIN transactions t ON t.Order_ID = o.Order_ID
+            WHERE t.Order_ID IS NULL
+               OR t.Quantity IS NOT o.Quantity
+               OR t.Fill_Price IS NOT o.Current_Price
+               OR t.Buy_Sell IS NOT o.Buy_Sell
+               OR t.date_time IS NOT o.date_time
+        """
+    df = read_db(query)
     if df.empty:
-        print("No historical orders to sync into transactions ledger.")
+        print("Transactions ledger is up to date.")
         return
-    df = df.copy()
-    df["Multiplier"] = df["Symbol"].apply(option_multiplier)
-    df["Gross_Amount"] = [
-        transaction_gross_amount(s, b, q, p)
-        for s, b, q, p in zip(df["Symbol"], df["Buy_Sell"], df["Quantity"], df["Current_Price"])
-    ]
+    df["Multiplier"], df["Gross_Amount"] = transaction_amounts(df)
     df = df.rename(columns={"Current_Price": "Fill_Price"})
     df = df[["Order_ID", "date_time", "Symbol", "Name", "Market", "Buy_Sell",
              "Quantity", "Fill_Price", "Multiplier", "Gross_Amount", "Currency"]]
@@ -455,8 +1075,23 @@ def sync_transactions():
     print(f"Synced {len(df)} rows into the transactions (audit) ledger.")
 
 
-def main():
-    return 0
+SCHEMA_TABLES = ['portfolio_snapshots', 'positions', 'historical_orders', 'cashflow', 'net_p_l', 'transactions',
+                 'benchmark_history', 'cashflow_sync', 'fx_rates', 'security_metadata', 'symbols',
+                 'realised_p_l_orders', 'realised_p_l', 'pipeline_metrics', 'benchmark_aligned']
 
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+
+def verify_schema():
+    """Problems found in the database schema, as messages (empty when it is current)."""
+    problems = []
+    with db_contextmanager() as conn:
+        version = schema_version(conn)
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")}
+    if version < SCHEMA_VERSION:
+        pending = [step.__name__ for target, step in MIGRATIONS if target > version]
+        problems.append(f"Schema version {version} is behind {SCHEMA_VERSION}; pending: {', '.join(pending)}")
+    elif version > SCHEMA_VERSION:
+        problems.append(f"Schema version {version} is newer than this code ({SCHEMA_VERSION})")
+    problems += [f"Missing table: {t}" for t in SCHEMA_TABLES if t not in existing]
+    indexes = [re.search(r'EXISTS (\w+)', statement).group(1) for statement in HOT_QUERY_INDEXES]
+    problems += [f"Missing index: {i}" for i in indexes if i not in existing]
+    return problems
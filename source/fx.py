@@ -0,0 +1,259 @@
+"""Currency conversion.
+
+Rates are resolved once per distinct currency and applied to whole columns with a single
+vectorised multiply, instead of one convert_currency call per row. Daily and spot rates are
+persisted in the fx_rates table, so historical (as-of-date) conversions are served from an
+in-memory index, and conversions keep working offline from the last stored rate.
+"""
+from datetime import datetime, date, timedelta
+from typing import Optional
+import functools
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from config import settings
+from source import metrics
+
+# Last resort when yfinance is unreachable AND nothing is stored in fx_rates yet
+FALLBACK_RATES = {"USD": {"SGD": 1.28}, "SGD": {"USD": 0.78}}
+
+# db path -> {pair: (sorted datetime64 array, rate array)}; rebuilt after every write
+_index_cache = {}
+# pair -> timestamp of the stored rate used because a live rate was unavailable
+_stale_rates = {}
+# pair -> oldest stored close used across a gap of more than FX_STALE_AFTER_DAYS in the
+# history (see convert_column_asof); cleared once a conversion finds the gap filled
+_rate_gaps = {}
+# (db path, pair) -> earliest daily close already requested from yfinance. Bars before the
+# first one yfinance returned (a weekend or holiday start, or no history) are not asked for again
+_requested_from = {}
+# A start this many business days before the first stored close counts as covered
+BACKFILL_START_SLACK = pd.offsets.BDay(3)
+
+
+def fx_ticker(from_currency: str, to_currency: str) -> str:
+    """yfinance symbol quoting 1 unit of from_currency in to_currency, e.g. USDSGD=X."""
+    return f"{from_currency}{to_currency}=X"
+
+
+def pair_name(from_currency: str, to_currency: str) -> str:
+    return f"{from_currency}{to_currency}"
+
+
+def _fallback_rate(from_currency: str, to_currency: str) -> float:
+    return FALLBACK_RATES.get(from_currency, {}).get(to_currency, 1.0)
+
+
+# --- Persistent rate store (fx_rates table) ---
+def _store_rates(rates: pd.DataFrame):
+    """Upsert [Date, Pair, Rate, Source] rows into fx_rates and drop the in-memory index."""
+    from source import db
+    try:
+        db.insert_dataframe(rates, 'fx_rates')
+    except Exception as e:
+        print(f"Error storing exchange rates: {e}")
+    _index_cache.pop(str(settings.MOOMOO_PORTFOLIO_DB_PATH), None)
+
+
+def _rate_index() -> dict:
+    """All stored rates, loaded once per process (and after writes) into sorted arrays per pair."""
+    from source import db
+    key = str(settings.MOOMOO_PORTFOLIO_DB_PATH)
+    if key not in _index_cache:
+        index = {}
+        try:
+            df = db.read_db("SELECT Pair, Date, Rate FROM fx_rates ORDER BY Pair, Date")
+        except Exception as e:
+            print(f"Error loading stored exchange rates: {e}")
+            df = pd.DataFrame(columns=["Pair", "Date", "Rate"])
+        df["Date"] = pd.to_datetime(df["Date"], format="mixed")
+        for pair, group in df.groupby("Pair"):
+            index[pair] = (group["Date"].to_numpy(dtype="datetime64[ns]"), group["Rate"].to_numpy(dtype=float))
+        _index_cache[key] = index
+    return _index_cache[key]
+
+
+def rates_asof(pair: str, when) -> tuple:
+    """Stored rate in force at each timestamp in `when` (latest on or before it).
+
+    Returns (rates, rate_dates) arrays; NaN / NaT where nothing is stored that early.
+    """
+    when = np.asarray(when, dtype="datetime64[ns]")
+    dates, rates = _rate_index().get(pair, (np.array([], dtype="datetime64[ns]"), np.array([])))
+    pos = np.searchsorted(dates, when, side="right") - 1
+    found = pos >= 0
+    out_rates = np.full(len(when), np.nan)
+    out_dates = np.full(len(when), np.datetime64("NaT"), dtype="datetime64[ns]")
+    out_rates[found] = rates[pos[found]]
+    out_dates[found] = dates[pos[found]]
+    return out_rates, out_dates
+
+
+def stale_rates() -> dict:
+    """Pairs currently converted with a stored (or hard-coded) rate instead of a live one,
+    mapped to the timestamp of that rate (None = hard-coded fallback)."""
+    return dict(_stale_rates)
+
+
+def rate_gaps() -> dict:
+    """Pairs whose last as-of conversion used a close more than FX_STALE_AFTER_DAYS older than
+    the row it converted, mapped to the oldest such close."""
+    return dict(_rate_gaps)
+
+
+def _flag_stale(pair: str, rate_date):
+    _stale_rates[pair] = rate_date
+    print(f"Warning: live {pair} rate unavailable, using rate from {rate_date or 'built-in fallback'}.")
+
+
+def backfill_fx_rates(from_currencies, to_currency: str = "SGD", start=None, end=None) -> int:
+    """Bulk-download missing daily closes for every pair in ONE yfinance request and store them.
+
+    Each pair resumes from its latest stored daily close (re-fetched, since it may have been a
+    partial bar), or from `start` if nothing that early is stored. No request is made when
+    every pair already has the previous business day's close. Returns rows stored.
+    """
+    from source import db
+    pairs = sorted({c for c in from_currencies if c and c != to_currency})
+    if not pairs:
+        return 0
+    start = pd.Timestamp(start or settings.START_DATE).normalize()
+    end = pd.Timestamp(end or date.today()).normalize()
+    try:
+        stored = db.read_db("SELECT Pair, MIN(Date) AS first, MAX(Date) AS last FROM fx_rates "
+                            "WHERE Source = 'daily' GROUP BY Pair").set_index("Pair")
+    except Exception:
+        stored = pd.DataFrame(columns=["first", "last"])
+    db_key = str(settings.MOOMOO_PORTFOLIO_DB_PATH)
+    fetch_from = []
+    for ccy in pairs:
+        pair = pair_name(ccy, to_currency)
+        requested = _requested_from.get((db_key, pair))
+        covered = pair in stored.index and (
+            start + BACKFILL_START_SLACK >= pd.Timestamp(stored.loc[pair, "first"])
+            or (requested is not None and start >= requested))
+        fetch_from.append(pd.Timestamp(stored.loc[pair, "last"]) if covered else start)
+    fetch_start = min(fetch_from)
+    # Closes are only final up to the previous business day; nothing newer to fetch
+    if fetch_start >= end - pd.offsets.BDay(1):
+        return 0
+    tickers = {fx_ticker(ccy, to_currency): pair_name(ccy, to_currency) for ccy in pairs}
+    try:
+        data = yf.download(tickers=list(tickers), start=fetch_start.strftime("%Y-%m-%d"),
+                           end=(end + timedelta(days=1)).strftime("%Y-%m-%d"), interval='1d',
+                           auto_adjust=True, progress=False, multi_level_index=True)
+    except Exception as e:
+        print(f"Error fetching exchange rate history: {e}")
+        return 0
+    for pair in tickers.values():
+        key = (db_key, pair)
+        _requested_from[key] = min(fetch_start, _requested_from.get(key, fetch_start))
+    if data.empty:
+        return 0
+    close = data["Close"].rename(columns=tickers)
+    rates = close.rename_axis(index="Date", columns="Pair").stack().dropna().rename("Rate").reset_index()
+    rates["Date"] = pd.to_datetime(rates["Date"]).dt.strftime("%Y-%m-%d")
+    rates["Rate"] = rates["Rate"].round(4)
+    rates["Source"] = "daily"
+    _store_rates(rates)
+    return len(rates)
+
+
+# Cache last 16, and every hour, according to datetime object
+@functools.lru_cache(maxsize=16)
+@metrics.timed('fx.get_exchange_rate')
+def get_exchange_rate(from_currency:str,to_currency:str,current_hour_tag):
+    """Live rate (latest daily bar, which yfinance updates intraday), stored in fx_rates.
+
+    When yfinance is unavailable, the latest stored rate is used and flagged as stale.
+    """
+    if from_currency == to_currency:
+        return 1.0
+    pair = pair_name(from_currency, to_currency)
+    try:
+        price_data = yf.download(tickers=fx_ticker(from_currency, to_currency), period='5d',
+                                auto_adjust=True,
+                                interval='1d',
+                                progress=False)
+        if not price_data.empty:
+            # Forward-fill to propagate the last valid price, then select the last row.
+            rate = price_data['Close'].ffill().iloc[-1].round(decimals=3).item()
+            _store_rates(pd.DataFrame({"Date": [datetime.now().strftime("%Y-%m-%d %H:%M:%S")],
+                                       "Pair": [pair], "Rate": [rate], "Source": ["spot"]}))
+            _stale_rates.pop(pair, None)
+            return rate
+    except Exception as e:
+        print(f"Error fetching exchange rate: {e}")
+    # Offline: fall back to the last stored rate, then to the built-in approximation
+    rates, rate_dates = rates_asof(pair, [np.datetime64(datetime.now())])
+    if not np.isnan(rates[0]):
+        _flag_stale(pair, pd.Timestamp(rate_dates[0]))
+        return float(rates[0])
+    _flag_stale(pair, None)
+    return _fallback_rate(from_currency, to_currency)
+
+
+def _hour_tag() -> str:
+    return datetime.now().strftime("%Y-%m-%d-%H")
+
+
+def convert_currency(value, from_currency:str, to_currency:str,current_hour_tag = None) -> Optional[float]:
+    """Converts a given amount from one currency to another."""
+    # Set the current hour tag for caching for get_exchange_rate
+    if current_hour_tag is None:
+        current_hour_tag = _hour_tag()
+    rate = get_exchange_rate(from_currency, to_currency,current_hour_tag)
+    if rate:
+        converted_amount = value * rate
+        return round(converted_amount, 2)
+    else:
+        return None
+
+
+def rate_map(currencies: pd.Series, to_currency: str = "SGD") -> dict:
+    """Spot rate to to_currency for every distinct currency in the column (one lookup each)."""
+    hour_tag = _hour_tag()
+    return {ccy: get_exchange_rate(ccy, to_currency, hour_tag) for ccy in pd.unique(currencies.dropna())}
+
+
+def convert_column(amounts: pd.Series, currencies: pd.Series, to_currency: str = "SGD") -> pd.Series:
+    """Convert a column of amounts at today's spot rates, rounded to 2 dp like convert_currency."""
+    rates = currencies.map(rate_map(currencies, to_currency)).astype(float)
+    return (amounts.astype(float) * rates).round(2)
+
+
+def convert_column_asof(amounts: pd.Series, currencies: pd.Series, dates: pd.Series,
+                        to_currency: str = "SGD") -> pd.Series:
+    """Convert each amount at the rate in force on its own date (latest stored close on or
+    before it), served from the in-memory fx_rates index after a bulk backfill of any gap.
+
+    Rows with no stored rate fall back to the spot rate; stored rates more than
+    FX_STALE_AFTER_DAYS older than the row are reported by rate_gaps().
+    """
+    if amounts.empty:
+        return amounts.astype(float)
+    when = pd.to_datetime(dates).to_numpy(dtype="datetime64[ns]")
+    ccys = currencies.to_numpy(dtype=object)
+    # Look back a week so rows on a weekend/holiday still find the previous close
+    backfill_fx_rates(pd.unique(ccys), to_currency, pd.Timestamp(when.min()) - timedelta(days=7),
+                      pd.Timestamp(when.max()))
+    rate = np.where(ccys == to_currency, 1.0, np.nan)
+    stale_after = np.timedelta64(settings.FX_STALE_AFTER_DAYS, "D")
+    for ccy in pd.unique(ccys):
+        if ccy == to_currency or pd.isna(ccy):
+            continue
+        mask = ccys == ccy
+        pair_rates, rate_dates = rates_asof(pair_name(ccy, to_currency), when[mask])
+        pair = pair_name(ccy, to_currency)
+        gaps = (when[mask] - rate_dates) > stale_after
+        if gaps.any():
+            _rate_gaps[pair] = pd.Timestamp(rate_dates[gaps].min())
+            print(f"Warning: {pair} history has a gap, converting with the close of {_rate_gaps[pair]:%Y-%m-%d}.")
+        else:
+            _rate_gaps.pop(pair, None)
+        if np.isnan(pair_rates).any():
+            pair_rates[np.isnan(pair_rates)] = get_exchange_rate(ccy, to_currency, _hour_tag())
+        rate[mask] = pair_rates
+    return pd.Series((amounts.to_numpy(dtype=float) * rate).round(2), index=amounts.index)
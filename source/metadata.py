@@ -0,0 +1,86 @@
+"""Security metadata (sector, industry, country, market cap) for position tickers.
+
+yfinance's Ticker.info is one slow HTTP round trip per ticker, so it is fetched once per
+ticker, in parallel on a bounded thread pool, and persisted in the security_metadata table.
+Rows are re-fetched only after METADATA_TTL_DAYS. A failed fetch is stored too (failed = 1,
+keeping any older values) and retried only after METADATA_RETRY_HOURS.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+import yfinance as yf
+
+from config import settings
+from source import db
+
+METADATA_COLUMNS = ['Ticker', 'Sector', 'Industry', 'Country', 'Market_Cap']
+
+
+def _fetch_info(ticker: str):
+    try:
+        return yf.Ticker(ticker).info
+    except Exception as e:
+        print(f"Error fetching metadata for {ticker}: {e}")
+        return None
+
+
+def info_to_metadata(ticker: str, info: dict) -> dict:
+    """Pick the dashboard fields out of a yfinance .info dict."""
+    # ETFs have no sector/industry; use the fund category (or family) for both
+    if info.get('quoteType', 'UNKNOWN') == 'ETF':
+        sector = industry = info.get('category', info.get('fundFamily', 'Index/Fund'))
+    else:
+        sector = info.get('sector', 'Other')
+        industry = info.get('industry', 'Other')
+    return {'Ticker': ticker, 'Sector': sector, 'Industry': industry,
+            'Country': info.get('country'), 'Market_Cap': info.get('marketCap')}
+
+
+def _stored_metadata(tickers, retry_cutoff: str = None, cutoff: str = None) -> pd.DataFrame:
+    """Stored rows for tickers ('Unknown' where a failed fetch left no values); only those
+    fetched since cutoff (successes) / retry_cutoff (failures) when the cutoffs are given."""
+    query = ("SELECT Ticker, COALESCE(Sector, 'Unknown') AS Sector, COALESCE(Industry, 'Unknown') AS Industry, "
+             f"Country, Market_Cap FROM security_metadata WHERE Ticker IN ({','.join('?' * len(tickers))})")
+    params = list(tickers)
+    if cutoff is not None:
+        query += " AND fetched_at >= CASE WHEN failed = 1 THEN ? ELSE ? END"
+        params += [retry_cutoff, cutoff]
+    with db.db_contextmanager() as conn:
+        return pd.read_sql_query(query, conn, params=params)
+
+
+def security_metadata(tickers) -> pd.DataFrame:
+    """Metadata for every ticker, as a DataFrame with METADATA_COLUMNS (one row per ticker).
+
+    Fresh rows come from the security_metadata table; the rest are fetched in parallel and
+    stored. Tickers whose fetch fails get 'Unknown' placeholders (or their last known values).
+    """
+    tickers = list(dict.fromkeys(t for t in tickers if t))
+    if not tickers:
+        return pd.DataFrame(columns=METADATA_COLUMNS)
+    now = datetime.now()
+    stored = _stored_metadata(
+        tickers,
+        retry_cutoff=(now - timedelta(hours=settings.METADATA_RETRY_HOURS)).strftime('%Y-%m-%d %H:%M:%S'),
+        cutoff=(now - timedelta(days=settings.METADATA_TTL_DAYS)).strftime('%Y-%m-%d %H:%M:%S'))
+
+    missing = [t for t in tickers if t not in set(stored['Ticker'])]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(settings.METADATA_WORKERS, len(missing))) as pool:
+            infos = list(pool.map(_fetch_info, missing))
+        fetched_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        fetched = pd.DataFrame([info_to_metadata(t, info) for t, info in zip(missing, infos) if info],
+                               columns=METADATA_COLUMNS)
+        if not fetched.empty:
+            db.insert_dataframe(fetched.assign(fetched_at=fetched_at, failed=0), 'security_metadata')
+        failed = [t for t, info in zip(missing, infos) if not info]
+        unknown = pd.DataFrame(columns=METADATA_COLUMNS)
+        if failed:
+            # Only the fetch time and flag: a ticker that used to resolve keeps its last values
+            db.insert_dataframe(pd.DataFrame({'Ticker': failed, 'fetched_at': fetched_at, 'failed': 1}),
+                                'security_metadata')
+            unknown = _stored_metadata(failed)
+        frames = [df for df in (stored, fetched, unknown) if not df.empty]
+        stored = pd.concat(frames, ignore_index=True) if frames else stored
+    return stored
@@ -0,0 +1,200 @@
+"""Pipeline instrumentation: timed spans around each stage of a refresh, stored in the
+pipeline_metrics table.
+
+    with metrics.run('upload'):                 # one pipeline run, optionally profiled
+        with metrics.span('fetch.positions') as s:
+            positions = ...
+            s.rows = len(positions)
+
+    @metrics.timed('cleanup')                   # decorator form; rows = len() of a returned frame
+
+Spans are only recorded inside a run. They are buffered in memory and written with a single
+executemany when the run ends, so instrumentation never adds a commit per stage.
+cache_hits is the number of in-process FX rate cache hits (fx.get_exchange_rate) during the
+span; a slow span with few hits is waiting on yfinance.
+"""
+import contextvars
+import cProfile
+import functools
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from config import settings
+
+# Id of the run the current code belongs to. A ContextVar, so worker threads started with
+# copy_context() (see moomoo_api.fetch_concurrently) report into their caller's run.
+_run_id = contextvars.ContextVar('pipeline_run', default=None)
+_buffer = []
+_buffer_lock = threading.Lock()
+_last_prune = 0.0
+# cProfile and pyinstrument can only profile one run at a time per process
+_profiling_lock = threading.Lock()
+
+PROFILE_MODES = ('cprofile', 'pyinstrument')
+
+
+class Span:
+    def __init__(self, stage: str, rows: int = None):
+        self.stage = stage
+        self.rows = rows
+        self.cache_hits = None
+
+
+def _fx_cache_hits() -> int:
+    from source import fx
+    return fx.get_exchange_rate.cache_info().hits
+
+
+@contextmanager
+def span(stage: str, rows: int = None):
+    """Time one stage of the current run. Yields a Span whose rows/cache_hits may be set."""
+    record = Span(stage, rows)
+    run_id = _run_id.get()
+    if run_id is None:
+        yield record
+        return
+    hits_before = _fx_cache_hits()
+    started_at = datetime.now()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield record
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        if record.cache_hits is None:
+            record.cache_hits = _fx_cache_hits() - hits_before
+        with _buffer_lock:
+            _buffer.append((run_id, stage, started_at.strftime('%Y-%m-%d %H:%M:%S.%f'), duration_ms,
+                            record.rows, record.cache_hits, error))
+
+
+def timed(stage: str = None):
+    """Decorator form of span(); rows is the length of the result when it is a DataFrame/Series."""
+    def decorate(fn):
+        name = stage or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name) as record:
+                result = fn(*args, **kwargs)
+                if record.rows is None and isinstance(result, (pd.DataFrame, pd.Series)):
+                    record.rows = len(result)
+                return result
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def run(name: str, profile: str = None):
+    """One pipeline run: tags every span inside it, and writes them out when it ends.
+
+    profile ('cprofile' or 'pyinstrument', default settings.PROFILE_MODE) also captures a
+    profile of the calling thread into settings.PROFILE_DIR. A run started inside another
+    run just joins it.
+    """
+    if _run_id.get() is not None:
+        with span(name):
+            yield _run_id.get()
+        return
+    run_id = f"{name}-{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+    token = _run_id.set(run_id)
+    profiler = _start_profiler(profile or settings.PROFILE_MODE, run_id)
+    try:
+        with span(name):
+            yield run_id
+    finally:
+        _stop_profiler(profiler, run_id)
+        _run_id.reset(token)
+        flush()
+
+
+def _start_profiler(mode: str, run_id: str):
+    if not mode:
+        return None
+    if mode not in PROFILE_MODES:
+        print(f"Unknown profile mode {mode!r}; expected one of {PROFILE_MODES}.")
+        return None
+    if not _profiling_lock.acquire(blocking=False):
+        print(f"Not profiling {run_id}: another run is being profiled.")
+        return None
+    if mode == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:  # optional dependency
+            print("pyinstrument is not installed; profiling with cProfile instead.")
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _stop_profiler(profiler, run_id: str):
+    if profiler is None:
+        return
+    try:
+        settings.PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            path = settings.PROFILE_DIR / f"{run_id}.prof"
+            profiler.dump_stats(path)
+        else:
+            profiler.stop()
+            path = settings.PROFILE_DIR / f"{run_id}.html"
+            path.write_text(profiler.output_html(), encoding='utf-8')
+        print(f"Profile written to {path}")
+    finally:
+        _profiling_lock.release()
+
+
+def flush() -> int:
+    """Write the buffered spans to pipeline_metrics. Returns the number written."""
+    global _last_prune
+    with _buffer_lock:
+        rows = list(_buffer)
+        _buffer.clear()
+    if not rows:
+        return 0
+    from source import db
+    try:
+        with db.db_contextmanager() as conn:
+            conn.executemany(
+                "INSERT INTO pipeline_metrics (run_id, stage, started_at, duration_ms, rows, cache_hits, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            # Old spans are dropped at most once an hour
+            if time.monotonic() - _last_prune > 3600:
+                cutoff = datetime.now() - timedelta(days=settings.METRICS_RETENTION_DAYS)
+                conn.execute("DELETE FROM pipeline_metrics WHERE started_at < ?", (cutoff.strftime('%Y-%m-%d'),))
+                _last_prune = time.monotonic()
+    except sqlite3.Error as e:
+        # Metrics must never break the pipeline they observe
+        print(f"Could not store pipeline metrics: {e}")
+        return 0
+    return len(rows)
+
+
+def stage_latency(days: int = 7, freq: str = 'D') -> pd.DataFrame:
+    """p50 / p95 duration (ms) and span count per stage and period, over the last `days`."""
+    from source import db
+    since = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+    df = db.read_db(f"SELECT stage, started_at, duration_ms FROM pipeline_metrics WHERE started_at >= '{since}'")
+    if df.empty:
+        return pd.DataFrame(columns=['period', 'stage', 'p50_ms', 'p95_ms', 'count'])
+    df['period'] = pd.to_datetime(df['started_at']).dt.floor(freq)
+    grouped = df.groupby(['period', 'stage'])['duration_ms']
+    return pd.DataFrame({
+        'p50_ms': grouped.quantile(0.5),
+        'p95_ms': grouped.quantile(0.95),
+        'count': grouped.size(),
+    }).reset_index()
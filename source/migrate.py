@@ -0,0 +1,37 @@
+"""Offline schema maintenance, without fetching anything:
+
+    python -m source.migrate migrate    # apply pending schema migrations
+    python -m source.migrate verify     # report version, missing tables/indexes (exit 1 if not current)
+
+Kept out of source.db so that running it imports source.db once, as a module, instead of
+loading a second __main__ copy with its own connection pool and caches.
+"""
+import argparse
+import os
+
+from config import settings
+from source import db
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate or verify the portfolio database schema.")
+    parser.add_argument("command", choices=["migrate", "verify"])
+    args = parser.parse_args(argv)
+
+    path = settings.MOOMOO_PORTFOLIO_DB_PATH
+    if args.command == "verify" and not os.path.exists(path):
+        print(f"No database at {path}.")
+        return 1
+    if args.command == "migrate":
+        db.init_db()
+    problems = db.verify_schema()
+    for problem in problems:
+        print(problem)
+    if not problems:
+        print(f"{path}: schema version {db.SCHEMA_VERSION}, up to date.")
+    db.close_connections()
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,6 +2,9 @@ import moomoo as moomoo
 from moomoo.trade.open_trade_context import OpenSecTradeContext
 from config import settings
 from config.credentials import generate_opend_xml
+from source.cleanup import settlement_dates
+from source import cassette, metrics
+from source.rate_limit import opend_limiter
 
 import os
 import time
@@ -11,7 +14,10 @@ import pandas as pd
 from typing import Optional, Dict, List
 import psutil
 from contextlib import contextmanager
+import contextvars
 import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 def is_opend_responsive(host='127.0.0.1', port=11111):
     """Checks if OpenD is actually listening on the port."""
@@ -23,6 +29,8 @@ def is_opend_responsive(host='127.0.0.1', port=11111):
     
 def stop_opend():
     """Forcefully kills any OpenD process (Clean reset)."""
+    if settings.OPEND_MODE == 'replay':
+        return
     for proc in psutil.process_iter(['name']):
         if proc.info['name'] == 'OpenD.exe':
             try:
@@ -30,8 +38,18 @@ def stop_opend():
             except:
                 pass
 
+# Refresh tiers run on separate threads; only one of them may (re)start OpenD at a time
+_opend_start_lock = threading.Lock()
+
 def ensure_opend_is_ready():
     """Starts OpenD if not responding, returns True when ready."""
+    if settings.OPEND_MODE == 'replay' or is_opend_responsive():
+        return True
+    with _opend_start_lock:
+        return _start_opend()
+
+def _start_opend():
+    # Another thread may have started it while this one waited for the lock
     if is_opend_responsive():
         return True
 
@@ -62,6 +80,10 @@ def ensure_opend_is_ready():
 
 
 def configure_moomoo_api():
+    if settings.OPEND_MODE not in cassette.MODES:
+        raise ValueError(f"Unknown OPEND_MODE {settings.OPEND_MODE!r}; expected one of {cassette.MODES}")
+    if settings.OPEND_MODE == 'replay':
+        return cassette.CassettePlayer()
     # Get the RSA key path from environment variables (set by secure .env)
     key_path = os.getenv("MOOMOO_RSA_KEY")
     if not key_path:
@@ -79,68 +101,54 @@ def configure_moomoo_api():
         is_encrypt=True,
         security_firm="FUTUSG"
         )
+    if settings.OPEND_MODE == 'record':
+        return cassette.CassetteRecorder(trade_ctx)
     return trade_ctx
     
 def account_list(trade_obj: OpenSecTradeContext):
-    ret, data = trade_obj.get_acc_list()
-    if ret == moomoo.RET_OK:
-        return data
-    else:
-        raise Exception('get_acc_list error: ', data)
-        return None
+    return opend_limiter.call('get_acc_list', trade_obj.get_acc_list)
     
 def account_info(trade_obj: OpenSecTradeContext):
-    ret, data = trade_obj.accinfo_query(trd_env="REAL",refresh_cache=True,currency="SGD")
-    if ret == moomoo.RET_OK:
-        return data
-    else:
-        raise Exception('accinfo_query error: ', data)
-        return None
+    return opend_limiter.call('accinfo_query', trade_obj.accinfo_query,
+                              trd_env="REAL", refresh_cache=True, currency="SGD")
     
 def get_positions(trade_obj: OpenSecTradeContext):
-    ret, data = trade_obj.position_list_query(trd_env="REAL",refresh_cache=True)
-    if ret == moomoo.RET_OK:
-        return data
-    else:
-        raise Exception('position_list_query error: ', data)
-        return None
+    return opend_limiter.call('position_list_query', trade_obj.position_list_query,
+                              trd_env="REAL", refresh_cache=True)
 
-def account_cashflow(trade_obj: OpenSecTradeContext, current_date: datetime, end_date: datetime):
-    cash_flow_list = []
-    request_count = 0
-    start_time = time.time()
-    
-    while end_date <= current_date:
-        # Rate Limit Check: 20 requests per 30 seconds
-        if request_count >= 20:
-            elapsed = time.time() - start_time
-            if elapsed < 30:
-                wait_time = 30 - elapsed + 1 # Add 1s buffer
-                print(f"Quota used. Waiting {wait_time:.2f}s...")
-                time.sleep(wait_time)
-            # Reset window
-            request_count = 0
-            start_time = time.time()
-
-        date_str = current_date.strftime('%Y-%m-%d')
-        ret, data = trade_obj.get_acc_cash_flow(clearing_date=date_str, trd_env="REAL")
-
-        if ret == moomoo.RET_OK:
-            if not data.empty:
-                cash_flow_list.append(data)
-            request_count += 1
-            current_date -= timedelta(days=1)
-
-        elif ret == moomoo.RET_ERROR:
-            print(f"Error on {date_str}: {data}")
-            time.sleep(30)
-            start_time = time.time()
-            request_count = 0
-            
+def fetch_cashflow(trade_obj: OpenSecTradeContext, dates: List[str]):
+    """Fetch the cash flow of each clearing date in `dates` (YYYY-MM-DD strings).
+
+    Requests are pipelined through the shared get_acc_cash_flow quota (see rate_limit).
+    Returns (cash_flow_data, fetched_dates). fetched_dates lists every date that was
+    queried successfully, including days that had no cash flow; a date that still fails
+    after its retries is left out (and fetched again next time). Raises if no date could
+    be fetched at all.
+    """
+    results = opend_limiter.map(
+        'get_acc_cash_flow',
+        lambda date_str: trade_obj.get_acc_cash_flow(clearing_date=date_str, trd_env="REAL"),
+        dates,
+        return_exceptions=True,
+    )
+    failed = [(date_str, data) for date_str, data in zip(dates, results) if isinstance(data, Exception)]
+    if failed and len(failed) == len(dates):
+        raise failed[0][1]
+    if failed:
+        print(f"Cashflow: {len(failed)} clearing date(s) failed, retried next run: "
+              f"{', '.join(date_str for date_str, _ in failed)}")
+    fetched = [date_str for date_str, data in zip(dates, results) if not isinstance(data, Exception)]
+    cash_flow_list = [data for data in results if not isinstance(data, Exception) and not data.empty]
     if cash_flow_list:
         cash_flow_data = pd.concat(cash_flow_list, ignore_index=True)
     else:
         cash_flow_data = pd.DataFrame()
+    return cash_flow_data, fetched
+
+def account_cashflow(trade_obj: OpenSecTradeContext, current_date: datetime, end_date: datetime):
+    """Cash flow for every settlement day from current_date back to end_date."""
+    dates = settlement_dates(end_date, current_date, settings.SETTLEMENT_HOLIDAYS)
+    cash_flow_data, _ = fetch_cashflow(trade_obj, dates)
 
     if cash_flow_data.empty:
         # Handle the case where no cashflow data was retrieved
@@ -148,19 +156,196 @@ def account_cashflow(trade_obj: OpenSecTradeContext, current_date: datetime, end
 
     return cash_flow_data
     
-def get_historical_orders(trade_obj: OpenSecTradeContext):
-    start = datetime.combine(settings.START_DATE, datetime.min.time()).strftime('%Y-%m-%d %H:%M:%S')
-    end = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    ret, data = trade_obj.history_order_list_query(start=start, end=end)
-    if ret == moomoo.RET_OK:
-        return data 
-    else:
-        raise Exception('history_order_list_query error: ', data)
+def order_windows(start: datetime, end: datetime, window_days: int):
+    """Split [start, end] into consecutive (window_start, window_end) pairs of at most window_days."""
+    windows = []
+    step = timedelta(days=window_days)
+    while start < end:
+        windows.append((start, min(start + step, end)))
+        start += step
+    return windows
+
+def get_historical_orders(trade_obj: OpenSecTradeContext, start: datetime = None, end: datetime = None):
+    """Historical orders updated between start (default START_DATE) and end (default now).
+
+    Long ranges are queried in ORDER_SYNC_WINDOW_DAYS chunks and concatenated. When recording
+    or replaying a cassette, every sync starts at START_DATE: cassettes match this query on its
+    window start, which would otherwise depend on the orders already in the local database.
+    """
+    if settings.OPEND_MODE in ('record', 'replay'):
+        start = None
+    start = start or datetime.combine(settings.START_DATE, datetime.min.time())
+    end = end or datetime.now()
+    frames = []
+    for window_start, window_end in order_windows(start, end, settings.ORDER_SYNC_WINDOW_DAYS):
+        data = opend_limiter.call('history_order_list_query', trade_obj.history_order_list_query,
+                                  start=window_start.strftime('%Y-%m-%d %H:%M:%S'),
+                                  end=window_end.strftime('%Y-%m-%d %H:%M:%S'))
+        if not data.empty:
+            frames.append(data)
+    if not frames:
+        return pd.DataFrame()
+    # An order can straddle a window boundary; keep one row per order
+    return pd.concat(frames, ignore_index=True).drop_duplicates(subset='order_id', keep='last')
+
+def fetch_concurrently(jobs: dict, on_result=None) -> dict:
+    """Run independent OpenD queries in parallel; jobs maps name -> zero-argument callable.
+
+    Each endpoint still draws from its own quota (see source/rate_limit.py). on_result(name,
+    value) is called on this thread as each query finishes, so early results can be used while
+    slow ones are still running. A failed query is logged and gives None; a failing on_result
+    is logged as a storage error and does not discard the query's result.
+    """
+    results = dict.fromkeys(jobs)
+    with ThreadPoolExecutor(max_workers=len(jobs) or 1) as pool:
+        # Each worker runs in a copy of this context, so its spans land in the caller's run
+        futures = {pool.submit(contextvars.copy_context().run, _fetch_job, name, job): name
+                   for name, job in jobs.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                print(f"API Error ({name}): {e}")
+                continue
+            if on_result is not None:
+                try:
+                    on_result(name, results[name])
+                except Exception as e:
+                    print(f"Storage error ({name}): {e}")
+    return results
+
+def _fetch_job(name, job):
+    started = time.perf_counter()
+    with metrics.span(f"fetch.{name}") as record:
+        result = job()
+        record.rows = len(result) if result is not None else 0
+    print(f"Fetched {name} in {time.perf_counter() - started:.2f}s")
+    return result
+
+
+class OpenDSupervisor:
+    """Owns one long-lived encrypted trade context, shared by every caller.
+
+    The RSA handshake happens once; a heartbeat thread checks the context every
+    `heartbeat_seconds` and replaces it (with backoff) only when it stops answering.
+    OpenD itself is restarted only if its port is down when reconnecting.
+    """
+
+    def __init__(self, connect=None, ready=None, heartbeat_seconds: float = None,
+                 max_attempts: int = None, backoff=None, sleep=time.sleep):
+        self._connect = connect or configure_moomoo_api
+        self._ready = ready or ensure_opend_is_ready
+        self.heartbeat_seconds = settings.OPEND_HEARTBEAT_SECONDS if heartbeat_seconds is None else heartbeat_seconds
+        self.max_attempts = settings.OPEND_MAX_RETRIES if max_attempts is None else max_attempts
+        self._backoff = backoff or opend_limiter.backoff
+        self._sleep = sleep
+        self._ctx = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.connects = 0
+        self.last_heartbeat = None
+
+    def context(self) -> OpenSecTradeContext:
+        """The shared trade context, connecting first if there is none."""
+        with self._lock:
+            if self._ctx is None:
+                self._ctx = self._reconnect()
+            return self._ctx
+
+    def _reconnect(self):
+        for attempt in range(self.max_attempts + 1):
+            try:
+                if not self._ready():
+                    raise ConnectionError("OpenD is not responding")
+                ctx = self._connect()
+                self.connects += 1
+                return ctx
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    raise
+                delay = self._backoff(attempt)
+                print(f"OpenD connection failed: {e}. Retrying in {delay:.1f}s...")
+                self._sleep(delay)
+
+    def invalidate(self, ctx=None):
+        """Close and drop the shared context (only if it is still `ctx`, when given)."""
+        with self._lock:
+            if self._ctx is None or (ctx is not None and ctx is not self._ctx):
+                return
+            stale, self._ctx = self._ctx, None
+        try:
+            stale.close()
+        except Exception:
+            pass
+
+    def heartbeat(self) -> bool:
+        """Check the shared context with a cheap query; drop it if it does not answer."""
+        with self._lock:
+            ctx = self._ctx
+        if ctx is None:
+            return False
+        try:
+            opend_limiter.bucket('get_acc_list').acquire()
+            healthy = ctx.get_acc_list()[0] == moomoo.RET_OK
+        except Exception:
+            healthy = False
+        if healthy:
+            self.last_heartbeat = datetime.now()
+        else:
+            print("OpenD heartbeat failed; reconnecting.")
+            self.invalidate(ctx)
+        return healthy
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            if not self.heartbeat():
+                try:
+                    self.context()
+                except Exception as e:
+                    print(f"OpenD reconnect failed: {e}")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="opend-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.invalidate()
+
+    @contextmanager
+    def session(self):
+        """Lend the shared context; if the caller fails, check that it is still healthy."""
+        ctx = self.context()
+        try:
+            yield ctx
+        except Exception:
+            self.heartbeat()
+            raise
+
+
+# Shared by the refresh tiers so they reuse one connection instead of handshaking per tick
+supervisor = OpenDSupervisor()
 
 # Manage context, and whether keep openD alive or kill it
 @contextmanager
 def opend_session(keep_alive: bool = False):
-    """Context manager to handle OpenD lifecycle."""
+    """Context manager to handle OpenD lifecycle.
+
+    keep_alive=True lends the supervised, long-lived context (nothing is closed afterwards);
+    keep_alive=False is for one-shot runs: a fresh context, and OpenD is stopped at the end.
+    """
+    if keep_alive:
+        with supervisor.session() as trade_ctx:
+            yield trade_ctx
+        return
     ensure_opend_is_ready()
     trade_ctx = None
     try:
@@ -169,8 +354,7 @@ def opend_session(keep_alive: bool = False):
     finally:
         if trade_ctx:
             trade_ctx.close()
-        if not keep_alive:
-            stop_opend()
+        stop_opend()
 
 def main():
     return 0
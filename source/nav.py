@@ -0,0 +1,107 @@
+"""NAV / units engine for Time Weighted Returns (unitised performance).
+
+The portfolio is treated as a fund: external cash flows buy or redeem units at the day's NAV,
+so NAV only moves with the market. For snapshot t with total assets TA_t and net external
+flow cf_t:
+
+    nav_t   = (TA_t - cf_t) / units_{t-1}
+    units_t = units_{t-1} + cf_t / nav_t  =  units_{t-1} * TA_t / (TA_t - cf_t)
+
+so the whole units series is one cumulative product and nav follows from it. The first
+snapshot starts at INITIAL_UNITS units. A flow is attributed to the first snapshot on or
+after its date, so flows on days without a snapshot (weekends, missed runs) are not lost.
+"""
+import numpy as np
+import pandas as pd
+
+INITIAL_UNITS = 1000.0
+
+
+def _usable(value):
+    """value as a float, or None when it is missing, NaN or 0 (nothing to price units with)."""
+    if value is None or pd.isna(value) or value == 0:
+        return None
+    return float(value)
+
+
+def nav_units(total_assets, flows, prev_units: float = None, prev_nav: float = None):
+    """Vectorised (nav, units) arrays for consecutive snapshots.
+
+    prev_units / prev_nav are those of the snapshot just before the first one. Without usable
+    prev_units (None, NaN or 0) the series is (re)seeded: units are bought at prev_nav, or
+    the first snapshot is the inception (INITIAL_UNITS units, its flow ignored). A day whose
+    whole value is that day's flow (total_assets == flow) has no pre-flow value to price
+    units with, and is re-seeded at the previous nav the same way.
+    """
+    total_assets = np.asarray(total_assets, dtype=float)
+    flows = np.asarray(flows, dtype=float)
+    base = total_assets - flows
+    n = len(total_assets)
+    nav = np.empty(n)
+    units = np.empty(n)
+    # Days where the recurrence cannot continue: no pre-flow value, or no units left before them
+    restart = (base == 0) | np.concatenate(([False], total_assets[:-1] == 0))
+    units_before, nav_before = _usable(prev_units), _usable(prev_nav)
+    i = 0
+    while i < n:
+        if units_before is None or restart[i]:
+            nav[i] = nav_before if nav_before is not None else total_assets[i] / INITIAL_UNITS
+            units[i] = total_assets[i] / nav[i] if nav[i] else 0.0
+            end = i + 1
+        else:
+            later = np.flatnonzero(restart[i + 1:])
+            end = i + 1 + later[0] if len(later) else n
+            seg_units = units_before * np.cumprod(total_assets[i:end] / base[i:end])
+            nav[i:end] = base[i:end] / np.concatenate(([units_before], seg_units[:-1]))
+            units[i:end] = seg_units
+        units_before, nav_before = _usable(units[end - 1]), _usable(nav[end - 1])
+        i = end
+    return nav, units
+
+
+def external_flows(snapshot_dates, after: str = None, to_currency: str = "SGD") -> np.ndarray:
+    """Net external cash flow attributed to each (sorted) snapshot date, in to_currency.
+
+    Only flows dated after `after` (the snapshot preceding the first one, if any) count.
+    Flows after the last snapshot wait for the next one.
+    """
+    from source import db
+    from source.fx import convert_column_asof
+    dates = pd.to_datetime(pd.Series(snapshot_dates)).to_numpy(dtype="datetime64[ns]")
+    query = "SELECT Date, Currency, Amount FROM cashflow WHERE is_external = 1"
+    if after is not None:
+        query += f" AND Date > '{after}'"
+    cf = db.read_db(query)
+    if cf.empty or len(dates) == 0:
+        return np.zeros(len(dates))
+    amounts = convert_column_asof(cf['Amount'], cf['Currency'], cf['Date'], to_currency).to_numpy()
+    pos = np.searchsorted(dates, pd.to_datetime(cf['Date']).to_numpy(dtype="datetime64[ns]"), side='left')
+    inside = pos < len(dates)
+    return np.bincount(pos[inside], weights=amounts[inside], minlength=len(dates))
+
+
+def recompute_nav(from_date=None) -> int:
+    """Recompute and store nav/units for every snapshot on or after from_date (all if None).
+
+    Earlier snapshots are left as they are; the one just before from_date seeds the units.
+    Returns the number of snapshots updated.
+    """
+    from source import db
+    snapshots = db.read_db("SELECT date, total_assets, nav, units FROM portfolio_snapshots ORDER BY date")
+    if from_date is None:
+        start = 0
+    else:
+        start = int(np.searchsorted(snapshots['date'].to_numpy(dtype=str), pd.Timestamp(from_date).strftime('%Y-%m-%d')))
+    target = snapshots.iloc[start:]
+    if target.empty:
+        return 0
+    prev_date = snapshots['date'].iloc[start - 1] if start > 0 else None
+    # A seed without usable units (NaN or 0) re-seeds at its nav instead of spreading NaN/inf
+    prev_units = snapshots['units'].iloc[start - 1] if start > 0 else None
+    prev_nav = snapshots['nav'].iloc[start - 1] if start > 0 else None
+    flows = external_flows(target['date'], after=prev_date)
+    nav, units = nav_units(target['total_assets'], flows, prev_units, prev_nav)
+    db.insert_dataframe(pd.DataFrame({'date': target['date'].to_numpy(), 'nav': nav, 'units': units}),
+                        'portfolio_snapshots')
+    print(f"Recomputed NAV/units for {len(target)} snapshot(s) from {target['date'].iloc[0]}.")
+    return len(target)
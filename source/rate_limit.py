@@ -0,0 +1,156 @@
+"""Per-endpoint quota scheduling for OpenD queries.
+
+OpenD enforces quotas such as "20 get_acc_cash_flow calls per 30 seconds" over a sliding
+window. Each endpoint gets a TokenBucket whose tokens are handed back exactly `period`
+seconds after they were spent, so a backfill can use the whole window without oversleeping
+and without ever tripping the server-side limit. Failed calls are retried with exponential
+backoff plus jitter, and the backoff pauses the endpoint for every worker sharing it.
+"""
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import moomoo
+
+from config import settings
+
+
+class TokenBucket:
+    """Sliding-window token bucket: at most `capacity` acquisitions in any `period` seconds."""
+
+    def __init__(self, capacity: int, period: float, clock=time.monotonic, sleep=time.sleep):
+        self.capacity = capacity
+        self.period = period
+        self._clock = clock
+        self._sleep = sleep
+        self._spent = deque()  # times at which tokens were taken
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_time(self, now: float) -> float:
+        while self._spent and self._spent[0] + self.period <= now:
+            self._spent.popleft()
+        wait = self._paused_until - now
+        if len(self._spent) >= self.capacity:
+            wait = max(wait, self._spent[0] + self.period - now)
+        return wait
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self._lock:
+                now = self._clock()
+                wait = self._wait_time(now)
+                if wait <= 0:
+                    self._spent.append(now)
+                    return
+            self._sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hold back every caller of this bucket for `seconds` (used after an error)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+class RateLimiter:
+    """Token buckets keyed by OpenD endpoint name, plus retrying call/map helpers.
+
+    `quotas` maps endpoint -> (calls, period_seconds); endpoints without a quota are
+    called without throttling but still get retries.
+    """
+
+    def __init__(self, quotas: dict, max_retries: int = None, backoff_base: float = None,
+                 backoff_max: float = None, clock=time.monotonic, sleep=time.sleep):
+        self.quotas = dict(quotas)
+        self.max_retries = settings.OPEND_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = settings.OPEND_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = settings.OPEND_BACKOFF_MAX if backoff_max is None else backoff_max
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets = {}
+        self._latencies = {}  # endpoint -> recent call durations (seconds)
+        self._lock = threading.Lock()
+
+    def bucket(self, endpoint: str):
+        with self._lock:
+            if endpoint not in self._buckets and endpoint in self.quotas:
+                capacity, period = self.quotas[endpoint]
+                self._buckets[endpoint] = TokenBucket(capacity, period, self._clock, self._sleep)
+            return self._buckets.get(endpoint)
+
+    def _record_latency(self, endpoint: str, seconds: float):
+        with self._lock:
+            samples = self._latencies.setdefault(endpoint, deque(maxlen=settings.OPEND_LATENCY_SAMPLES))
+            samples.append(seconds)
+
+    def latency(self) -> dict:
+        """Per endpoint: {'calls', 'last', 'median', 'max'} over the recent calls, in seconds.
+
+        Only the round trip to OpenD is timed, not the wait for a quota token.
+        """
+        with self._lock:
+            snapshot = {endpoint: list(samples) for endpoint, samples in self._latencies.items()}
+        return {endpoint: {'calls': len(samples), 'last': samples[-1], 'median': statistics.median(samples),
+                           'max': max(samples)}
+                for endpoint, samples in snapshot.items()}
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff for the given (0-based) retry attempt, jittered to 50-100%."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    def call(self, endpoint: str, fn, *args, **kwargs):
+        """Call an OpenD query returning (ret, data) within the endpoint's quota.
+
+        Returns data on RET_OK. On errors, waits with backoff and retries; raises once
+        max_retries is exhausted.
+        """
+        bucket = self.bucket(endpoint)
+        for attempt in range(self.max_retries + 1):
+            if bucket is not None:
+                bucket.acquire()
+            started = time.perf_counter()
+            ret, data = fn(*args, **kwargs)
+            self._record_latency(endpoint, time.perf_counter() - started)
+            if ret == moomoo.RET_OK:
+                return data
+            if attempt == self.max_retries:
+                break
+            delay = self.backoff(attempt)
+            print(f"{endpoint} error: {data}. Retrying in {delay:.1f}s...")
+            if bucket is not None:
+                bucket.pause(delay)
+            else:
+                self._sleep(delay)
+        raise Exception(f'{endpoint} error: ', data)
+
+    def map(self, endpoint: str, fn, items, workers: int = None, return_exceptions: bool = False):
+        """Run fn(item) for every item through call(), pipelined on a worker pool.
+
+        Results come back in the order of `items`. The bucket, not the pool size, decides
+        the request rate, so the pool only needs to be large enough to keep it busy. With
+        return_exceptions=True an item that still fails after its retries gets its exception
+        in its slot instead of aborting the other items.
+        """
+        items = list(items)
+        if not items:
+            return []
+        workers = workers or settings.OPEND_WORKERS
+
+        def run(item):
+            try:
+                return self.call(endpoint, fn, item)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+            return list(pool.map(run, items))
+
+
+# Shared by every moomoo_api query so all callers draw from the same quota budget
+opend_limiter = RateLimiter(settings.OPEND_QUOTAS)
@@ -0,0 +1,83 @@
+"""Tiered background refresh.
+
+Each RefreshTier wraps one refresh job with its own interval and last-run bookkeeping, and
+TieredRefresher runs every tier on its own daemon thread. That way the 10-second snapshot is
+never queued behind a slow order/cashflow sync or a benchmark download, and none of it runs
+in the Streamlit script thread.
+"""
+import threading
+import time
+from datetime import datetime
+
+
+class RefreshTier:
+    def __init__(self, name: str, interval: float, job):
+        self.name = name
+        self.interval = interval
+        self.job = job
+        self.last_run = None        # datetime the job last finished (successfully or not)
+        self.last_duration = None   # seconds
+        self.last_error = None
+        self._last_started = None   # monotonic time, for scheduling
+
+    def due(self, now: float) -> bool:
+        return self._last_started is None or now - self._last_started >= self.interval
+
+    def run(self, now: float = None):
+        """Run the job once, recording timing and any error (errors never escape)."""
+        self._last_started = time.monotonic() if now is None else now
+        start = time.perf_counter()
+        try:
+            self.job()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Refresh tier '{self.name}' failed: {e}")
+        finally:
+            self.last_duration = time.perf_counter() - start
+            self.last_run = datetime.now()
+
+    def status(self) -> dict:
+        return {"tier": self.name, "interval_s": self.interval, "last_run": self.last_run,
+                "duration_s": self.last_duration, "error": self.last_error}
+
+
+class TieredRefresher:
+    """Runs each tier on its own background thread whenever it is due."""
+
+    def __init__(self, tiers, poll_seconds: float = 1.0):
+        self.tiers = list(tiers)
+        self.poll_seconds = poll_seconds
+        self.paused = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _loop(self, tier: RefreshTier):
+        while not self._stop.is_set():
+            if not self.paused.is_set() and tier.due(time.monotonic()):
+                tier.run()
+            self._stop.wait(self.poll_seconds)
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for tier in self.tiers:
+            thread = threading.Thread(target=self._loop, args=(tier,), name=f"refresh-{tier.name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def pause(self, paused: bool = True):
+        if paused:
+            self.paused.set()
+        else:
+            self.paused.clear()
+
+    def status(self):
+        return [tier.status() for tier in self.tiers]
@@ -0,0 +1,97 @@
+"""Symbol parsing shared by cleanup, db and dashboard.
+
+OCC-style option symbols (e.g. NVDA270115C230000) are parsed into structured columns in one
+vectorised str.extract pass over the distinct symbols, instead of a regex per row in every
+consumer. Parsed symbols are memoised in the `symbols` dimension table, so the dashboard joins
+on stored columns rather than re-parsing on every render.
+"""
+import threading
+
+import pandas as pd
+
+from config import settings
+
+# Root + 6 digits (expiry, YYMMDD) + C/P + strike in thousandths (e.g. 230000 = 230.0)
+# Anchored: the whole symbol must be an option code
+OPTION_PATTERN = r'^[A-Z]+\d{6}[CP]\d+$'
+OCC_PATTERN = r'^(?P<Underlying>[A-Z]+)(?P<Expiry>\d{6})(?P<Put_Call>[CP])(?P<Strike>\d+)$'
+OPTION_MULTIPLIER = 100
+
+SYMBOL_COLUMNS = ['Symbol', 'Is_Option', 'Ticker', 'Underlying', 'Expiry', 'Put_Call', 'Strike', 'Multiplier']
+
+# db path -> DataFrame of stored symbols (indexed by Symbol); the table only ever grows.
+# Shared by the refresh threads and the Streamlit threads; replaced, never mutated, under _lock
+_symbol_cache = {}
+_lock = threading.Lock()
+
+
+def parse_symbols(symbols) -> pd.DataFrame:
+    """Parse each distinct symbol into SYMBOL_COLUMNS (one row per symbol, no database).
+
+    Ticker is the underlying for options and the symbol itself otherwise; option-only
+    columns are None for stocks/ETFs.
+    """
+    symbols = pd.Series(pd.unique(pd.Series(symbols, dtype=object).dropna()), dtype=object)
+    parsed = symbols.astype(str).str.extract(OCC_PATTERN)
+    # A code-shaped symbol whose expiry digits are not a date (e.g. ABC999999C100) is no option
+    expiry = pd.to_datetime(parsed['Expiry'], format='%y%m%d', errors='coerce')
+    option = parsed['Underlying'].notna() & expiry.notna()
+    parsed = parsed.where(option)
+    out = pd.DataFrame({
+        'Symbol': symbols,
+        'Is_Option': option,
+        'Ticker': parsed['Underlying'].where(option, symbols),
+        'Underlying': parsed['Underlying'],
+        'Expiry': expiry.where(option).dt.strftime('%Y-%m-%d'),
+        'Put_Call': parsed['Put_Call'],
+        'Strike': parsed['Strike'].astype(float) / 1000,
+        'Multiplier': option.map({True: OPTION_MULTIPLIER, False: 1}).astype(int),
+    })
+    return out
+
+
+def is_option(symbols: pd.Series) -> pd.Series:
+    """Boolean mask aligned with `symbols` (each distinct symbol parsed once)."""
+    parsed = parse_symbols(symbols).set_index('Symbol')['Is_Option']
+    return symbols.map(parsed).fillna(False).astype(bool)
+
+
+def multipliers(symbols: pd.Series) -> pd.Series:
+    """Contract multiplier aligned with `symbols`: 100 for options, 1 for stocks/ETFs."""
+    parsed = parse_symbols(symbols).set_index('Symbol')['Multiplier']
+    return symbols.map(parsed).fillna(1).astype(int)
+
+
+def symbol_info(symbols) -> pd.DataFrame:
+    """SYMBOL_COLUMNS for the given symbols, from the `symbols` table.
+
+    Symbols seen for the first time are parsed once and stored.
+    """
+    from source import db
+    key = str(settings.MOOMOO_PORTFOLIO_DB_PATH)
+    wanted = pd.unique(pd.Series(symbols, dtype=object).dropna())
+    with _lock:
+        known = _symbol_cache.get(key)
+    if known is None:
+        # Read outside the lock: a thread holding it must never wait on the database
+        stored = db.read_db(f"SELECT {', '.join(SYMBOL_COLUMNS)} FROM symbols")
+        stored = stored.astype({'Is_Option': bool}).set_index('Symbol', drop=False)
+        with _lock:
+            known = _symbol_cache.setdefault(key, stored)
+    missing = [s for s in wanted if s not in known.index]
+    if missing:
+        parsed = parse_symbols(missing)
+        db.insert_dataframe(parsed.astype({'Is_Option': int}), 'symbols')
+        with _lock:
+            # Another thread may have added symbols meanwhile: merge into the current frame
+            current = _symbol_cache.get(key, known)
+            new = parsed[~parsed['Symbol'].isin(current.index)]
+            known = pd.concat([current, new.set_index('Symbol', drop=False)]) if not new.empty else current
+            _symbol_cache[key] = known
+    return known.loc[list(wanted), SYMBOL_COLUMNS].reset_index(drop=True)
+
+
+def with_symbol_info(df: pd.DataFrame, columns=('Is_Option', 'Ticker')) -> pd.DataFrame:
+    """Join parsed symbol columns onto a frame with a Symbol column."""
+    info = symbol_info(df['Symbol'])[['Symbol', *columns]]
+    return df.merge(info, on='Symbol', how='left')
@@ -0,0 +1,183 @@
+"""Columnar read cache for the dashboard's large history tables.
+
+portfolio_snapshots is mirrored into Parquet files next to the database, one file per
+table per year (cache/<db name>/<table>/<year>.parquet), with typed datetime columns.
+Reading them is a memory-mapped Arrow load instead of decoding every SQLite row and
+re-parsing TEXT dates.
+
+The cache is kept in step on write: db.insert_dataframe schedules sync() for the years it
+touched, which re-exports just those years from SQLite after the commit, so a routine write
+leaves past years alone. Every export records the table's MAX(rowid) in a marker file; a
+reader that finds a different rowid in SQLite (rows written without the cache) rebuilds
+every year with rebuild(). pyarrow is optional; without it read_table() reads SQLite
+directly and returns the same typed frame.
+"""
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from config import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency: fall back to reading SQLite
+    pa = pq = None
+
+# table -> date column the table is partitioned (and typed) on
+CACHED_TABLES = {'portfolio_snapshots': 'date'}
+
+# (db path, table) -> (files signature, DataFrame) of the last load
+_loaded = {}
+_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return pq is not None
+
+
+def table_dir(table_name: str) -> Path:
+    db_path = Path(settings.MOOMOO_PORTFOLIO_DB_PATH)
+    return db_path.parent / 'cache' / db_path.stem / table_name
+
+
+def years_of(table_name: str, df: pd.DataFrame) -> list:
+    """Distinct years of the rows in df (what a write to the table touches)."""
+    dates = pd.to_datetime(df[CACHED_TABLES[table_name]], format='mixed', errors='coerce')
+    return sorted(int(y) for y in dates.dt.year.dropna().unique())
+
+
+def _typed(table_name: str, df: pd.DataFrame) -> pd.DataFrame:
+    date_col = CACHED_TABLES[table_name]
+    df[date_col] = pd.to_datetime(df[date_col], format='mixed')
+    # NUMERIC columns come back as int or float row by row; give every year file one schema
+    numeric = [c for c in df.columns if c != date_col and pd.api.types.is_numeric_dtype(df[c])]
+    df[numeric] = df[numeric].astype(float)
+    return df
+
+
+def _read_sqlite(table_name: str, year: int = None) -> pd.DataFrame:
+    from source import db
+    date_col = CACHED_TABLES[table_name]
+    query = f"SELECT * FROM {table_name}"
+    if year is not None:
+        query += f" WHERE {date_col} >= '{year}' AND {date_col} < '{year + 1}'"
+    return _typed(table_name, db.read_db(query + f" ORDER BY {date_col}"))
+
+
+def _write_year(table_name: str, year: int, df: pd.DataFrame):
+    path = table_dir(table_name) / f"{year}.parquet"
+    if df.empty:
+        path.unlink(missing_ok=True)
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename, so a concurrent reader never sees a half-written file
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp)
+    os.replace(tmp, path)
+
+
+def _max_rowid(table_name: str) -> int:
+    from source import db
+    with db.db_contextmanager() as conn:
+        return conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table_name}").fetchone()[0]
+
+
+def _marker_path(table_name: str) -> Path:
+    return table_dir(table_name) / 'max_rowid'
+
+
+def _write_marker(table_name: str, max_rowid: int):
+    path = _marker_path(table_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(str(max_rowid))
+    os.replace(tmp, path)
+
+
+def _read_marker(table_name: str):
+    try:
+        return int(_marker_path(table_name).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def sync(table_name: str, years):
+    """Re-export the given years of table_name from SQLite into the cache."""
+    if not enabled():
+        return
+    try:
+        # Serialised with read_table's rebuilds, so neither sees the other's half-written years
+        with _lock:
+            # Taken before the export: rows committed meanwhile leave the marker behind
+            # (a later rebuild), never ahead of the files
+            max_rowid = _max_rowid(table_name)
+            for year in years:
+                _write_year(table_name, year, _read_sqlite(table_name, year))
+            _write_marker(table_name, max_rowid)
+    except Exception as e:
+        print(f"Error updating {table_name} cache: {e}")
+
+
+def rebuild(table_name: str):
+    """Rewrite every year of table_name from SQLite (first use, or after a mismatch).
+    Call with _lock held."""
+    max_rowid = _max_rowid(table_name)
+    df = _read_sqlite(table_name)
+    for path in table_dir(table_name).glob('*.parquet'):
+        path.unlink()
+    for year, rows in df.groupby(df[CACHED_TABLES[table_name]].dt.year):
+        _write_year(table_name, int(year), rows)
+    _write_marker(table_name, max_rowid)
+    print(f"Rebuilt {table_name} cache ({len(df)} rows).")
+
+
+def drop(table_name: str):
+    """Delete the cache directory of a table that is no longer cached."""
+    with _lock:
+        shutil.rmtree(table_dir(table_name), ignore_errors=True)
+        _loaded.pop((str(settings.MOOMOO_PORTFOLIO_DB_PATH), table_name), None)
+
+
+def _files_signature(table_name: str) -> tuple:
+    return tuple((p.name, p.stat().st_mtime_ns, p.stat().st_size)
+                 for p in sorted(table_dir(table_name).glob('*.parquet')))
+
+
+def _load_files(table_name: str) -> pd.DataFrame:
+    tables = [pq.read_table(path, memory_map=True) for path in sorted(table_dir(table_name).glob('*.parquet'))]
+    if not tables:
+        return _typed(table_name, _read_sqlite(table_name).iloc[0:0])
+    return pa.concat_tables(tables, promote_options='permissive').to_pandas()
+
+
+def _matches_sqlite(table_name: str) -> bool:
+    """Cheap consistency check against writers that bypassed the cache (or had no pyarrow):
+    a single MAX(rowid) lookup, compared with the rowid recorded at the last export."""
+    return _read_marker(table_name) == _max_rowid(table_name)
+
+
+def read_table(table_name: str) -> pd.DataFrame:
+    """The whole table, sorted by date, with a datetime64 date column.
+
+    Served from the Parquet cache (memory-mapped, reloaded only when its files change) and
+    rebuilt from SQLite if it is missing or out of step. The caller gets its own copy.
+    """
+    if not enabled():
+        return _read_sqlite(table_name)
+    key = (str(settings.MOOMOO_PORTFOLIO_DB_PATH), table_name)
+    with _lock:
+        signature = _files_signature(table_name)
+        cached = _loaded.get(key)
+        if cached is None or cached[0] != signature:
+            cached = (signature, _load_files(table_name))
+        if not _matches_sqlite(table_name):
+            rebuild(table_name)
+            cached = (_files_signature(table_name), _load_files(table_name))
+        _loaded[key] = cached
+        df = cached[1]
+    # Year files are loaded in order and each is exported sorted, so the frame is already sorted
+    return df.copy()
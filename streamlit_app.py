@@ -6,11 +6,19 @@ import atexit
 import plotly.express as px
 
 # Import existing project modules
-from source import dashboard, db, moomoo_api
+from source import dashboard, db, fx, metrics, moomoo_api, table_cache
+from source.analytics import NavAnalytics
 from config import settings
-import main  # To access upload_to_db logic
+import main  # To access the tiered refresh jobs
 
 atexit.register(moomoo_api.stop_opend)
+atexit.register(db.close_connections)
+
+@st.cache_resource
+def migrated_db():
+    """Create/migrate the schema once per server process, before the first render reads it."""
+    db.init_db()
+    return True
 
 @st.cache_resource
 def persistent_opend():
@@ -29,56 +37,43 @@ st.set_page_config(
     
     
 
+# A database from an older version lacks tables the first render reads (symbols,
+# benchmark_aligned), so migrate before anything is drawn
+migrated_db()
+
 # --- Main Dashboard ---
 st.title("📈 Moomoo Portfolio Dashboard", text_alignment = 'center')
 # --- Live Mode Toggle ---
 live_mode = st.toggle("🔴 Live Mode", value=True, help="Auto-refresh data every 10 seconds.")
-refresh_rate = 10
+refresh_rate = settings.REFRESH_FAST_SECONDS
 if live_mode:
-        st.caption(f"Auto-refreshing every {refresh_rate}s...")
+        st.caption(f"Auto-refreshing every {refresh_rate}s (positions), "
+                   f"{settings.REFRESH_MEDIUM_SECONDS // 60} min (orders & cash flow), daily (benchmarks)...")
 
     
 
-@st.cache_data(scope = 'session')
-def past_data(today_str: str,table_name: str):
-    with db.db_contextmanager() as conn:
-        past_data_df = pd.read_sql_query(f"SELECT * FROM {table_name} WHERE date < ?", conn, params=(today_str,))
-    return past_data_df
-# cache to store for refresh rate so that any calls to the function use the stored value instead before next run
-@st.cache_data(ttl=refresh_rate)
-def live_data(today_str: str,table_name: str):
-    with db.db_contextmanager() as conn:
-        live_data_df = pd.read_sql_query(f"SELECT * FROM {table_name} WHERE date = ?", conn, params=(today_str,))
-    return live_data_df
-
 def combined_data(table_name: str):
-    if table_name == 'portfolio_snapshots':
-        today_str = date.today().strftime('%Y-%m-%d')
-        sort_col = 'date'
-    elif table_name == 'benchmark_history':
-        today_str = datetime.combine(date.today(), datetime.min.time())
-        sort_col = 'Date'
-    
-    p_data = past_data(today_str, table_name)
-    l_data = live_data(today_str, table_name)
-    
-    # Filter out empty dataframes to avoid FutureWarning about concatenation with empty/NA entries
-    dfs = [df for df in [p_data, l_data] if not df.empty]
-    
-    full_df = pd.concat(dfs) if dfs else p_data
-    full_df = full_df.sort_values(sort_col, ascending=True).reset_index(drop=True)
-    return full_df
+    """Whole history table with a datetime date column, from the columnar cache (see source/table_cache.py)."""
+    return table_cache.read_table(table_name)
 
 
 
 
-@st.fragment(run_every=refresh_rate if live_mode else None)
+@st.cache_resource
+def background_refresher():
+    """Start the tiered refresh threads once per server process (see main.tiered_refresher)."""
+    # One supervised OpenD connection shared by all tiers
+    moomoo_api.supervisor.start()
+    atexit.register(moomoo_api.supervisor.stop)
+    refresher = main.tiered_refresher()
+    refresher.start()
+    atexit.register(refresher.stop)
+    return refresher
+
 def live_update_db():
-    try:
-        today_date = datetime.combine(date.today(), datetime.min.time())
-        main.upload_to_db(today_date, today_date, keep_opend_alive=True)
-    except Exception as e:
-        print(f"Error updating database: {e}")
+    # The refresh itself runs on background threads; the toggle only pauses/resumes it
+    refresher = background_refresher()
+    refresher.pause(not live_mode)
 
 @st.fragment(run_every=refresh_rate if live_mode else None)
 def render_live():
@@ -91,14 +86,13 @@ def render_live():
     
     previous_date = latest_date - timedelta(days=1)
     portfolio_snapshots_df = combined_data('portfolio_snapshots')
-    benchmark_df = combined_data('benchmark_history')                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                               
     pos_df = db.read_db(f"SELECT * FROM positions WHERE date = '{latest_date.strftime('%Y-%m-%d')}'")
     pos_df=dashboard.display_pos(pos_df)
 
     # --- Top Metrics Row ---
-    snapshot_df = portfolio_snapshots_df.loc[portfolio_snapshots_df['date'] == latest_date.strftime('%Y-%m-%d')]
+    snapshot_df = portfolio_snapshots_df.loc[portfolio_snapshots_df['date'] == pd.Timestamp(latest_date)]
     
-    prev_snapshot_df = portfolio_snapshots_df.loc[portfolio_snapshots_df['date'] < latest_date.strftime('%Y-%m-%d')].tail(1)
+    prev_snapshot_df = portfolio_snapshots_df.loc[portfolio_snapshots_df['date'] < pd.Timestamp(latest_date)].tail(1)
 
     st.markdown("""
     <style>
@@ -136,8 +130,18 @@ def render_live():
         col4.metric("Cash Balance", f"${col4_metric:,.2f}", delta=col4_delta)
         #col5.metric("NAV", f"{col5_metric:.4f}",delta=col5_delta)
         col6.metric("Last Updated", current_time)
+    stale_fx = fx.stale_rates()
+    if stale_fx:
+        st.caption("⚠️ Live FX rates unavailable, converting with stored rates: " + ", ".join(
+            f"{pair} (from {ts:%Y-%m-%d %H:%M})" if ts is not None else f"{pair} (built-in estimate)"
+            for pair, ts in stale_fx.items()))
+    fx_gaps = fx.rate_gaps()
+    if fx_gaps:
+        st.caption("⚠️ Gaps in the FX rate history, converting with older closes: " + ", ".join(
+            f"{pair} (from {ts:%Y-%m-%d})" for pair, ts in fx_gaps.items()))
     # --- Tabs for different views ---
-    overview, positions, p_l_analysis, ledger = st.tabs(["📊 Overview", "📋 Positions", "💰 P/L Analysis", "Trade Ledger"])
+    overview, positions, p_l_analysis, ledger, pipeline = st.tabs(
+        ["📊 Overview", "📋 Positions", "💰 P/L Analysis", "Trade Ledger", "⏱ Pipeline"])
 
     with overview:
         # col_left, col_right = st.columns(2)
@@ -178,9 +182,14 @@ def render_live():
                     f"<span style='color:red; font-size:24px;'>{sign}{returns_str}</span>", 
                     unsafe_allow_html=True
                 )
-            comparison = dashboard.comparison_df(portfolio_snapshots_df, benchmark_df)
+            comparison = dashboard.comparison_df(portfolio_snapshots_df)
             fig_comparison = dashboard.plt_performance_comparison(dashboard.comparison_percent(comparison))
             st.plotly_chart(fig_comparison)
+            stats = NavAnalytics.from_snapshots(portfolio_snapshots_df).summary()
+            stat_cols = st.columns(len(stats))
+            for col, (name, value) in zip(stat_cols, stats.items()):
+                text = "N/A" if pd.isna(value) else (f"{value:.2f}" if name == 'Sharpe' else f"{value:+.2%}")
+                col.metric(name.replace('_', ' '), text)
 
         with asset_alloc:
             if not alloc_df.empty:
@@ -305,6 +314,23 @@ def render_live():
                 if not summary.empty:
                     st.dataframe(summary, width='stretch')
 
+    with pipeline:
+        # Stage timings recorded by source/metrics.py on every refresh
+        window, bucket = st.columns(2)
+        days = window.selectbox("Window", [1, 7, 14], index=1, format_func=lambda d: f"Last {d} day(s)",
+                                key="metrics_days")
+        freq = bucket.selectbox("Bucket", ["h", "D"], index=1 if days > 1 else 0,
+                                format_func={"h": "Hourly", "D": "Daily"}.get, key="metrics_freq")
+        latency = metrics.stage_latency(days, freq)
+        stages = sorted(latency['stage'].unique()) if not latency.empty else []
+        chosen = st.multiselect("Stages", stages, default=[s for s in stages if not s.startswith("insert.")],
+                                key="metrics_stages")
+        st.plotly_chart(dashboard.plot_stage_latency(latency, chosen))
+        if not latency.empty:
+            overall = (latency.sort_values('period').groupby('stage')
+                       .agg(p50_ms=('p50_ms', 'last'), p95_ms=('p95_ms', 'last'), spans=('count', 'sum')))
+            st.dataframe(overall.round(1), width='stretch')
+
 render_live()  
 persistent_opend()
 live_update_db()
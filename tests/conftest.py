@@ -0,0 +1,21 @@
+"""Shared fixtures. Database tests run against a throwaway SQLite file, never the real db/."""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from config import settings
+from source import db
+
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """Point the db layer at an empty, initialised database under tmp_path."""
+    monkeypatch.setattr(settings, "MOOMOO_PORTFOLIO_DB_PATH", tmp_path / "test_portfolio.db")
+    db.init_db()
+    yield settings.MOOMOO_PORTFOLIO_DB_PATH
+    db.close_connections()
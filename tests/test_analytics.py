@@ -0,0 +1,97 @@
+"""Tests for the NAV performance analytics (source/analytics.py).
+
+Pure logic only -- no network and no database.
+Run from the project root:  python -m pytest tests/ -q
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from source import analytics
+from source.analytics import NavAnalytics
+
+
+def _series(pairs):
+    dates, values = zip(*pairs)
+    return pd.Series(values, index=dates, dtype=float)
+
+
+@pytest.fixture
+def history():
+    return NavAnalytics(_series([
+        ("2025-03-31", 0.80),
+        ("2025-12-31", 1.00),
+        ("2026-03-31", 1.10),
+        ("2026-04-15", 1.21),
+        ("2026-04-30", 1.00),
+        ("2026-05-04", 1.32),
+    ]))
+
+
+def test_period_returns_start_from_last_nav_before_the_period(history):
+    assert history.period_return("MTD") == pytest.approx(1.32 / 1.00 - 1)
+    assert history.period_return("QTD") == pytest.approx(1.32 / 1.10 - 1)
+    assert history.period_return("YTD") == pytest.approx(1.32 / 1.00 - 1)
+    assert history.period_return("1Y") == pytest.approx(1.32 / 0.80 - 1)
+    assert history.period_return("Inception") == pytest.approx(1.32 / 0.80 - 1)
+
+
+def test_young_history_falls_back_to_inception_and_has_no_1y():
+    young = NavAnalytics(_series([("2026-04-10", 1.0), ("2026-04-20", 1.05)]))
+    assert young.period_return("YTD") == pytest.approx(0.05)
+    assert young.period_return("MTD") == pytest.approx(0.05)
+    assert np.isnan(young.period_return("1Y"))
+
+
+def test_max_drawdown_is_peak_to_trough(history):
+    assert history.max_drawdown() == pytest.approx(1.00 / 1.21 - 1)
+
+
+def test_rolling_return(history):
+    rolling = history.rolling_return(2)
+    assert rolling.iloc[:2].isna().all()
+    assert rolling.iloc[-1] == pytest.approx(1.32 / 1.21 - 1)
+
+
+def test_volatility_and_sharpe():
+    returns = np.array([0.01, -0.005, 0.02, 0.0, 0.004])
+    nav = np.concatenate(([1.0], np.cumprod(1 + returns)))
+    stats = NavAnalytics(pd.Series(nav, index=pd.bdate_range("2026-01-05", periods=len(nav))))
+    vol = returns.std(ddof=1) * np.sqrt(252)
+    assert stats.volatility() == pytest.approx(vol)
+    assert stats.sharpe(0.02) == pytest.approx((returns.mean() * 252 - 0.02) / vol)
+
+
+def test_sparse_snapshots_are_annualised_by_their_spacing():
+    returns = np.array([0.01, -0.005, 0.02, 0.0, 0.004])
+    nav = np.concatenate(([1.0], np.cumprod(1 + returns)))
+    # One snapshot a week (Mondays): 5 returns over 25 business days -> ~50 periods a year
+    weekly = NavAnalytics(pd.Series(nav, index=pd.date_range("2026-01-05", periods=len(nav), freq="W-MON")))
+    assert weekly.periods_per_year() == pytest.approx(252 / 5)
+    vol = returns.std(ddof=1) * np.sqrt(252 / 5)
+    assert weekly.volatility() == pytest.approx(vol)
+    assert weekly.sharpe() == pytest.approx(returns.mean() * 252 / 5 / vol)
+    # An explicit frequency still wins
+    assert weekly.volatility(252) == pytest.approx(returns.std(ddof=1) * np.sqrt(252))
+
+
+def test_twr_uses_exact_snapshot_dates(history):
+    assert history.twr("2025-12-31", "2026-03-31") == pytest.approx(0.10)
+    assert np.isnan(history.twr("2026-01-01"))
+
+
+def test_unsorted_duplicate_and_empty_rows_are_cleaned():
+    stats = NavAnalytics(_series([("2026-01-06", 1.1), ("2026-01-05", 0.0), ("2026-01-05", 1.0), ("2026-01-06", 1.2)]))
+    assert stats.nav.tolist() == [1.0, 1.2]
+    empty = NavAnalytics(pd.Series(dtype=float))
+    assert np.isnan(empty.twr()) and np.isnan(empty.max_drawdown())
+    assert all(np.isnan(v) for v in empty.periods.values())
+
+
+def test_from_snapshots_is_memoised_per_frame_content():
+    analytics._cache.clear()
+    df = pd.DataFrame({"date": ["2026-01-05", "2026-01-06"], "nav": [1.0, 1.1]})
+    first = NavAnalytics.from_snapshots(df)
+    assert NavAnalytics.from_snapshots(df.copy()) is first
+    df.loc[2] = ["2026-01-07", 1.2]
+    assert NavAnalytics.from_snapshots(df) is not first
@@ -0,0 +1,45 @@
+"""Smoke tests for the offline benchmark harness (benchmarks/).
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+from benchmarks import bench_pipeline
+from benchmarks.fakes import offline
+from benchmarks.synthetic import SyntheticPortfolio
+from config import settings
+from source import moomoo_api
+
+TINY = {"years": 1, "symbols": 6, "orders": 50, "cashflows": 20, "end": "2026-06-01"}
+
+
+def test_synthetic_portfolio_is_reproducible():
+    a, b = SyntheticPortfolio(**TINY), SyntheticPortfolio(**TINY)
+    assert a.orders.equals(b.orders)
+    assert a.cashflow.equals(b.cashflow)
+    assert len(a.snapshots) == 252
+
+
+def test_offline_serves_the_portfolio_through_moomoo_api():
+    portfolio = SyntheticPortfolio(**TINY)
+    with offline(portfolio) as (ctx, yf):
+        assert moomoo_api.configure_moomoo_api() is ctx
+        orders = moomoo_api.opend_limiter.call("history_order_list_query", ctx.history_order_list_query)
+        assert len(orders) == len(portfolio.orders)
+        bars = yf.download(["^GSPC"], start=portfolio.start, end=portfolio.end)
+        assert ("Close", "^GSPC") in bars.columns
+    assert ctx.calls["history_order_list_query"] == 1
+
+
+def test_every_scenario_runs_against_a_throwaway_db():
+    real_db = settings.MOOMOO_PORTFOLIO_DB_PATH
+    names = [name for name in bench_pipeline.SCENARIOS if name != "upload_to_db"]
+    results = bench_pipeline.run(TINY, names, repeat=1)
+    assert set(results) == set(names)
+    assert all(result["median_s"] >= 0 for result in results.values())
+    assert settings.MOOMOO_PORTFOLIO_DB_PATH == real_db
+
+
+def test_compare_flags_regressions(capsys):
+    results = {"net_p_l": {"min_s": 0.2, "median_s": 0.3}, "cleanup": {"min_s": 0.1, "median_s": 0.1}}
+    baseline = {"net_p_l": {"median_s": 0.1}, "cleanup": {"median_s": 0.1}}
+    assert bench_pipeline.compare(results, baseline, tolerance=1.5) == ["net_p_l"]
+    assert "REGRESSION" in capsys.readouterr().out
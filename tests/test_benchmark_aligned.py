@@ -0,0 +1,110 @@
+"""Tests for the materialised benchmark_aligned table and the dashboard comparison built on it.
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from source import dashboard, db
+
+SNAPSHOT_DATES = ["2026-01-05", "2026-01-06", "2026-01-07", "2026-01-08", "2026-01-09"]
+
+
+def _snapshots(dates=SNAPSHOT_DATES, start=100.0):
+    return pd.DataFrame({"date": dates, "total_assets": 1000.0, "nav": start + np.arange(len(dates))})
+
+
+def _bars(symbol, dates, closes):
+    return pd.DataFrame({"Date": [f"{d} 00:00:00" for d in dates], "Symbol": symbol, "Close": closes})
+
+
+def _aligned():
+    return db.read_db("SELECT date, Symbol, Close FROM benchmark_aligned ORDER BY Symbol, date")
+
+
+def _legacy_comparison(snapshots, bars):
+    """The per-render pivot/merge that benchmark_aligned replaces."""
+    twr = snapshots.copy()
+    twr["date"] = pd.to_datetime(twr["date"]).dt.date
+    bars = bars.assign(Date=pd.to_datetime(bars["Date"]).dt.date)
+    pivoted = bars.pivot(index="Date", columns="Symbol", values="Close")
+    pivoted = pivoted.rename(columns={v: k for k, v in db.indices_dict().items()})
+    merged = pd.merge(twr[["date", "nav"]], pivoted, left_on="date", right_index=True, how="left")
+    return merged.sort_values("date").ffill().bfill()
+
+
+def test_closes_are_aligned_as_of_each_snapshot_date(tmp_db):
+    db.insert_dataframe(_snapshots(), "portfolio_snapshots")
+    # ^STI has no bar on the 7th (holiday) and none before the 6th
+    db.insert_dataframe(pd.concat([_bars("^GSPC", SNAPSHOT_DATES, [10, 11, 12, 13, 14]),
+                                   _bars("^STI", ["2026-01-06", "2026-01-08", "2026-01-09"], [5, 6, 7])]),
+                        "benchmark_history")
+    sti = _aligned().query("Symbol == '^STI'")
+    assert sti["date"].tolist() == SNAPSHOT_DATES
+    assert sti["Close"].tolist() == [5, 5, 5, 6, 7]
+
+
+def test_new_snapshot_dates_are_aligned_incrementally(tmp_db):
+    db.insert_dataframe(_snapshots(SNAPSHOT_DATES[:3]), "portfolio_snapshots")
+    db.insert_dataframe(_bars("^GSPC", SNAPSHOT_DATES, [10, 11, 12, 13, 14]), "benchmark_history")
+    assert db.refresh_benchmark_aligned(SNAPSHOT_DATES[0], new_dates_only=True) == 0
+
+    db.insert_dataframe(_snapshots(SNAPSHOT_DATES[3:]), "portfolio_snapshots")
+    assert _aligned()["Close"].tolist() == [10, 11, 12, 13, 14]
+    # A nav rewrite keeps the dates, so nothing needs aligning
+    assert db.refresh_benchmark_aligned(SNAPSHOT_DATES[0], new_dates_only=True) == 0
+
+
+def test_late_bars_update_the_dates_after_them(tmp_db):
+    db.insert_dataframe(_snapshots(), "portfolio_snapshots")
+    db.insert_dataframe(_bars("^GSPC", SNAPSHOT_DATES[:3], [10, 11, 12]), "benchmark_history")
+    assert _aligned()["Close"].tolist() == [10, 11, 12, 12, 12]
+
+    db.insert_dataframe(_bars("^GSPC", SNAPSHOT_DATES[3:], [13, 14]), "benchmark_history")
+    assert _aligned()["Close"].tolist() == [10, 11, 12, 13, 14]
+
+
+def test_a_new_symbol_is_aligned_over_the_whole_history(tmp_db):
+    db.insert_dataframe(_snapshots(), "portfolio_snapshots")
+    db.insert_dataframe(_bars("^GSPC", SNAPSHOT_DATES, [10, 11, 12, 13, 14]), "benchmark_history")
+    db.insert_dataframe(_bars("^HSI", SNAPSHOT_DATES[2:], [20, 21, 22]), "benchmark_history")
+    assert _aligned().query("Symbol == '^HSI'")["Close"].tolist() == [20, 20, 20, 21, 22]
+
+
+def test_migration_backfills_existing_history(tmp_db):
+    db.insert_dataframe(_snapshots(), "portfolio_snapshots")
+    db.insert_dataframe(_bars("^GSPC", SNAPSHOT_DATES, [10, 11, 12, 13, 14]), "benchmark_history")
+    with db.db_contextmanager() as conn:
+        conn.execute("DROP TABLE benchmark_aligned")
+        conn.execute("PRAGMA user_version = 5")
+    db.init_db()
+    assert len(_aligned()) == len(SNAPSHOT_DATES)
+    assert db.verify_schema() == []
+
+
+def test_comparison_matches_the_pivot_merge(tmp_db):
+    snapshots = _snapshots()
+    bars = pd.concat([_bars("^GSPC", SNAPSHOT_DATES, [10, 11, 12, 13, 14]),
+                      _bars("^STI", ["2026-01-05", "2026-01-08", "2026-01-09"], [5, 6, 7])])
+    db.insert_dataframe(snapshots, "portfolio_snapshots")
+    db.insert_dataframe(bars, "benchmark_history")
+
+    comparison = dashboard.comparison_df(snapshots)
+    legacy = _legacy_comparison(snapshots, bars)
+    assert list(comparison.columns) == list(legacy.columns) == ["date", "nav", "SP500", "STI"]
+    assert np.array_equal(comparison.drop(columns="date").to_numpy(), legacy.drop(columns="date").to_numpy())
+    assert (comparison["date"].dt.date == legacy["date"]).all()
+
+
+def test_comparison_percent_divides_by_the_first_row():
+    df = pd.DataFrame({"date": pd.to_datetime(SNAPSHOT_DATES[:3]), "nav": [100.0, 110.0, 99.0],
+                       "SP500": [0.0, 1.0, 2.0], "STI": [np.nan, 5.0, 6.0], "HSI": [3.0, 3.3, 3.0]})
+    percent = dashboard.comparison_percent(df)
+    assert list(percent.columns) == ["date", "Portfolio", "SP500", "STI", "HSI"]
+    assert percent["Portfolio"].tolist() == [0.0, 10.0, -1.0]
+    assert percent["HSI"].tolist() == pytest.approx([0.0, 10.0, 0.0])
+    # No usable first value: the column is flat at 0
+    assert percent["SP500"].tolist() == [0.0, 0.0, 0.0]
+    assert percent["STI"].tolist() == [0.0, 0.0, 0.0]
+    assert "nav" in df.columns
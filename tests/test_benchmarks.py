@@ -0,0 +1,96 @@
+"""Tests for the incremental, batched benchmark_history sync (db.update_benchmarks).
+yfinance is stubbed out.
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from source import db
+
+HISTORY = pd.bdate_range("2026-01-05", "2026-01-16")
+
+
+@pytest.fixture
+def fake_yf(tmp_db, monkeypatch):
+    """Serve daily bars from HISTORY for any ticker list, honouring start/end/period."""
+
+    class FakeYF:
+        calls = []
+
+        def download(self, tickers, start=None, end=None, period=None, **kwargs):
+            self.calls.append({"tickers": list(tickers), "start": start, "end": end, "period": period})
+            dates = HISTORY
+            if start:
+                dates = dates[dates >= pd.Timestamp(start)]
+            if end:
+                dates = dates[dates < pd.Timestamp(end)]
+            columns = pd.MultiIndex.from_product([["Close", "High", "Low", "Open", "Volume"], tickers],
+                                                 names=["Price", "Ticker"])
+            values = np.arange(len(dates) * len(columns), dtype=float).reshape(len(dates), len(columns))
+            return pd.DataFrame(values, index=pd.DatetimeIndex(dates, name="Date"), columns=columns)
+
+    fake = FakeYF()
+    monkeypatch.setattr(db.yf, "download", fake.download)
+    monkeypatch.setattr(db, "_benchmarks_requested", {})
+    return fake
+
+
+def _stored():
+    return db.read_db("SELECT Symbol, COUNT(*) AS n, MAX(Date) AS last FROM benchmark_history "
+                      "GROUP BY Symbol").set_index("Symbol")
+
+
+def test_first_run_fetches_every_symbol_in_one_request(fake_yf):
+    rows = db.update_benchmarks(["^GSPC", "^STI"], today_date="2026-01-17")
+    assert len(fake_yf.calls) == 1
+    assert fake_yf.calls[0]["period"] == "max"
+    assert rows == 2 * len(HISTORY)
+    assert _stored()["n"].tolist() == [len(HISTORY)] * 2
+
+
+def test_up_to_date_history_skips_download(fake_yf):
+    db.update_benchmarks(["^GSPC", "^STI"], today_date="2026-01-17")
+    fake_yf.calls.clear()
+    # Saturday after the last stored Friday bar: no session has closed since
+    assert db.update_benchmarks(["^GSPC", "^STI"], today_date="2026-01-17") == 0
+    assert fake_yf.calls == []
+
+
+def test_only_missing_range_is_fetched(fake_yf):
+    db.update_benchmarks(["^GSPC", "^STI"], today_date="2026-01-17")
+    with db.db_contextmanager() as conn:
+        conn.execute("DELETE FROM benchmark_history WHERE Symbol = '^STI' AND Date >= '2026-01-14'")
+    fake_yf.calls.clear()
+
+    rows = db.update_benchmarks(["^GSPC", "^STI", "^HSI"], today_date="2026-01-17")
+    new_call, delta_call = fake_yf.calls
+    assert new_call == {"tickers": ["^HSI"], "start": None, "end": None, "period": "max"}
+    assert delta_call["tickers"] == ["^STI"] and delta_call["start"] == "2026-01-13"
+    # ^HSI in full, ^STI from its last stored bar (re-fetched) onwards
+    assert rows == len(HISTORY) + 4
+    stored = _stored()
+    assert stored.loc["^STI", "n"] == len(HISTORY)
+    assert stored["last"].str.startswith("2026-01-16").all()
+
+
+def test_holiday_lag_is_requested_once_per_close(fake_yf):
+    db.update_benchmarks(["^GSPC", "^STI"], today_date="2026-01-17")
+    fake_yf.calls.clear()
+    # Monday 2026-01-19 is a US holiday: no bar for it, yet it is the latest business day
+    assert db.update_benchmarks(["^GSPC", "^STI"], today_date="2026-01-20") == 2  # the last bar, re-fetched
+    assert len(fake_yf.calls) == 1
+    assert db.update_benchmarks(["^GSPC", "^STI"], today_date="2026-01-20") == 0
+    assert len(fake_yf.calls) == 1
+    # A newer close is due the next day: asked once more
+    db.update_benchmarks(["^GSPC", "^STI"], today_date="2026-01-21")
+    assert len(fake_yf.calls) == 2
+
+
+def test_symbol_without_history_is_not_requested_again(fake_yf, monkeypatch):
+    monkeypatch.setattr(db, "_download_benchmarks",
+                        lambda symbols, **kwargs: pd.DataFrame(columns=db.BENCHMARK_COLUMNS))
+    assert db.update_benchmarks(["^DELISTED"], today_date="2026-01-17") == 0
+    monkeypatch.setattr(db, "_download_benchmarks", lambda symbols, **kwargs: pytest.fail("re-downloaded"))
+    assert db.update_benchmarks(["^DELISTED"], today_date="2026-01-17") == 0
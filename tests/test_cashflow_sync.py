@@ -0,0 +1,63 @@
+"""Tests for the incremental cash-flow sync (settlement calendar + cashflow_sync state).
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+from datetime import datetime
+
+import pandas as pd
+
+from source import db
+from source.cleanup import settlement_dates
+
+
+def test_settlement_dates_skip_weekends_newest_first():
+    # 2026-01-09 is a Friday, 2026-01-12 a Monday
+    assert settlement_dates(datetime(2026, 1, 9), datetime(2026, 1, 12)) == ["2026-01-12", "2026-01-09"]
+
+
+def test_settlement_dates_skip_holidays():
+    dates = settlement_dates(datetime(2026, 1, 1), datetime(2026, 1, 2), holidays=["2026-01-01"])
+    assert dates == ["2026-01-02"]
+
+
+def test_settlement_dates_empty_when_reversed():
+    assert settlement_dates(datetime(2026, 1, 12), datetime(2026, 1, 9)) == []
+
+
+def test_only_missing_or_unsettled_dates_are_fetched(tmp_db):
+    today = datetime(2026, 1, 16)  # Friday
+    old_day, recent_day = "2026-01-05", "2026-01-15"
+    db.mark_cashflow_synced([old_day, recent_day], now=today)
+
+    todo = db.cashflow_dates_to_fetch(datetime(2026, 1, 5), today)
+    assert old_day not in todo            # settled long ago -> never asked again
+    assert recent_day in todo             # fetched before it was final -> asked again
+    assert todo[0] == "2026-01-16"        # newest first
+    assert "2026-01-10" not in todo       # Saturday
+
+
+def test_mark_synced_records_row_counts(tmp_db):
+    cashflow = pd.DataFrame({"Date": ["2026-01-05", "2026-01-05"]})
+    db.mark_cashflow_synced(["2026-01-05", "2026-01-06"], cashflow)
+    df = db.read_db("SELECT clearing_date, rows, is_final FROM cashflow_sync ORDER BY clearing_date")
+    assert df["rows"].tolist() == [2, 0]
+    assert df["is_final"].tolist() == [1, 1]
+
+
+def test_reclassify_updates_only_stale_flags(tmp_db, capsys):
+    db.insert_dataframe(pd.DataFrame({
+        "cashflow_id": ["a", "b", "c"],
+        "Date": ["2026-01-05", "2026-01-06", "2026-01-07"],
+        "Currency": ["SGD"] * 3,
+        "Type": ["Coupon", "Bank Transfer Deposits", "Others"],
+        "Remark": ["Cash Voucher", "", "Fund Subscription"],
+        "Amount": [5.0, 100.0, -50.0],
+        "is_external": [1, 1, 1],
+        "is_income": [0, 0, 0],
+    }), "cashflow")
+    db.reclassify_cashflow()
+    assert "(2 changed)" in capsys.readouterr().out
+    flags = db.read_db("SELECT cashflow_id, is_external, is_income FROM cashflow ORDER BY cashflow_id")
+    assert flags.values.tolist() == [["a", 0, 1], ["b", 1, 0], ["c", 0, 0]]
+    db.reclassify_cashflow()
+    assert "(0 changed)" in capsys.readouterr().out
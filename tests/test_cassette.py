@@ -0,0 +1,148 @@
+"""Tests for OpenD record/replay (source/cassette.py).
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+from datetime import datetime
+
+import moomoo
+import pytest
+
+from benchmarks.fakes import FakeTradeContext
+from benchmarks.synthetic import SyntheticPortfolio
+from source import cassette, moomoo_api
+from source.rate_limit import RateLimiter
+
+
+@pytest.fixture
+def portfolio():
+    return SyntheticPortfolio(years=1, symbols=6, orders=50, cashflows=20, end="2026-06-01")
+
+
+def _record(portfolio, path):
+    recorder = cassette.CassetteRecorder(FakeTradeContext(portfolio), path)
+    recorder.accinfo_query(trd_env="REAL", refresh_cache=True, currency="SGD")
+    recorder.position_list_query(trd_env="REAL", refresh_cache=True)
+    day = portfolio.cashflow['clearing_date'].iloc[0]
+    recorder.get_acc_cash_flow(clearing_date=day, trd_env="REAL")
+    recorder.history_order_list_query(start="2025-06-01 00:00:00", end="2026-06-01 09:30:00")
+    recorder.close()
+    return day
+
+
+def test_replay_returns_the_recorded_responses(portfolio, tmp_path):
+    path = tmp_path / "opend.pkl.gz"
+    day = _record(portfolio, path)
+    player = cassette.CassettePlayer(path, speed=0)
+
+    ret, positions = player.position_list_query(trd_env="REAL", refresh_cache=True)
+    assert ret == moomoo.RET_OK
+    assert positions.equals(portfolio.positions)
+    _, cashflow = player.get_acc_cash_flow(clearing_date=day, trd_env="REAL")
+    assert (cashflow['clearing_date'] == day).all()
+    # Matched on the window start only: "now" moves between recording and replay
+    _, orders = player.history_order_list_query(start="2025-06-01 00:00:00", end="2026-10-18 12:00:00")
+    assert not orders.empty
+    assert cassette.summary(path)['responses']['get_acc_cash_flow'] == 1
+
+
+def test_unrecorded_query_is_a_miss(portfolio, tmp_path):
+    path = tmp_path / "opend.pkl.gz"
+    _record(portfolio, path)
+    with pytest.raises(cassette.CassetteMiss):
+        cassette.CassettePlayer(path, speed=0).get_acc_cash_flow(clearing_date="1999-01-04", trd_env="REAL")
+
+
+def test_repeated_queries_replay_in_order_then_repeat_the_last(tmp_path):
+    class Counting:
+        n = 0
+
+        def position_list_query(self, **kwargs):
+            self.n += 1
+            return moomoo.RET_OK, self.n
+
+        def close(self):
+            pass
+
+    path = tmp_path / "opend.pkl.gz"
+    recorder = cassette.CassetteRecorder(Counting(), path)
+    recorder.position_list_query()
+    recorder.position_list_query()
+    recorder.close()
+    player = cassette.CassettePlayer(path, speed=0)
+    assert [player.position_list_query()[1] for _ in range(3)] == [1, 2, 2]
+
+
+def test_a_reconnect_appends_to_what_was_recorded_before(portfolio, tmp_path):
+    path = tmp_path / "opend.pkl.gz"
+    day = _record(portfolio, path)
+    # The supervisor's next context records into the same cassette
+    recorder = cassette.CassetteRecorder(FakeTradeContext(portfolio), path)
+    recorder.position_list_query(trd_env="REAL", refresh_cache=True)
+    recorder.close()
+    responses = cassette.summary(path)["responses"]
+    assert responses["position_list_query"] == 2
+    assert responses["get_acc_cash_flow"] == 1
+    cassette.CassettePlayer(path, speed=0).get_acc_cash_flow(clearing_date=day, trd_env="REAL")
+
+
+def test_recorder_flushes_periodically_and_caps_repeats(portfolio, tmp_path, monkeypatch):
+    monkeypatch.setattr(cassette.settings, "OPEND_CASSETTE_MAX_REPEATS", 3)
+    path = tmp_path / "opend.pkl.gz"
+    recorder = cassette.CassetteRecorder(FakeTradeContext(portfolio), path, flush_every=2)
+    for _ in range(5):
+        recorder.position_list_query(trd_env="REAL", refresh_cache=True)
+    # Written before close, without waiting for the process to exit
+    assert cassette.summary(path)["responses"]["position_list_query"] == 3
+    recorder.close()
+    assert cassette.summary(path)["responses"]["position_list_query"] == 3
+
+
+def test_replay_speed_scales_the_recorded_latency(portfolio, tmp_path):
+    path = tmp_path / "opend.pkl.gz"
+    _record(portfolio, path)
+    recorded = cassette.load(path)['calls'][1]['elapsed']
+    slept = []
+    player = cassette.CassettePlayer(path, speed=4, sleep=slept.append)
+    player.position_list_query()
+    assert slept == [pytest.approx(recorded / 4)]
+
+
+def test_replay_mode_runs_the_api_without_opend(portfolio, tmp_path, monkeypatch):
+    path = tmp_path / "opend.pkl.gz"
+    _record(portfolio, path)
+    monkeypatch.setattr(moomoo_api.settings, "OPEND_MODE", "replay")
+    monkeypatch.setattr(moomoo_api.settings, "OPEND_CASSETTE", path)
+    monkeypatch.setattr(moomoo_api.settings, "OPEND_REPLAY_SPEED", 0)
+    monkeypatch.setattr(moomoo_api, "opend_limiter", RateLimiter({}))
+    monkeypatch.setattr(moomoo_api, "is_opend_responsive", lambda: pytest.fail("replay must not touch OpenD"))
+
+    with moomoo_api.opend_session() as trade_ctx:
+        assert isinstance(trade_ctx, cassette.CassettePlayer)
+        assert len(moomoo_api.get_positions(trade_ctx)) == len(portfolio.positions)
+        assert moomoo_api.account_info(trade_ctx).equals(portfolio.acc_info)
+
+
+def test_order_history_replays_against_any_database(portfolio, tmp_path, monkeypatch):
+    path = tmp_path / "opend.pkl.gz"
+    monkeypatch.setattr(moomoo_api.settings, "OPEND_CASSETTE", path)
+    monkeypatch.setattr(moomoo_api.settings, "START_DATE", datetime(2025, 6, 1))
+    monkeypatch.setattr(moomoo_api, "opend_limiter", RateLimiter({}))
+
+    # Recorded against a database whose newest order gave one sync start...
+    monkeypatch.setattr(moomoo_api.settings, "OPEND_MODE", "record")
+    recorder = cassette.CassetteRecorder(FakeTradeContext(portfolio), path)
+    recorded = moomoo_api.get_historical_orders(recorder, start=datetime(2026, 3, 1))
+    recorder.close()
+
+    # ...and replayed against one that would start elsewhere (or from scratch)
+    monkeypatch.setattr(moomoo_api.settings, "OPEND_MODE", "replay")
+    player = cassette.CassettePlayer(path, speed=0)
+    for start in (datetime(2026, 5, 1), None):
+        replayed = moomoo_api.get_historical_orders(player, start=start)
+        assert len(replayed) == len(recorded)
+
+
+def test_unknown_mode_is_rejected(monkeypatch):
+    monkeypatch.setattr(moomoo_api.settings, "OPEND_MODE", "replya")
+    with pytest.raises(ValueError):
+        moomoo_api.configure_moomoo_api()
@@ -0,0 +1,84 @@
+"""Tests for the pooled connection layer and the transaction() unit of work.
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+import sqlite3
+import threading
+
+import pandas as pd
+import pytest
+
+from source import db
+
+
+def _snapshot(date_str, total):
+    return pd.DataFrame({"date": [date_str], "total_assets": [total], "stocks": [total],
+                         "options": [0.0], "cash": [0.0], "nav": [1.0], "units": [total]})
+
+
+def test_connection_is_reused_within_a_thread(tmp_db):
+    assert db.get_connection() is db.get_connection()
+
+
+def test_each_thread_gets_its_own_connection(tmp_db):
+    other = []
+    t = threading.Thread(target=lambda: other.append(db.get_connection()))
+    t.start()
+    t.join()
+    assert other[0] is not db.get_connection()
+
+
+def test_pragmas_applied_once_on_open(tmp_db):
+    conn = db.get_connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2   # MEMORY
+
+
+def test_transaction_commits_once_at_the_end(tmp_db):
+    with db.transaction():
+        db.insert_dataframe(_snapshot("2026-01-05", 100.0), "portfolio_snapshots")
+        db.insert_dataframe(_snapshot("2026-01-06", 110.0), "portfolio_snapshots")
+        # A separate connection must not see uncommitted work yet
+        outside = sqlite3.connect(str(tmp_db))
+        assert outside.execute("SELECT COUNT(*) FROM portfolio_snapshots").fetchone()[0] == 0
+        outside.close()
+    assert len(db.read_db("SELECT * FROM portfolio_snapshots")) == 2
+
+
+def test_transaction_rolls_back_on_error(tmp_db):
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.insert_dataframe(_snapshot("2026-01-05", 100.0), "portfolio_snapshots")
+            raise RuntimeError("tick failed")
+    assert db.table_empty("portfolio_snapshots")
+
+
+def test_insert_dataframe_upserts_on_primary_key(tmp_db):
+    db.insert_dataframe(_snapshot("2026-01-05", 100.0), "portfolio_snapshots")
+    db.insert_dataframe(_snapshot("2026-01-05", 125.0), "portfolio_snapshots")
+    df = db.read_db("SELECT date, total_assets FROM portfolio_snapshots")
+    assert df.to_dict("records") == [{"date": "2026-01-05", "total_assets": 125.0}]
+
+
+def test_insert_dataframe_reports_inserted_and_updated(tmp_db):
+    assert db.insert_dataframe(_snapshot("2026-01-05", 100.0), "portfolio_snapshots") == (1, 0)
+    both = pd.concat([_snapshot("2026-01-05", 101.0), _snapshot("2026-01-06", 102.0)])
+    assert db.insert_dataframe(both, "portfolio_snapshots") == (1, 1)
+    assert db.insert_dataframe(pd.DataFrame(), "portfolio_snapshots") == (0, 0)
+
+
+def test_upsert_keeps_columns_not_in_the_frame(tmp_db):
+    db.insert_dataframe(_snapshot("2026-01-05", 100.0), "portfolio_snapshots")
+    db.insert_dataframe(pd.DataFrame({"date": ["2026-01-05"], "cash": [5.0]}), "portfolio_snapshots")
+    row = db.read_db("SELECT total_assets, cash FROM portfolio_snapshots").iloc[0]
+    assert (row["total_assets"], row["cash"]) == (100.0, 5.0)
+
+
+def test_insert_dataframe_writes_nulls_and_datetimes(tmp_db):
+    bars = pd.DataFrame({"Date": pd.to_datetime(["2026-01-05"]), "Close": [float("nan")],
+                         "Symbol": ["^GSPC"]})
+    db.insert_dataframe(bars, "benchmark_history")
+    row = db.read_db("SELECT Date, Close FROM benchmark_history").iloc[0]
+    assert row["Date"] == "2026-01-05 00:00:00"
+    assert pd.isna(row["Close"])
@@ -0,0 +1,127 @@
+"""Tests for the FX engine (source/fx.py): vectorised conversion, the fx_rates store,
+as-of lookups and offline fallback. yfinance is stubbed out.
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from source import db, fx
+
+
+def _history(rows):
+    df = pd.DataFrame({("Close", "USDSGD=X"): [r for _, r in rows]},
+                      index=pd.DatetimeIndex([d for d, _ in rows], name="Date"))
+    df.columns = pd.MultiIndex.from_tuples(df.columns, names=["Price", "Ticker"])
+    return df
+
+
+@pytest.fixture
+def fake_yf(tmp_db, monkeypatch):
+    """Serve a fixed USD->SGD history; set .offline = True to simulate a network failure."""
+
+    class FakeYF:
+        offline = False
+        calls = []
+
+        def download(self, tickers, **kwargs):
+            self.calls.append((tickers, kwargs))
+            if self.offline:
+                raise ConnectionError("no network")
+            if kwargs.get("period"):
+                return _history([("2026-01-09", 1.3333)])
+            return _history([("2026-01-05", 1.30), ("2026-01-06", 1.35), ("2026-01-09", 1.40)])
+
+    fake = FakeYF()
+    monkeypatch.setattr(fx.yf, "download", fake.download)
+    fx.get_exchange_rate.cache_clear()
+    fx._stale_rates.clear()
+    fx._rate_gaps.clear()
+    yield fake
+    fx.get_exchange_rate.cache_clear()
+    fx._stale_rates.clear()
+    fx._rate_gaps.clear()
+
+
+def test_convert_column_resolves_each_currency_once(fake_yf):
+    amounts = pd.Series([100.0, 50.0, 10.0, 20.0])
+    currencies = pd.Series(["USD", "SGD", "USD", "USD"])
+    out = fx.convert_column(amounts, currencies, "SGD")
+    assert out.tolist() == [133.3, 50.0, 13.33, 26.66]
+    assert len(fake_yf.calls) == 1  # SGD->SGD needs no lookup, USD looked up once
+
+
+def test_convert_column_matches_convert_currency(fake_yf):
+    amounts = pd.Series([12.345, 99.99])
+    out = fx.convert_column(amounts, pd.Series(["USD", "USD"]), "SGD")
+    assert out.tolist() == [fx.convert_currency(a, "USD", "SGD") for a in amounts]
+
+
+def test_asof_uses_rate_on_or_before_each_date(fake_yf):
+    amounts = pd.Series([100.0, 100.0, 100.0, 100.0], index=[10, 11, 12, 13])
+    currencies = pd.Series(["USD", "USD", "SGD", "USD"], index=amounts.index)
+    dates = pd.Series(["2026-01-06", "2026-01-08", "2026-01-08", "2026-01-05"], index=amounts.index)
+    out = fx.convert_column_asof(amounts, currencies, dates, "SGD")
+    # 01-08 has no bar -> previous close (01-06); original order and index preserved
+    assert out.to_dict() == {10: 135.0, 11: 135.0, 12: 100.0, 13: 130.0}
+
+
+def test_backfill_is_stored_and_not_repeated(fake_yf):
+    assert fx.backfill_fx_rates(["USD"], "SGD", "2026-01-05", "2026-01-10") == 3
+    stored = db.read_db("SELECT Date, Rate FROM fx_rates WHERE Pair = 'USDSGD' ORDER BY Date")
+    assert stored["Date"].tolist() == ["2026-01-05", "2026-01-06", "2026-01-09"]
+    calls = len(fake_yf.calls)
+    # Friday's close is stored, so a Saturday/Monday lookup needs no new request
+    fx.backfill_fx_rates(["USD"], "SGD", "2026-01-05", "2026-01-12")
+    assert len(fake_yf.calls) == calls
+
+
+def test_backfill_from_a_holiday_is_requested_once(fake_yf):
+    # 2026-01-01 has no bar: the first stored close (01-05) is later than the requested start
+    assert fx.backfill_fx_rates(["USD"], "SGD", "2025-12-20", "2026-01-10") == 3
+    fx.backfill_fx_rates(["USD"], "SGD", "2025-12-20", "2026-01-10")
+    fx.backfill_fx_rates(["USD"], "SGD", "2026-01-01", "2026-01-10")
+    assert len(fake_yf.calls) == 1
+
+
+def test_offline_spot_uses_last_stored_rate_and_flags_it(fake_yf):
+    fx.backfill_fx_rates(["USD"], "SGD", "2026-01-05", "2026-01-10")
+    fake_yf.offline = True
+    assert fx.get_exchange_rate("USD", "SGD", "tag") == 1.40
+    assert fx.stale_rates() == {"USDSGD": pd.Timestamp("2026-01-09")}
+
+
+def test_offline_with_empty_store_uses_builtin_fallback(fake_yf):
+    fake_yf.offline = True
+    assert fx.get_exchange_rate("USD", "SGD", "tag") == 1.28
+    assert fx.stale_rates() == {"USDSGD": None}
+
+
+def test_spot_rate_is_persisted_and_clears_stale_flag(fake_yf):
+    fx._stale_rates["USDSGD"] = None
+    assert fx.get_exchange_rate("USD", "SGD", "tag") == 1.333
+    assert fx.stale_rates() == {}
+    stored = db.read_db("SELECT Rate, Source FROM fx_rates")
+    assert stored.values.tolist() == [[1.333, "spot"]]
+
+
+def test_history_gap_is_flagged_apart_from_live_staleness_and_cleared_when_filled(fake_yf):
+    fx.backfill_fx_rates(["USD"], "SGD", "2026-01-05", "2026-01-10")
+    # A row long after the last stored close (01-09) is converted across a gap
+    fx.convert_column_asof(pd.Series([100.0]), pd.Series(["USD"]), pd.Series(["2026-01-30"]), "SGD")
+    assert fx.rate_gaps() == {"USDSGD": pd.Timestamp("2026-01-09")}
+    assert fx.stale_rates() == {}
+
+    db.insert_dataframe(pd.DataFrame({"Date": ["2026-01-29"], "Pair": ["USDSGD"], "Rate": [1.41],
+                                      "Source": ["daily"]}), "fx_rates")
+    fx._index_cache.clear()
+    fx.convert_column_asof(pd.Series([100.0]), pd.Series(["USD"]), pd.Series(["2026-01-30"]), "SGD")
+    assert fx.rate_gaps() == {}
+
+
+def test_rates_asof_before_first_rate_is_missing(fake_yf):
+    fx.backfill_fx_rates(["USD"], "SGD", "2026-01-05", "2026-01-10")
+    rates, _ = fx.rates_asof("USDSGD", [datetime(2026, 1, 1), datetime(2026, 1, 7)])
+    assert pd.isna(rates[0]) and rates[1] == 1.35
@@ -0,0 +1,53 @@
+"""Tests for incremental maintenance of the transactions ledger (db.sync_transactions).
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+import pandas as pd
+
+from source import db
+
+
+def _orders(rows):
+    return pd.DataFrame(rows, columns=["Order_ID", "Symbol", "Name", "Market", "Buy_Sell",
+                                       "Quantity", "Current_Price", "Currency", "date_time"])
+
+
+def _spy_on_ledger_writes(monkeypatch):
+    written = []
+    real_insert = db.insert_dataframe
+
+    def spy(df, table_name):
+        if table_name == "transactions":
+            written.append(sorted(df["Order_ID"]))
+        return real_insert(df, table_name)
+
+    monkeypatch.setattr(db, "insert_dataframe", spy)
+    return written
+
+
+def test_only_new_or_changed_orders_are_processed(tmp_db, monkeypatch):
+    written = _spy_on_ledger_writes(monkeypatch)
+    db.insert_dataframe(_orders([
+        ["1", "SOFI", "SoFi", "US", "BUY", 25, 20.9, "USD", "2026-01-05 10:00:00"],
+        ["2", "NVDA270115C230000", "NVDA C", "US", "SELL", 1, 2.5, "USD", "2026-01-06 10:00:00"],
+    ]), "historical_orders")
+    db.sync_transactions()
+    db.sync_transactions()  # nothing new -> no ledger write
+    db.insert_dataframe(_orders([
+        ["2", "NVDA270115C230000", "NVDA C", "US", "SELL", 2, 2.5, "USD", "2026-01-06 10:00:00"],
+        ["3", "AAPL", "Apple", "US", "SELL", 1, 110.0, "USD", "2026-01-07 10:00:00"],
+    ]), "historical_orders")
+    db.sync_transactions()
+    assert written == [["1", "2"], ["2", "3"]]
+
+    ledger = db.read_db("SELECT Order_ID, Multiplier, Gross_Amount FROM transactions ORDER BY Order_ID")
+    assert ledger.values.tolist() == [["1", 1, -522.5], ["2", 100, 500.0], ["3", 1, 110.0]]
+
+
+def test_full_rebuild_reprocesses_everything(tmp_db, monkeypatch):
+    written = _spy_on_ledger_writes(monkeypatch)
+    db.insert_dataframe(_orders([["1", "SOFI", "SoFi", "US", "BUY", 25, 20.9, "USD", "2026-01-05 10:00:00"]]),
+                        "historical_orders")
+    db.sync_transactions()
+    db.sync_transactions(full=True)
+    assert written == [["1"], ["1"]]
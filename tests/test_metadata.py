@@ -0,0 +1,76 @@
+"""Tests for the batched security-metadata service (source/metadata.py), yfinance stubbed.
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+import pandas as pd
+import pytest
+
+from source import db, metadata
+from source.dashboard import market_cap_class, market_cap_classes
+
+INFO = {
+    "AAPL": {"quoteType": "EQUITY", "sector": "Technology", "industry": "Consumer Electronics",
+             "country": "United States", "marketCap": 3_000_000_000_000},
+    "SPY": {"quoteType": "ETF", "category": "Large Blend", "country": None},
+}
+
+
+@pytest.fixture
+def fake_ticker(tmp_db, monkeypatch):
+    fetched = []
+
+    class FakeTicker:
+        def __init__(self, symbol):
+            self.symbol = symbol
+
+        @property
+        def info(self):
+            fetched.append(self.symbol)
+            if self.symbol not in INFO:
+                raise ValueError("404")
+            return INFO[self.symbol]
+
+    monkeypatch.setattr(metadata.yf, "Ticker", FakeTicker)
+    return fetched
+
+
+def test_info_fetched_once_per_ticker_and_persisted(fake_ticker):
+    df = metadata.security_metadata(["AAPL", "SPY", "AAPL"]).set_index("Ticker")
+    assert sorted(fake_ticker) == ["AAPL", "SPY"]
+    assert df.loc["AAPL", "Sector"] == "Technology"
+    assert df.loc["SPY", "Sector"] == df.loc["SPY", "Industry"] == "Large Blend"
+
+    metadata.security_metadata(["AAPL", "SPY"])  # served from the table within the TTL
+    assert sorted(fake_ticker) == ["AAPL", "SPY"]
+
+
+def test_expired_rows_are_refetched(fake_ticker):
+    metadata.security_metadata(["AAPL"])
+    db.get_connection().execute("UPDATE security_metadata SET fetched_at = '2000-01-01 00:00:00'")
+    metadata.security_metadata(["AAPL"])
+    assert fake_ticker == ["AAPL", "AAPL"]
+
+
+def test_failed_fetch_is_unknown_and_not_retried_until_it_expires(fake_ticker):
+    df = metadata.security_metadata(["ZZZZ"])
+    assert df[["Sector", "Industry"]].values.tolist() == [["Unknown", "Unknown"]]
+    metadata.security_metadata(["ZZZZ"])
+    assert fake_ticker == ["ZZZZ"]
+
+    db.get_connection().execute("UPDATE security_metadata SET fetched_at = '2000-01-01 00:00:00'")
+    metadata.security_metadata(["ZZZZ"])
+    assert fake_ticker == ["ZZZZ", "ZZZZ"]
+
+
+def test_failed_refresh_keeps_the_last_known_values(fake_ticker, monkeypatch):
+    metadata.security_metadata(["AAPL"])
+    db.get_connection().execute("UPDATE security_metadata SET fetched_at = '2000-01-01 00:00:00'")
+    monkeypatch.delitem(INFO, "AAPL")
+    df = metadata.security_metadata(["AAPL"])
+    assert df["Sector"].tolist() == ["Technology"]
+    assert db.read_db("SELECT failed FROM security_metadata")["failed"].tolist() == [1]
+
+
+def test_market_cap_classes_match_scalar_rule():
+    caps = pd.Series([3e12, 5e10, 5e9, 1e9, 1e8, 1e7, 5e7, None])
+    assert market_cap_classes(caps).tolist() == [market_cap_class(c) for c in caps]
@@ -0,0 +1,84 @@
+"""Tests for the pipeline instrumentation (source/metrics.py).
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+import pandas as pd
+import pytest
+
+from source import db, metrics, moomoo_api
+
+
+def _stored():
+    return db.read_db("SELECT run_id, stage, duration_ms, rows, cache_hits, error FROM pipeline_metrics")
+
+
+def test_spans_outside_a_run_are_not_recorded(tmp_db):
+    with metrics.span("orphan"):
+        pass
+    assert metrics.flush() == 0
+    assert _stored().empty
+
+
+def test_run_stores_its_spans(tmp_db):
+    @metrics.timed()
+    def load():
+        return pd.DataFrame({"a": [1, 2, 3]})
+
+    with metrics.run("upload") as run_id:
+        load()
+        with metrics.span("store") as record:
+            record.rows = 7
+    stored = _stored().set_index("stage")
+    assert set(stored.index) == {"upload", "load", "store"}
+    assert (stored["run_id"] == run_id).all()
+    assert stored.loc["load", "rows"] == 3
+    assert stored.loc["store", "rows"] == 7
+    assert (stored["duration_ms"] >= 0).all()
+
+
+def test_failed_stage_records_the_error(tmp_db):
+    with pytest.raises(ValueError):
+        with metrics.run("upload"):
+            with metrics.span("cleanup"):
+                raise ValueError("bad frame")
+    stored = _stored().set_index("stage")
+    assert stored.loc["cleanup", "error"] == "ValueError: bad frame"
+
+
+def test_nested_run_joins_the_outer_run(tmp_db):
+    with metrics.run("upload") as outer:
+        with metrics.run("refresh_snapshot") as inner:
+            assert inner == outer
+    assert _stored()["run_id"].nunique() == 1
+
+
+def test_worker_threads_report_into_the_callers_run(tmp_db):
+    with metrics.run("upload") as run_id:
+        moomoo_api.fetch_concurrently({"positions": lambda: pd.DataFrame({"x": [1, 2]})})
+    stored = _stored().set_index("stage")
+    assert stored.loc["fetch.positions", "run_id"] == run_id
+    assert stored.loc["fetch.positions", "rows"] == 2
+
+
+def test_insert_dataframe_is_instrumented(tmp_db):
+    with metrics.run("upload"):
+        db.insert_dataframe(pd.DataFrame({"date": ["2026-01-05"], "total_assets": [1.0]}), "portfolio_snapshots")
+    assert _stored().set_index("stage").loc["insert.portfolio_snapshots", "rows"] == 1
+
+
+def test_stage_latency_percentiles(tmp_db):
+    now = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+    with db.db_contextmanager() as conn:
+        conn.executemany("INSERT INTO pipeline_metrics (run_id, stage, started_at, duration_ms) VALUES (?, ?, ?, ?)",
+                         [("r", "fetch.positions", now, float(ms)) for ms in range(1, 101)])
+    latency = metrics.stage_latency(days=1).set_index("stage")
+    assert latency.loc["fetch.positions", "p50_ms"] == pytest.approx(50.5)
+    assert latency.loc["fetch.positions", "p95_ms"] == pytest.approx(95.05)
+    assert latency.loc["fetch.positions", "count"] == 100
+
+
+def test_cprofile_mode_writes_a_profile(tmp_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics.settings, "PROFILE_DIR", tmp_path / "profiles")
+    with metrics.run("upload", profile="cprofile") as run_id:
+        sum(range(1000))
+    assert (tmp_path / "profiles" / f"{run_id}.prof").exists()
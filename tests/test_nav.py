@@ -0,0 +1,145 @@
+"""Tests for the vectorised NAV/units engine (source/nav.py).
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from source import db, fx, nav
+
+
+def _step_by_step(total_assets, flows):
+    """The original one-day-at-a-time calc_nav_units recurrence."""
+    navs, units = [], []
+    for i, (ta, cf) in enumerate(zip(total_assets, flows)):
+        if i == 0:
+            units.append(1000.0)
+            navs.append(ta / 1000.0)
+        else:
+            new_nav = (ta - cf) / units[-1]
+            units.append(units[-1] + cf / new_nav)
+            navs.append(new_nav)
+    return navs, units
+
+
+def test_vectorised_matches_daily_recurrence():
+    rng = np.random.default_rng(1)
+    total_assets = 10_000 * np.cumprod(1 + rng.normal(0, 0.01, 500))
+    flows = np.where(rng.random(500) < 0.05, rng.uniform(-500, 2000, 500), 0.0)
+    total_assets = total_assets + np.cumsum(flows)
+    expected_nav, expected_units = _step_by_step(total_assets, flows)
+    got_nav, got_units = nav.nav_units(total_assets, flows)
+    assert got_nav == pytest.approx(expected_nav)
+    assert got_units == pytest.approx(expected_units)
+
+
+def test_deposit_buys_units_without_moving_nav():
+    got_nav, got_units = nav.nav_units([1000.0, 1500.0], [0.0, 500.0])
+    assert got_nav.tolist() == [1.0, 1.0]
+    assert got_units.tolist() == [1000.0, 1500.0]
+
+
+def test_partial_series_continues_from_previous_units():
+    total_assets, flows = [1000.0, 1100.0, 1650.0, 1700.0], [0.0, 0.0, 500.0, 0.0]
+    full_nav, full_units = nav.nav_units(total_assets, flows)
+    tail_nav, tail_units = nav.nav_units(total_assets[2:], flows[2:], prev_units=full_units[1])
+    assert tail_nav == pytest.approx(full_nav[2:])
+    assert tail_units == pytest.approx(full_units[2:])
+
+
+def test_day_funded_entirely_by_its_flow_restarts_at_the_last_nav():
+    # The account is emptied, then refunded: 01-07's whole value is that day's deposit
+    got_nav, got_units = nav.nav_units([1000.0, 1200.0, 500.0, 550.0], [0.0, 0.0, 500.0, 0.0])
+    assert np.isfinite(got_nav).all() and np.isfinite(got_units).all()
+    assert got_nav.tolist() == pytest.approx([1.0, 1.2, 1.2, 1.32])
+    assert got_units[2] == pytest.approx(500.0 / 1.2)
+
+
+def test_unusable_previous_units_reseed_at_previous_nav():
+    for bad in (np.nan, 0.0):
+        got_nav, got_units = nav.nav_units([1650.0, 1700.0], [0.0, 0.0], prev_units=bad, prev_nav=1.1)
+        assert got_nav.tolist() == pytest.approx([1.1, 1.1 * 1700 / 1650])
+        assert got_units.tolist() == pytest.approx([1500.0, 1500.0])
+
+
+@pytest.fixture
+def history(tmp_db, monkeypatch):
+    # Flows are in SGD, so no FX lookups are needed
+    monkeypatch.setattr(fx, "backfill_fx_rates", lambda *a, **k: 0)
+    db.insert_dataframe(pd.DataFrame({
+        "date": ["2026-01-05", "2026-01-06", "2026-01-07", "2026-01-08"],
+        "total_assets": [1000.0, 1100.0, 1650.0, 1700.0],
+    }), "portfolio_snapshots")
+    return tmp_db
+
+
+def _cashflow(rows):
+    return pd.DataFrame(rows, columns=["cashflow_id", "Date", "Currency", "Type", "Amount", "is_external", "is_income"])
+
+
+def _stored():
+    return db.read_db("SELECT date, nav, units FROM portfolio_snapshots ORDER BY date")
+
+
+def test_recompute_whole_history(history):
+    db.insert_dataframe(_cashflow([["c1", "2026-01-07", "SGD", "Deposit", 500.0, 1, 0]]), "cashflow")
+    assert nav.recompute_nav() == 4
+    stored = _stored()
+    units_after_deposit = 1000 * 1650 / 1150
+    assert stored["nav"].tolist() == pytest.approx([1.0, 1.1, 1.15, 1700 / units_after_deposit])
+    assert stored["units"].tolist() == pytest.approx([1000.0, 1000.0, units_after_deposit, units_after_deposit])
+
+
+def test_flow_on_a_day_without_snapshot_counts_on_the_next_snapshot(history):
+    # Saturday deposit, no snapshot until Monday
+    db.insert_dataframe(pd.DataFrame({"date": ["2026-01-12"], "total_assets": [2300.0]}), "portfolio_snapshots")
+    db.insert_dataframe(_cashflow([["c1", "2026-01-10", "SGD", "Deposit", 600.0, 1, 0]]), "cashflow")
+    nav.recompute_nav()
+    stored = _stored()
+    last, prev = stored.iloc[-1], stored.iloc[-2]
+    assert last["nav"] == pytest.approx((2300.0 - 600.0) / prev["units"])
+
+
+def test_partial_recompute_leaves_earlier_rows(history):
+    nav.recompute_nav()
+    with db.db_contextmanager() as conn:
+        conn.execute("UPDATE portfolio_snapshots SET nav = -1 WHERE date = '2026-01-05'")
+    db.insert_dataframe(_cashflow([["c1", "2026-01-07", "SGD", "Deposit", 500.0, 1, 0]]), "cashflow")
+    assert nav.recompute_nav("2026-01-07") == 2
+    stored = _stored()
+    assert stored["nav"].iloc[0] == -1
+    assert stored["units"].iloc[2] == pytest.approx(1000 * 1650 / 1150)
+
+
+def test_partial_recompute_from_a_seed_without_units(history):
+    nav.recompute_nav()
+    with db.db_contextmanager() as conn:
+        conn.execute("UPDATE portfolio_snapshots SET units = NULL WHERE date = '2026-01-06'")
+    nav.recompute_nav("2026-01-07")
+    stored = _stored().iloc[2:]
+    assert np.isfinite(stored[["nav", "units"]].to_numpy(dtype=float)).all()
+    # Re-seeded at the seed's nav (1.1), so the series carries on from it
+    assert stored["nav"].tolist() == pytest.approx([1.1, 1.1 * 1700 / 1650])
+
+
+def test_reclassification_rebuilds_nav(history):
+    nav.recompute_nav()
+    # Stored as an external deposit, but the rules classify a coupon as income
+    db.insert_dataframe(_cashflow([["c1", "2026-01-07", "SGD", "Coupon", 550.0, 1, 0]]), "cashflow")
+    nav.recompute_nav()
+    assert _stored()["nav"].iloc[2] == pytest.approx(1.1)
+    db.reclassify_cashflow()
+    assert _stored()["nav"].iloc[2] == pytest.approx(1.65)
+
+
+def test_calc_nav_units_ignores_todays_own_row(history):
+    nav.recompute_nav()
+    snapshot = pd.DataFrame({"total_assets": [1870.0]})
+    first = db.calc_nav_units(datetime(2026, 1, 8), snapshot)
+    # Store today's row, then tick again: the result must not compound on itself
+    db.insert_dataframe(pd.DataFrame({"date": ["2026-01-08"], "nav": [first[0]], "units": [first[1]]}),
+                        "portfolio_snapshots")
+    assert db.calc_nav_units(datetime(2026, 1, 8), snapshot) == pytest.approx(first)
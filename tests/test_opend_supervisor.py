@@ -0,0 +1,106 @@
+"""Tests for the long-lived OpenD session supervisor, run against a fake trade context.
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+import time
+
+import moomoo
+import pandas as pd
+import pytest
+
+from source.moomoo_api import OpenDSupervisor
+
+
+class FakeContext:
+    def __init__(self):
+        self.healthy = True
+        self.closed = False
+
+    def get_acc_list(self):
+        if not self.healthy:
+            return moomoo.RET_ERROR, "disconnected"
+        return moomoo.RET_OK, pd.DataFrame({"acc_id": [1]})
+
+    def close(self):
+        self.closed = True
+
+
+class Connector:
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.made = []
+
+    def __call__(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("handshake failed")
+        self.made.append(FakeContext())
+        return self.made[-1]
+
+
+def _supervisor(connect, **kwargs):
+    kwargs.setdefault("ready", lambda: True)
+    return OpenDSupervisor(connect=connect, heartbeat_seconds=0.01, max_attempts=3,
+                           backoff=lambda attempt: 0.0, sleep=lambda s: None, **kwargs)
+
+
+def test_context_is_created_once_and_reused():
+    connect = Connector()
+    sup = _supervisor(connect)
+    assert sup.context() is sup.context()
+    with sup.session() as ctx:
+        assert ctx is connect.made[0]
+    assert sup.connects == 1
+
+
+def test_failed_heartbeat_drops_context_and_next_caller_reconnects():
+    connect = Connector()
+    sup = _supervisor(connect)
+    first = sup.context()
+    assert sup.heartbeat()
+    first.healthy = False
+    assert not sup.heartbeat()
+    assert first.closed
+    assert sup.context() is connect.made[1]
+
+
+def test_reconnect_retries_with_backoff_then_gives_up():
+    delays = []
+    sup = OpenDSupervisor(connect=Connector(failures=2), ready=lambda: True, max_attempts=3,
+                          backoff=lambda attempt: attempt + 1.0, sleep=delays.append)
+    sup.context()
+    assert delays == [1.0, 2.0]
+    with pytest.raises(ConnectionError):
+        _supervisor(Connector(failures=10)).context()
+
+
+def test_opend_not_ready_is_a_connection_failure():
+    connect = Connector()
+    with pytest.raises(ConnectionError):
+        _supervisor(connect, ready=lambda: False).context()
+    assert connect.made == []
+
+
+def test_error_in_session_keeps_a_healthy_context():
+    connect = Connector()
+    sup = _supervisor(connect)
+    with pytest.raises(ValueError):
+        with sup.session():
+            raise ValueError("bad data")
+    assert sup.context() is connect.made[0]
+
+
+def test_heartbeat_thread_replaces_a_dead_context():
+    connect = Connector()
+    sup = _supervisor(connect)
+    sup.context().healthy = False
+    sup.start()
+    try:
+        for _ in range(500):
+            if len(connect.made) == 2:
+                break
+            time.sleep(0.01)
+    finally:
+        sup.stop()
+    assert len(connect.made) == 2
+    assert connect.made[1].closed  # stop() closes the shared context
@@ -0,0 +1,47 @@
+"""Tests for the windowed, incremental historical order sync.
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+from datetime import datetime
+
+import moomoo
+import pandas as pd
+
+from config import settings
+from source import db, moomoo_api
+
+
+class FakeOrderContext:
+    def __init__(self):
+        self.queries = []
+
+    def history_order_list_query(self, start, end):
+        self.queries.append((start, end))
+        # The same order shows up in every window (e.g. one amended across a boundary)
+        return moomoo.RET_OK, pd.DataFrame({"order_id": ["A1"], "updated_time": [end]})
+
+
+def test_order_windows_cover_range_without_gaps():
+    windows = moomoo_api.order_windows(datetime(2026, 1, 1), datetime(2026, 3, 15), 30)
+    assert windows[0][0] == datetime(2026, 1, 1)
+    assert windows[-1][1] == datetime(2026, 3, 15)
+    assert all(a[1] == b[0] for a, b in zip(windows, windows[1:]))
+    assert len(windows) == 3
+
+
+def test_get_historical_orders_chunks_and_dedupes(monkeypatch):
+    monkeypatch.setattr(settings, "ORDER_SYNC_WINDOW_DAYS", 30)
+    ctx = FakeOrderContext()
+    orders = moomoo_api.get_historical_orders(ctx, datetime(2026, 1, 1), datetime(2026, 3, 15))
+    assert len(ctx.queries) == 3
+    assert len(orders) == 1
+    assert orders["updated_time"].iloc[0] == "2026-03-15 00:00:00"  # latest copy wins
+
+
+def test_order_sync_start_is_latest_minus_overlap(tmp_db, monkeypatch):
+    assert db.order_sync_start() is None  # empty table -> full sync
+    monkeypatch.setattr(settings, "ORDER_SYNC_OVERLAP_DAYS", 7)
+    db.insert_dataframe(pd.DataFrame({"Order_ID": ["1", "2"],
+                                      "date_time": ["2026-01-02 10:00:00.000", "2026-02-10 09:30:00.500"]}),
+                        "historical_orders")
+    assert db.order_sync_start() == datetime(2026, 2, 3, 9, 30, 0, 500000)
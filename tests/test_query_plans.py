@@ -0,0 +1,94 @@
+"""Query-plan regression tests: the hot queries must be served by an index, never by a full
+table scan, and versioned migrations must bring any database to the current schema.
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+import sqlite3
+
+import pytest
+
+from source import db, migrate
+
+# (query, params) for every hot read path of the dashboard and the sync
+HOT_QUERIES = [
+    ("SELECT * FROM positions WHERE date = ?", ("2026-01-09",)),
+    ("SELECT Symbol FROM positions WHERE date = (SELECT MAX(date) FROM positions)", ()),
+    ("SELECT Date, Currency, Amount FROM cashflow WHERE is_external = 1 AND Date > ?", ("2026-01-09",)),
+    ("SELECT Date, Currency, Amount FROM cashflow WHERE is_income = 1", ()),
+    ("SELECT * FROM net_p_l WHERE date = (SELECT MAX(date) FROM net_p_l)", ()),
+    ("SELECT date_time, Symbol, Name, Market, Buy_Sell, Quantity, Fill_Price, Multiplier, Gross_Amount, "
+     "Currency FROM transactions ORDER BY date_time DESC", ()),
+    ("SELECT MAX(date_time) AS latest FROM historical_orders", ()),
+    ("SELECT EXISTS (SELECT 1 FROM benchmark_history WHERE Symbol = ?)", ("^GSPC",)),
+    ("SELECT Symbol, MAX(Date) AS last_date FROM benchmark_history GROUP BY Symbol", ()),
+    ("SELECT date, nav, units FROM portfolio_snapshots WHERE date < ? ORDER BY date DESC LIMIT 1", ("2026-01-09",)),
+]
+
+
+def _plan(conn, query, params):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+
+
+@pytest.mark.parametrize("query,params", HOT_QUERIES)
+def test_hot_query_uses_an_index(tmp_db, query, params):
+    with db.db_contextmanager() as conn:
+        plan = _plan(conn, query, params)
+    for step in plan:
+        # "SCAN <table>" alone is a full table scan; "SCAN ... USING [COVERING] INDEX" walks an index
+        assert not (step.startswith("SCAN ") and "USING" not in step and step != "SCAN CONSTANT ROW"), plan
+        assert "TEMP B-TREE" not in step, plan
+
+
+def test_new_database_is_at_current_schema_version(tmp_db):
+    with db.db_contextmanager() as conn:
+        assert db.schema_version(conn) == db.SCHEMA_VERSION
+
+
+def test_migrations_upgrade_an_unversioned_database(tmp_path, monkeypatch):
+    # A database from before the migration framework: old net_p_l layout, no user_version
+    path = tmp_path / "legacy.db"
+    legacy = sqlite3.connect(path)
+    legacy.execute("CREATE TABLE portfolio_snapshots (date TEXT PRIMARY KEY, total_assets NUMERIC, "
+                   "stocks NUMERIC, options NUMERIC, cash NUMERIC, nav NUMERIC, units NUMERIC)")
+    legacy.execute("INSERT INTO portfolio_snapshots (date) VALUES ('2026-01-08')")
+    legacy.execute("CREATE TABLE net_p_l (Symbol TEXT, Market TEXT, Currency TEXT, Net_P_L NUMERIC, "
+                   "PRIMARY KEY(Symbol, Market, Currency))")
+    legacy.execute("INSERT INTO net_p_l VALUES ('SOFI', 'US', 'USD', 12.5)")
+    legacy.commit()
+    legacy.close()
+
+    monkeypatch.setattr(db.settings, "MOOMOO_PORTFOLIO_DB_PATH", path)
+    try:
+        db.init_db()
+        with db.db_contextmanager() as conn:
+            assert db.schema_version(conn) == db.SCHEMA_VERSION
+            assert conn.execute("SELECT date, Net_P_L FROM net_p_l").fetchall() == [("2026-01-08", 12.5)]
+            indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {"idx_positions_date", "idx_cashflow_external", "idx_benchmark_history_symbol_date"} <= indexes
+        # Re-running init is a no-op once the schema is current
+        db.init_db()
+    finally:
+        db.close_connections()
+
+
+def test_init_on_current_schema_is_a_single_pragma_read(tmp_db):
+    statements = []
+    with db.db_contextmanager() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            db.init_db()
+        finally:
+            conn.set_trace_callback(None)
+    assert statements == ["PRAGMA user_version"]
+
+
+def test_cli_verify_and_migrate(tmp_path, monkeypatch, capsys):
+    path = tmp_path / "cli.db"
+    monkeypatch.setattr(db.settings, "MOOMOO_PORTFOLIO_DB_PATH", path)
+    assert migrate.main(["verify"]) == 1  # no database yet
+    sqlite3.connect(path).close()
+    assert migrate.main(["verify"]) == 1
+    assert "pending: _ensure_cashflow_income_column" in capsys.readouterr().out
+    assert migrate.main(["migrate"]) == 0
+    assert migrate.main(["verify"]) == 0
+    assert "up to date" in capsys.readouterr().out
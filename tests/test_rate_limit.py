@@ -0,0 +1,196 @@
+"""Tests for the OpenD quota scheduler, run against a fake clock and a fake trade context.
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+import threading
+
+import moomoo
+import pandas as pd
+import pytest
+
+from source import moomoo_api
+from source.rate_limit import RateLimiter, TokenBucket
+
+
+class FakeClock:
+    """Virtual time: sleep() advances the clock instantly (thread-safe)."""
+
+    def __init__(self):
+        self.now = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.now += max(seconds, 0.0)
+
+
+class FakeTradeContext:
+    """Stands in for OpenSecTradeContext: records call times, fails the first `failures` calls
+    and every call for a date in `bad_dates`."""
+
+    def __init__(self, clock, failures=0, bad_dates=()):
+        self.clock = clock
+        self.failures = failures
+        self.bad_dates = set(bad_dates)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get_acc_cash_flow(self, clearing_date, trd_env):
+        with self._lock:
+            self.calls.append(self.clock())
+            if self.failures > 0:
+                self.failures -= 1
+                return moomoo.RET_ERROR, "too frequent"
+            if clearing_date in self.bad_dates:
+                return moomoo.RET_ERROR, "no data for date"
+        return moomoo.RET_OK, pd.DataFrame({"clearing_date": [clearing_date], "cashflow_amount": [1.0]})
+
+
+def _max_in_window(times, period):
+    times = sorted(times)
+    return max(sum(1 for u in times if t <= u < t + period) for t in times)
+
+
+def test_bucket_allows_burst_then_waits_for_window():
+    clock = FakeClock()
+    bucket = TokenBucket(3, 30, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.now == 0.0
+    bucket.acquire()
+    assert clock.now == 30.0  # first token handed back exactly one period later
+
+
+def test_bucket_pause_holds_callers_back():
+    clock = FakeClock()
+    bucket = TokenBucket(5, 30, clock=clock, sleep=clock.sleep)
+    bucket.pause(7)
+    bucket.acquire()
+    assert clock.now == 7.0
+
+
+def test_call_retries_with_backoff_then_succeeds():
+    clock = FakeClock()
+    limiter = RateLimiter({"get_acc_cash_flow": (20, 30)}, max_retries=3, backoff_base=2,
+                          backoff_max=60, clock=clock, sleep=clock.sleep)
+    ctx = FakeTradeContext(clock, failures=2)
+    data = limiter.call("get_acc_cash_flow", ctx.get_acc_cash_flow, clearing_date="2026-01-05", trd_env="REAL")
+    assert len(data) == 1
+    assert len(ctx.calls) == 3
+    # 50-100% of 2s, then 50-100% of 4s
+    assert 3.0 <= ctx.calls[-1] <= 6.0
+
+
+def test_call_raises_after_max_retries():
+    clock = FakeClock()
+    limiter = RateLimiter({}, max_retries=2, backoff_base=1, backoff_max=60, clock=clock, sleep=clock.sleep)
+    ctx = FakeTradeContext(clock, failures=10)
+    with pytest.raises(Exception):
+        limiter.call("get_acc_cash_flow", ctx.get_acc_cash_flow, clearing_date="2026-01-05", trd_env="REAL")
+    assert len(ctx.calls) == 3
+
+
+def test_map_fills_the_window_without_exceeding_quota():
+    clock = FakeClock()
+    limiter = RateLimiter({"get_acc_cash_flow": (20, 30)}, clock=clock, sleep=clock.sleep)
+    ctx = FakeTradeContext(clock)
+    dates = [f"2026-01-{d:02d}" for d in range(1, 31)] + [f"2026-02-{d:02d}" for d in range(1, 21)]
+    results = limiter.map("get_acc_cash_flow",
+                          lambda d: ctx.get_acc_cash_flow(clearing_date=d, trd_env="REAL"),
+                          dates, workers=4)
+    assert [r["clearing_date"][0] for r in results] == dates  # input order preserved
+    assert _max_in_window(ctx.calls, 30) <= 20
+    # 50 calls at 20 per 30s need exactly two full waits, no oversleeping
+    assert max(ctx.calls) == pytest.approx(60.0)
+
+
+def test_fetch_cashflow_against_fake_context(monkeypatch):
+    clock = FakeClock()
+    limiter = RateLimiter({"get_acc_cash_flow": (20, 30)}, clock=clock, sleep=clock.sleep)
+    monkeypatch.setattr(moomoo_api, "opend_limiter", limiter)
+    ctx = FakeTradeContext(clock, failures=1)
+    data, fetched = moomoo_api.fetch_cashflow(ctx, ["2026-01-06", "2026-01-05"])
+    assert fetched == ["2026-01-06", "2026-01-05"]
+    assert sorted(data["clearing_date"]) == ["2026-01-05", "2026-01-06"]
+
+
+def test_map_returns_exceptions_in_place_when_asked():
+    clock = FakeClock()
+    limiter = RateLimiter({}, max_retries=1, backoff_base=1, clock=clock, sleep=clock.sleep)
+    ctx = FakeTradeContext(clock, bad_dates=["2026-01-06"])
+    dates = ["2026-01-07", "2026-01-06", "2026-01-05"]
+    query = lambda d: ctx.get_acc_cash_flow(clearing_date=d, trd_env="REAL")
+    with pytest.raises(Exception):
+        limiter.map("get_acc_cash_flow", query, dates)
+    results = limiter.map("get_acc_cash_flow", query, dates, return_exceptions=True)
+    assert isinstance(results[1], Exception)
+    assert [r["clearing_date"][0] for r in (results[0], results[2])] == ["2026-01-07", "2026-01-05"]
+
+
+def test_fetch_cashflow_keeps_the_dates_that_succeeded(monkeypatch):
+    clock = FakeClock()
+    limiter = RateLimiter({}, max_retries=1, backoff_base=1, clock=clock, sleep=clock.sleep)
+    monkeypatch.setattr(moomoo_api, "opend_limiter", limiter)
+    ctx = FakeTradeContext(clock, bad_dates=["2026-01-06"])
+    data, fetched = moomoo_api.fetch_cashflow(ctx, ["2026-01-07", "2026-01-06", "2026-01-05"])
+    assert fetched == ["2026-01-07", "2026-01-05"]
+    assert sorted(data["clearing_date"]) == ["2026-01-05", "2026-01-07"]
+
+    ctx = FakeTradeContext(clock, bad_dates=["2026-01-06", "2026-01-05"])
+    with pytest.raises(Exception):
+        moomoo_api.fetch_cashflow(ctx, ["2026-01-06", "2026-01-05"])
+
+
+def test_latency_is_recorded_per_endpoint():
+    limiter = RateLimiter({})
+    limiter.call("accinfo_query", lambda: (moomoo.RET_OK, "x"))
+    limiter.call("accinfo_query", lambda: (moomoo.RET_OK, "y"))
+    limiter.call("position_list_query", lambda: (moomoo.RET_OK, "z"))
+    stats = limiter.latency()
+    assert stats["accinfo_query"]["calls"] == 2
+    assert stats["position_list_query"]["calls"] == 1
+    assert 0 <= stats["accinfo_query"]["median"] <= stats["accinfo_query"]["max"]
+
+
+def test_fetch_concurrently_hands_back_fast_results_before_slow_ones():
+    slow_started, release = threading.Event(), threading.Event()
+    seen = []
+
+    def slow():
+        slow_started.set()
+        release.wait(5)
+        return "cashflow"
+
+    def on_result(name, value):
+        seen.append(name)
+        if name == "positions":
+            # The slow query is still running while the snapshot is handled
+            assert slow_started.wait(5) and not release.is_set()
+            release.set()
+
+    results = moomoo_api.fetch_concurrently({"cashflow": slow, "positions": lambda: "pos"}, on_result)
+    assert results == {"cashflow": "cashflow", "positions": "pos"}
+    assert seen == ["positions", "cashflow"]
+
+
+def test_fetch_concurrently_failed_query_gives_none():
+    def broken():
+        raise Exception("accinfo_query error")
+
+    results = moomoo_api.fetch_concurrently({"acc_info": broken, "positions": lambda: "pos"})
+    assert results == {"acc_info": None, "positions": "pos"}
+
+
+def test_fetch_concurrently_reports_callback_failures_as_storage_errors(capsys):
+    def on_result(name, value):
+        raise Exception("database is locked")
+
+    results = moomoo_api.fetch_concurrently({"positions": lambda: "pos"}, on_result)
+    assert results == {"positions": "pos"}
+    out = capsys.readouterr().out
+    assert "Storage error (positions): database is locked" in out
+    assert "API Error" not in out
@@ -0,0 +1,125 @@
+"""Equivalence tests: the incremental net_p_l (running realised_p_l accumulator) must match
+net_p_l_full, which recomputes everything from historical_orders.
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from source import db
+
+TODAY = datetime(2026, 1, 9)
+
+
+def _orders(rows):
+    return pd.DataFrame(rows, columns=["Order_ID", "Symbol", "Name", "Market", "Buy_Sell",
+                                       "Quantity", "Current_Price", "Currency", "date_time"])
+
+
+def _positions(rows, day=TODAY):
+    df = pd.DataFrame(rows, columns=["Symbol", "Market", "Market_Value", "P_L", "Currency"])
+    df["date"] = day.strftime("%Y-%m-%d")
+    return df
+
+
+def _assert_equivalent(day=TODAY):
+    incremental = db.net_p_l(day).sort_values(["Symbol", "Market", "Currency"]).reset_index(drop=True)
+    full = db.net_p_l_full(day).sort_values(["Symbol", "Market", "Currency"]).reset_index(drop=True)
+    assert incremental[["Symbol", "Market", "Currency", "date"]].equals(full[["Symbol", "Market", "Currency", "date"]])
+    assert incremental["Net_P_L"].tolist() == pytest.approx(full["Net_P_L"].tolist())
+    return incremental
+
+
+BASE_ORDERS = [
+    ["1", "SOFI", "SoFi", "US", "BUY", 25, 20.9, "USD", "2026-01-05 10:00:00"],
+    ["2", "SOFI", "SoFi", "US", "SELL", 10, 22.0, "USD", "2026-01-06 10:00:00"],
+    ["3", "NVDA270115C230000", "NVDA C", "US", "SELL_SHORT", 1, 2.5, "USD", "2026-01-06 11:00:00"],
+    ["4", "NVDA270115C230000", "NVDA C", "US", "BUY_BACK", 1, 1.2, "USD", "2026-01-07 11:00:00"],
+    ["5", "D05", "DBS", "SG", "BUY", 100, 40.0, "SGD", "2026-01-07 12:00:00"],
+    ["6", "D05", "DBS", "SG", "UNKNOWN", 100, 41.0, "SGD", "2026-01-08 12:00:00"],
+]
+
+
+def test_vectorised_changes_match_calculate_change():
+    orders = _orders(BASE_ORDERS)
+    expected = orders.apply(db.calculate_change, axis=1).tolist()
+    assert db.order_changes(orders).tolist() == pytest.approx(expected)
+
+
+def test_matches_full_recompute_with_positions(tmp_db):
+    db.insert_dataframe(_orders(BASE_ORDERS), "historical_orders")
+    db.insert_dataframe(_positions([
+        ["SOFI", "US", 330.0, 50.0, "USD"],
+        ["AMZN260918C200000", "US", 900.0, -120.0, "USD"],
+        ["D05", "SG", 4100.0, 100.0, "SGD"],
+    ]), "positions")
+    out = _assert_equivalent().set_index("Symbol")["Net_P_L"]
+    # Stock: realised cash flow + market value; option: realised + unrealised P/L
+    assert out["SOFI"] == pytest.approx(-522.5 + 220.0 + 330.0)
+    assert out["AMZN260918C200000"] == pytest.approx(-120.0)
+    assert out["NVDA270115C230000"] == pytest.approx(250.0 - 120.0)
+
+
+def test_only_new_orders_are_folded_in(tmp_db):
+    db.insert_dataframe(_orders(BASE_ORDERS[:3]), "historical_orders")
+    assert db.sync_realised_p_l() == 3
+    assert db.sync_realised_p_l() == 0
+    db.insert_dataframe(_orders(BASE_ORDERS[3:]), "historical_orders")
+    assert db.sync_realised_p_l() == 3
+    _assert_equivalent()
+
+
+def test_changed_and_moved_orders_replace_their_old_contribution(tmp_db):
+    db.insert_dataframe(_orders(BASE_ORDERS), "historical_orders")
+    _assert_equivalent()
+    db.insert_dataframe(_orders([
+        # Partial fill completed: quantity changes
+        ["1", "SOFI", "SoFi", "US", "BUY", 30, 20.9, "USD", "2026-01-05 10:00:00"],
+        # Order re-reported under another symbol: leaves SOFI, moves to AAPL
+        ["2", "AAPL", "Apple", "US", "SELL", 10, 22.0, "USD", "2026-01-06 10:00:00"],
+    ]), "historical_orders")
+    assert db.sync_realised_p_l() == 2
+    out = _assert_equivalent().set_index("Symbol")["Net_P_L"]
+    assert out["SOFI"] == pytest.approx(-627.0)
+    assert out["AAPL"] == pytest.approx(220.0)
+
+
+def test_full_rebuild_matches(tmp_db):
+    db.insert_dataframe(_orders(BASE_ORDERS), "historical_orders")
+    db.sync_realised_p_l()
+    with db.db_contextmanager() as conn:
+        conn.execute("UPDATE realised_p_l SET Net_P_L = 0")  # corrupt the running totals
+    db.sync_realised_p_l(full=True)
+    _assert_equivalent()
+
+
+def test_empty_database(tmp_db):
+    out = db.net_p_l(TODAY)
+    assert out.empty
+    assert list(out.columns) == ["Symbol", "Market", "Currency", "Net_P_L", "date"]
+
+
+def test_instrument_left_without_orders_drops_out(tmp_db):
+    db.insert_dataframe(_orders(BASE_ORDERS), "historical_orders")
+    _assert_equivalent()
+    # D05's only two orders are re-reported under another ticker: nothing is left on D05
+    db.insert_dataframe(_orders([
+        ["5", "D05X", "DBS", "SG", "BUY", 100, 40.0, "SGD", "2026-01-07 12:00:00"],
+        ["6", "D05X", "DBS", "SG", "UNKNOWN", 100, 41.0, "SGD", "2026-01-08 12:00:00"],
+    ]), "historical_orders")
+    out = _assert_equivalent()
+    assert "D05" not in set(out["Symbol"])
+
+
+def test_deleted_orders_are_taken_off(tmp_db):
+    db.insert_dataframe(_orders(BASE_ORDERS), "historical_orders")
+    _assert_equivalent()
+    with db.db_contextmanager() as conn:
+        conn.execute("DELETE FROM historical_orders WHERE Order_ID IN ('2', '3', '4')")
+    assert db.sync_realised_p_l() == 3
+    out = _assert_equivalent().set_index("Symbol")["Net_P_L"]
+    assert out["SOFI"] == pytest.approx(-522.5)
+    assert "NVDA270115C230000" not in out.index
+    assert db.sync_realised_p_l() == 0
@@ -0,0 +1,56 @@
+"""Tests for the tiered background refresh scheduler.
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+import threading
+import time
+
+from source.scheduler import RefreshTier, TieredRefresher
+
+
+def test_tier_is_due_on_its_own_interval():
+    tier = RefreshTier('fast', 10, lambda: None)
+    assert tier.due(0.0)
+    tier.run(now=100.0)
+    assert not tier.due(105.0)
+    assert tier.due(110.0)
+
+
+def test_failed_job_is_recorded_not_raised():
+    def boom():
+        raise RuntimeError("OpenD down")
+
+    tier = RefreshTier('activity', 300, boom)
+    tier.run(now=0.0)
+    assert tier.last_error == "OpenD down"
+    assert tier.last_run is not None
+    # The next attempt still waits for the interval
+    assert not tier.due(1.0)
+
+
+def test_slow_tier_does_not_block_fast_tier():
+    release = threading.Event()
+    fast_runs = []
+    tiers = [RefreshTier('fast', 0.01, lambda: fast_runs.append(1)),
+             RefreshTier('slow', 60, lambda: release.wait(5))]
+    refresher = TieredRefresher(tiers, poll_seconds=0.01)
+    refresher.start()
+    try:
+        deadline = time.monotonic() + 2
+        while len(fast_runs) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(fast_runs) >= 3
+    finally:
+        release.set()
+        refresher.stop(timeout=5)
+
+
+def test_paused_refresher_runs_nothing():
+    runs = []
+    refresher = TieredRefresher([RefreshTier('fast', 0.01, lambda: runs.append(1))], poll_seconds=0.01)
+    refresher.pause()
+    refresher.start()
+    time.sleep(0.1)
+    refresher.stop(timeout=5)
+    assert runs == []
+    assert refresher.status()[0]['last_run'] is None
@@ -0,0 +1,91 @@
+"""Tests for OCC option-symbol parsing and the memoised symbols table (source/symbols.py).
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+import threading
+
+import pandas as pd
+import pytest
+
+from source import db, symbols
+
+
+def test_parse_option_and_stock_symbols():
+    parsed = symbols.parse_symbols(["NVDA270115C230000", "GRAB270115P7500", "SOFI"]).set_index("Symbol")
+    nvda = parsed.loc["NVDA270115C230000"]
+    assert nvda["Is_Option"] and nvda["Ticker"] == "NVDA" and nvda["Underlying"] == "NVDA"
+    assert nvda["Expiry"] == "2027-01-15" and nvda["Put_Call"] == "C"
+    assert nvda["Strike"] == 230.0 and nvda["Multiplier"] == 100
+    assert parsed.loc["GRAB270115P7500", "Strike"] == 7.5
+    sofi = parsed.loc["SOFI"]
+    assert not sofi["Is_Option"] and sofi["Ticker"] == "SOFI" and sofi["Multiplier"] == 1
+    assert pd.isna(sofi["Expiry"]) and pd.isna(sofi["Strike"])
+
+
+def test_masks_align_with_input_rows():
+    col = pd.Series(["AAPL", "AAPL260918C200000", "AAPL", "D05"], index=[10, 11, 12, 13])
+    assert symbols.is_option(col).tolist() == [False, True, False, False]
+    assert symbols.multipliers(col).tolist() == [1, 100, 1, 1]
+    assert list(symbols.multipliers(col).index) == [10, 11, 12, 13]
+
+
+def test_code_shaped_symbols_with_bad_dates_are_not_options():
+    col = pd.Series(["AAPL", "ABC999999C100", "XNVDA270115C230000X", "NVDA270115C230000"])
+    assert symbols.is_option(col).tolist() == [False, False, False, True]
+    assert symbols.multipliers(col).tolist() == [1, 1, 1, 100]
+    parsed = symbols.parse_symbols(["ABC999999C100"]).iloc[0]
+    assert parsed["Ticker"] == "ABC999999C100" and pd.isna(parsed["Expiry"]) and pd.isna(parsed["Strike"])
+    assert db.option_multiplier("ABC999999C100") == 1
+
+
+def test_symbol_info_parses_each_symbol_once(tmp_db, monkeypatch):
+    parsed_batches = []
+    real_parse = symbols.parse_symbols
+
+    def spy(values):
+        parsed_batches.append(sorted(values))
+        return real_parse(values)
+
+    monkeypatch.setattr(symbols, "parse_symbols", spy)
+    symbols._symbol_cache.clear()
+    symbols.symbol_info(["SOFI", "NVDA270115C230000", "SOFI"])
+    symbols.symbol_info(["SOFI", "AMZN"])
+    assert parsed_batches == [["NVDA270115C230000", "SOFI"], ["AMZN"]]
+
+    # A new process reads the stored rows instead of parsing again
+    symbols._symbol_cache.clear()
+    info = symbols.symbol_info(["NVDA270115C230000", "AMZN"])
+    assert parsed_batches == [["NVDA270115C230000", "SOFI"], ["AMZN"]]
+    assert info["Ticker"].tolist() == ["NVDA", "AMZN"]
+    assert info["Is_Option"].tolist() == [True, False]
+    assert db.read_db("SELECT COUNT(*) AS n FROM symbols").iloc[0]["n"] == 3
+
+
+def test_with_symbol_info_joins_parsed_columns(tmp_db):
+    df = pd.DataFrame({"Symbol": ["TSLA", "TSLA260116P300000"], "Net_P_L": [1.0, 2.0]})
+    out = symbols.with_symbol_info(df)
+    assert out[["Is_Option", "Ticker"]].values.tolist() == [[False, "TSLA"], [True, "TSLA"]]
+    assert out["Net_P_L"].tolist() == pytest.approx([1.0, 2.0])
+
+
+def test_concurrent_lookups_keep_every_symbol(tmp_db, monkeypatch):
+    symbols._symbol_cache.clear()
+    barrier = threading.Barrier(8)
+    real_parse = symbols.parse_symbols
+
+    def slow_parse(values):
+        barrier.wait(timeout=5)  # every thread has read the cache before anyone writes back
+        return real_parse(values)
+
+    monkeypatch.setattr(symbols, "parse_symbols", slow_parse)
+    tickers = [f"T{i}" for i in range(8)]
+    threads = [threading.Thread(target=symbols.symbol_info, args=([t],)) for t in tickers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    monkeypatch.setattr(symbols, "parse_symbols", real_parse)
+    cached = symbols._symbol_cache[str(symbols.settings.MOOMOO_PORTFOLIO_DB_PATH)]
+    assert sorted(cached.index) == tickers
+    assert cached.index.is_unique
@@ -0,0 +1,98 @@
+"""Tests for the Parquet read cache of portfolio_snapshots (source/table_cache.py).
+
+Run from the project root:  python -m pytest tests/ -q
+"""
+import threading
+
+import pandas as pd
+import pytest
+
+from source import db, table_cache
+
+pytestmark = pytest.mark.skipif(not table_cache.enabled(), reason="pyarrow not installed")
+
+
+def _snapshots(rows):
+    return pd.DataFrame(rows, columns=["date", "total_assets", "stocks", "options", "cash", "nav", "units"])
+
+
+def test_writes_are_mirrored_per_year_with_typed_dates(tmp_db):
+    db.insert_dataframe(_snapshots([["2025-12-31", 100.0, 60.0, 10.0, 30.0, 1.0, 100.0],
+                                    ["2026-01-02", 110.0, 70.0, 10.0, 30.0, 1.1, 100.0]]), "portfolio_snapshots")
+    files = sorted(p.name for p in table_cache.table_dir("portfolio_snapshots").glob("*.parquet"))
+    assert files == ["2025.parquet", "2026.parquet"]
+
+    df = table_cache.read_table("portfolio_snapshots")
+    assert pd.api.types.is_datetime64_any_dtype(df["date"])
+    assert df["date"].tolist() == [pd.Timestamp("2025-12-31"), pd.Timestamp("2026-01-02")]
+    assert df["total_assets"].tolist() == [100.0, 110.0]
+
+
+def test_only_touched_year_is_rewritten(tmp_db):
+    db.insert_dataframe(_snapshots([["2025-12-31", 100.0, 60.0, 10.0, 30.0, 1.0, 100.0],
+                                    ["2026-01-02", 110.0, 70.0, 10.0, 30.0, 1.1, 100.0]]), "portfolio_snapshots")
+    old_year = table_cache.table_dir("portfolio_snapshots") / "2025.parquet"
+    before = old_year.stat().st_mtime_ns
+    db.insert_dataframe(_snapshots([["2026-01-02", 120.0, 80.0, 10.0, 30.0, 1.2, 100.0]]), "portfolio_snapshots")
+    assert old_year.stat().st_mtime_ns == before
+    assert table_cache.read_table("portfolio_snapshots")["total_assets"].tolist() == [100.0, 120.0]
+
+
+def test_cache_waits_for_commit_and_ignores_rollback(tmp_db):
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.insert_dataframe(_snapshots([["2026-01-02", 110.0, 70.0, 10.0, 30.0, 1.1, 100.0]]),
+                                "portfolio_snapshots")
+            raise RuntimeError("abort")
+    assert not table_cache.table_dir("portfolio_snapshots").exists()
+    assert table_cache.read_table("portfolio_snapshots").empty
+
+
+def test_rebuilds_when_sqlite_was_written_directly(tmp_db):
+    db.insert_dataframe(_snapshots([["2026-01-02", 110.0, 70.0, 10.0, 30.0, 1.1, 100.0]]), "portfolio_snapshots")
+    table_cache.read_table("portfolio_snapshots")
+    with db.db_contextmanager() as conn:
+        conn.execute("INSERT INTO portfolio_snapshots (date, total_assets) VALUES ('2026-01-05', 130.0)")
+    df = table_cache.read_table("portfolio_snapshots")
+    assert df["date"].max() == pd.Timestamp("2026-01-05")
+    assert len(df) == 2
+
+
+def test_callers_get_their_own_copy(tmp_db):
+    db.insert_dataframe(_snapshots([["2026-01-02", 110.0, 70.0, 10.0, 30.0, 1.1, 100.0]]), "portfolio_snapshots")
+    df = table_cache.read_table("portfolio_snapshots")
+    df["date"] = df["date"].dt.date  # as plot_asset_trend does
+    assert pd.api.types.is_datetime64_any_dtype(table_cache.read_table("portfolio_snapshots")["date"])
+
+
+def test_cache_in_step_is_not_rebuilt(tmp_db, monkeypatch):
+    db.insert_dataframe(_snapshots([["2026-01-02", 110.0, 70.0, 10.0, 30.0, 1.1, 100.0]]), "portfolio_snapshots")
+    db.insert_dataframe(_snapshots([["2026-01-05", 120.0, 80.0, 10.0, 30.0, 1.2, 100.0]]), "portfolio_snapshots")
+    monkeypatch.setattr(table_cache, "rebuild", lambda table_name: pytest.fail("cache was in step"))
+    assert len(table_cache.read_table("portfolio_snapshots")) == 2
+
+
+def test_sync_waits_for_a_rebuild_in_progress(tmp_db):
+    db.insert_dataframe(_snapshots([["2026-01-02", 110.0, 70.0, 10.0, 30.0, 1.1, 100.0]]), "portfolio_snapshots")
+    done = threading.Event()
+    with table_cache._lock:
+        worker = threading.Thread(target=lambda: (table_cache.sync("portfolio_snapshots", [2026]), done.set()))
+        worker.start()
+        assert not done.wait(0.2)
+    worker.join()
+    assert done.is_set()
+
+
+def test_benchmark_history_is_not_cached_and_old_cache_is_removed(tmp_db):
+    db.insert_dataframe(pd.DataFrame({"Date": ["2026-01-02"], "Symbol": ["^GSPC"], "Close": [1.0]}),
+                        "benchmark_history")
+    assert not table_cache.table_dir("benchmark_history").exists()
+
+    # A database migrated before version 8 still has the orphaned directory
+    orphan = table_cache.table_dir("benchmark_history")
+    orphan.mkdir(parents=True)
+    (orphan / "2025.parquet").write_bytes(b"")
+    with db.db_contextmanager() as conn:
+        conn.execute("PRAGMA user_version = 7")
+    db.init_db()
+    assert not orphan.exists()
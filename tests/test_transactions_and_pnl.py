@@ -10,7 +10,9 @@ ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
 
-from source.db import option_multiplier, transaction_gross_amount
+import pandas as pd
+
+from source.db import option_multiplier, transaction_amounts, transaction_gross_amount
 
 
 def test_option_multiplier_options():
@@ -52,3 +54,18 @@ def test_short_orders_are_treated_as_sells():
 def test_side_is_case_insensitive():
     assert transaction_gross_amount("AAPL", "buy", 1, 100) == -100.0
     assert transaction_gross_amount("AAPL", "SELL", 1, 110) == 110.0
+
+
+def test_vectorised_amounts_match_row_wise_rules():
+    orders = pd.DataFrame({
+        "Symbol": ["SOFI", "NVDA270115C230000", "TSLA", "TSLA", "AAPL", None],
+        "Buy_Sell": ["BUY", "BUY", "SELL_SHORT", "BUY_BACK", "sell", "BUY"],
+        "Quantity": [25, 1, 3, 3, 1, 2],
+        "Current_Price": [20.9, 2.5, 200, 205, 110, 1.005],
+    })
+    multiplier, gross = transaction_amounts(orders)
+    assert multiplier.tolist() == [option_multiplier(s) for s in orders["Symbol"]]
+    assert gross.tolist() == [
+        transaction_gross_amount(s, b, q, p)
+        for s, b, q, p in zip(orders["Symbol"], orders["Buy_Sell"], orders["Quantity"], orders["Current_Price"])
+    ]
@@ -14,7 +14,7 @@ ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
 
-from source.cleanup import classify_cashflow, cleanup_cashflow
+from source.cleanup import classify_cashflow, classify_cashflows, cleanup_cashflow
 from source.dashboard import get_twr
 
 
@@ -76,6 +76,27 @@ def test_none_values_do_not_crash():
     assert inc is False
 
 
+# --------------------------------------------------------------------------- #
+# classify_cashflows (vectorised) must agree with classify_cashflow row for row
+# --------------------------------------------------------------------------- #
+TYPES = [None, float("nan"), "", "  Others ", "Others", "Cash Dividend", "Coupon", "GST",
+         "Bank Transfer Deposits", "Money Transfers ", "Currency Exchange", "others", 7]
+REMARKS = [None, float("nan"), "", "Coupon Deposit", "PAYNOW123", "Fund Subscription#CSOP",
+           "FUND REDEMPTION", "ADR FEE", "Dividend fund", "withholding TAX", "a.b*c", 42]
+
+
+def test_vectorised_classification_matches_scalar():
+    grid = pd.DataFrame([(t, r) for t in TYPES for r in REMARKS], columns=["Type", "Remark"], dtype=object)
+    ext, inc = classify_cashflows(grid["Type"], grid["Remark"])
+    expected = [classify_cashflow(t, r) for t, r in zip(grid["Type"], grid["Remark"])]
+    assert list(zip(ext.astype(bool).tolist(), inc.astype(bool).tolist())) == expected
+
+
+def test_vectorised_classification_empty():
+    ext, inc = classify_cashflows([], [])
+    assert len(ext) == 0 and len(inc) == 0
+
+
 # --------------------------------------------------------------------------- #
 # cleanup_cashflow end-to-end flagging
 # --------------------------------------------------------------------------- #